@@ -2,13 +2,20 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
-from api.analysis import router as analysis_router
+from api.analysis import router as analysis_router, drain_analyses
+from api.comparisons import router as comparisons_router
+from api.profiles import router as profiles_router
 from api.utils import router as utils_router
 from db.mongo import mongo_client
+from services.metrics import MetricsMiddleware
+from services.compression import CompressionMiddleware
+from services.profiling import ProfilingMiddleware
+from services.responses import ORJSONResponse
+from llm.resources import start_janitor
 
 load_dotenv()
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Add CORS BEFORE defining endpoints
 app.add_middleware(
@@ -18,6 +25,10 @@ app.add_middleware(
     allow_headers=["*"],
     allow_origins=["*"]
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware, service="analysis")
+# Outermost, so a profile covers the whole request
+app.add_middleware(ProfilingMiddleware, service="analysis")
 
 @app.on_event("startup")
 def startup_db_client():
@@ -27,5 +38,21 @@ def startup_db_client():
     except Exception as e:
         print("MongoDB connection failed from analysis service:", e)
 
+# Periodically delete OpenAI files and vector stores leaked by failed or killed analyses
+@app.on_event("startup")
+def startup_janitor():
+    app.state.stop_janitor = start_janitor()
+
+@app.on_event("shutdown")
+def shutdown_janitor():
+    app.state.stop_janitor.set()
+
+# Requests still in flight are waited for by the server; streaming analyses outlive theirs
+@app.on_event("shutdown")
+async def shutdown_analyses():
+    await drain_analyses()
+
 app.include_router(analysis_router)
+app.include_router(comparisons_router)
+app.include_router(profiles_router)
 app.include_router(utils_router)
@@ -1,15 +1,27 @@
-from fastapi import UploadFile, File, HTTPException, Body
+from fastapi import UploadFile, File, HTTPException, Body, Request
 from fastapi import APIRouter
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from datetime import datetime
 from pathlib import Path
 from bson import ObjectId
 from dotenv import load_dotenv
+import asyncio
+import json
 import shutil
+import time
 import os
 
 from db.mongo import regulation_collection, notification_collection, user_collection
-from llm.chains import analyze_pdfs
+from llm.chains import analyze_pdfs, analyze_pdfs_streaming
+from llm import normalize
+from llm.ledger import AnalysisLedger
+from llm.governor import LLMUnavailable, DeadlineExceeded
 from services.s3 import s3_client, s3_bucket
+from services.metrics import ANALYSIS_QUEUE
+from services import stats
+from services.cache import read_cache
+from services.revisions import new_revision, stamp
 
 from mail.builder import EmailBuilder
 from mail.sender import EmailSender
@@ -17,11 +29,19 @@ from mail.sender import EmailSender
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+# Comment lines sent while nothing else happens, so proxies do not drop an idle stream
+SSE_KEEPALIVE_SECONDS = 15
+# How long a stopping worker waits for analyses that outlived their request
+ANALYSIS_DRAIN_SECONDS = float(os.getenv("ANALYSIS_DRAIN_SECONDS", 600))
+
+# Streaming analyses still running in this process
+_detached = set()
+
 router = APIRouter()
 
 # Upload another PDF to update the regulation
 @router.post("/regulations/{reg_id}/versions")
-async def add_regulation_version(reg_id: str, version: str = Body(...), file: UploadFile = File(...)):
+async def add_regulation_version(request: Request, reg_id: str, version: str = Body(...), file: UploadFile = File(...)):
 
     if file.content_type != "application/pdf":
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
@@ -35,68 +55,232 @@ async def add_regulation_version(reg_id: str, version: str = Body(...), file: Up
         raise HTTPException(status_code=404, detail="Regulation not found")
 
     before_key = reg_doc["versions"][-1]["s3Key"]
+    before_hash = reg_doc["versions"][-1].get("contentHash")
 
+    request_start = getattr(request.state, "request_start", None)
+    if request_start is not None:
+        ANALYSIS_QUEUE.observe(time.perf_counter() - request_start)
+
+    ledger = AnalysisLedger()
     try:
-        detailed_changes = analyze_pdfs(before_key, temp_path)
+        # Run off the event loop so concurrent uploads queue on the LLM governor instead of blocking each other
+        detailed_changes = await run_in_threadpool(analyze_pdfs, before_key, temp_path, ledger=ledger, before_hash=before_hash)
+    except (LLMUnavailable, DeadlineExceeded) as e:
+        retry_after = getattr(e, "retry_after", None) or 60
+        raise HTTPException(
+            status_code=503,
+            detail=f"Analysis service is busy, please retry later: {e}",
+            headers={"Retry-After": str(int(retry_after))},
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis failed: {e}")
 
     # upload to s3 & mongo only if the analysis is successful
     try:
-        s3_key = f"{datetime.now().strftime('%Y-%m-%d_%H:%M:%S')}_{file.filename}"
-        s3_client.upload_file(str(temp_path), s3_bucket, s3_key)
-        upload_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        new_version = await run_in_threadpool(
+            save_version, reg_doc, version, temp_path, file.filename, detailed_changes, ledger.to_dict()
+        )
+        await run_in_threadpool(
+            notify_users,
+            f"New Version Added: {reg_doc['title']}",
+            f"A new version ({version}) has been added to the regulation '{reg_doc['title']}'.",
+        )
+        return {"message": "Version added successfully", "version": new_version}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"S3 upload or DB update failed: {e}")
+
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+
+# Same as above, but reports progress and every change as Server-Sent Events while the analysis runs.
+# The version is created up front and each change is saved as it arrives, so nothing is lost if the
+# client disconnects; the analysis carries on and the version's analysisStatus says when it is done.
+@router.post("/regulations/{reg_id}/versions/stream")
+async def stream_regulation_version(request: Request, reg_id: str, version: str = Body(...), file: UploadFile = File(...)):
+
+    if file.content_type != "application/pdf":
+        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+
+    temp_path = UPLOAD_DIR / file.filename
+    with open(temp_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+
+    reg_doc = regulation_collection.find_one({"_id": ObjectId(reg_id)})
+    if not reg_doc:
+        raise HTTPException(status_code=404, detail="Regulation not found")
+
+    before_key = reg_doc["versions"][-1]["s3Key"]
+    before_hash = reg_doc["versions"][-1].get("contentHash")
+
+    request_start = getattr(request.state, "request_start", None)
+    if request_start is not None:
+        ANALYSIS_QUEUE.observe(time.perf_counter() - request_start)
+
+    try:
+        new_version = await run_in_threadpool(
+            save_version, reg_doc, version, temp_path, file.filename, [], None, {"analysisStatus": "running"}
+        )
+    except Exception as e:
+        temp_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=500, detail=f"S3 upload or DB update failed: {e}")
+
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+
+    def emit(event: str, data: dict):
+        try:
+            loop.call_soon_threadsafe(events.put_nowait, (event, data))
+        except RuntimeError:
+            pass  # event loop already closed, the analysis still finishes and saves
+
+    def run():
+        ledger = AnalysisLedger()
+
+        def update_version(update: dict):
+            with new_revision() as revision:
+                regulation_collection.update_one(
+                    {"_id": reg_doc["_id"]}, stamp(update, revision, "versions.$[v]"),
+                    array_filters=[{"v.id": new_version["id"]}],
+                )
+            read_cache.invalidate("regulations")
+
+        def on_change(change: dict):
+            update_version({"$push": {"versions.$[v].detailedChanges": change}})
+            stats.record_changes_added([change])
+            emit("change", change)
+
+        try:
+            count = analyze_pdfs_streaming(
+                before_key, temp_path, lambda stage: emit("stage", {"stage": stage}), on_change, ledger, before_hash,
+            )
+            status, event = "complete", ("done", {"versionId": new_version["id"], "changes": count})
+        except Exception as e:
+            detail = {"detail": f"Analysis failed: {e}", "versionId": new_version["id"]}
+            if isinstance(e, (LLMUnavailable, DeadlineExceeded)):
+                detail["retryAfter"] = int(getattr(e, "retry_after", None) or 60)
+            status, event = "failed", ("error", detail)
+        finally:
+            temp_path.unlink(missing_ok=True)
+
+        analysis = ledger.to_dict()
+        try:
+            update_version({"$set": {"versions.$[v].analysisStatus": status, "versions.$[v].analysis": analysis}})
+        except Exception as e:
+            print(f"Failed to record the analysis of version {new_version['id']}: {e}")
+        # Always end the stream, even if the final update failed
+        event[1]["analysis"] = analysis
+        emit(*event)
+        if status == "failed":
+            return
+
+        try:
+            notify_users(
+                f"New Version Added: {reg_doc['title']}",
+                f"A new version ({version}) has been added to the regulation '{reg_doc['title']}'.",
+            )
+        except Exception as e:
+            print(f"Failed to notify users of version {new_version['id']}: {e}")
+
+    # Not tied to the request, so a disconnecting client does not stop the analysis
+    future = loop.run_in_executor(None, run)
+    _detached.add(future)
+    future.add_done_callback(_detached.discard)
+
+    async def event_stream():
+        yield _sse("version", {"version": new_version})
+        while True:
+            try:
+                event, data = await asyncio.wait_for(events.get(), SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield _sse(event, data)
+            if event in ("done", "error"):
+                return
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
+async def drain_analyses(timeout: float = ANALYSIS_DRAIN_SECONDS) -> int:
+    """Wait up to `timeout` seconds for streaming analyses to finish. Returns how many are still running."""
+    if not _detached:
+        return 0
+    print(f"Waiting up to {timeout:.0f}s for {len(_detached)} running analyses")
+    _, pending = await asyncio.wait(set(_detached), timeout=timeout)
+    if pending:
+        print(f"Stopping with {len(pending)} analyses still running")
+    return len(pending)
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def save_version(reg_doc: dict, version: str, file_path: Path, file_name: str, detailed_changes: list, analysis: dict = None, extra: dict = None) -> dict:
+    """Upload the analysed PDF to S3 and append it as the newest version of the regulation."""
+    s3_key = f"{datetime.now().strftime('%Y-%m-%d_%H:%M:%S')}_{file_name}"
+    s3_client.upload_file(str(file_path), s3_bucket, s3_key)
+    # Usually already cached by the analysis; compared later from this instead of the PDF
+    content_hash = normalize.store_text(Path(file_path).read_bytes())
+    upload_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    with new_revision() as revision:
         new_version = {
             "id": f"v{len(reg_doc['versions']) + 1}",
             "version": version,
             "uploadDate": upload_date,
-            "fileName": file.filename,
+            "fileName": file_name,
             "s3Key": s3_key,
+            "contentHash": content_hash,
             "detailedChanges": detailed_changes,
+            "analysis": analysis,
+            **(extra or {}),
+            "revision": revision,
         }
 
         regulation_collection.update_one(
-            {"_id": ObjectId(reg_id)},
+            {"_id": reg_doc["_id"]},
             {
                 "$push": { "versions": new_version}, 
-                "$set": {"lastUpdated": upload_date, "status": "pending"}
+                "$set": {"lastUpdated": upload_date, "status": "pending", "revision": revision}
             },
         )
-        
+    stats.record_version_added(detailed_changes)
+    read_cache.invalidate("regulations")
+    return new_version
+
+def notify_users(title: str, message: str):
+    """Create an in-app notification and email it to every user."""
+    with new_revision() as revision:
         notif = {
-            "title": f"New Version Added: {reg_doc['title']}",
-            "message": f"A new version ({version}) has been added to the regulation '{reg_doc['title']}'.",
+            "title": title,
+            "message": message,
             "created_at": datetime.now(),
-            "seen_by": []
+            "seen_by": [],
+            "revision": revision,
         }
         notification_collection.insert_one(notif)
+    read_cache.invalidate("notifications")
 
-        # Send email notifications as well
-        sender_address = os.getenv("SMTP_USER") # For gmail smtp, sender address is the same as smtp user
-        recipient_addresses = user_collection.distinct('email') # Use distinct in case multiple accounts same email
-        emails_to_send = []
-        
-        for i in range(len(recipient_addresses)):
-            builder = (
-                EmailBuilder()
-                .sender(sender_address)
-                .to(recipient_addresses[i])
-                .subject(f"Fineprint Finder - {notif['title']}")
-                .text(notif['message'])
-            )
-            emails_to_send.append((builder.build(), builder.get_sender(), builder.get_recipients()))
-        
-        # Send all at once
-        sender = EmailSender()
-        results = sender.send_multiple(emails_to_send)
-        print(f"Success: {len(results['success'])}, Failed: {len(results['failed'])}")
-
-        return {"message": "Version added successfully", "version": new_version}
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"S3 upload or DB update failed: {e}")
-
-    finally:
-        if temp_path.exists():
-            temp_path.unlink()
+    # Send email notifications as well
+    sender_address = os.getenv("SMTP_USER") # For gmail smtp, sender address is the same as smtp user
+    recipient_addresses = user_collection.distinct('email') # Use distinct in case multiple accounts same email
+    emails_to_send = []
+    
+    for i in range(len(recipient_addresses)):
+        builder = (
+            EmailBuilder()
+            .sender(sender_address)
+            .to(recipient_addresses[i])
+            .subject(f"Fineprint Finder - {notif['title']}")
+            .text(notif['message'])
+        )
+        emails_to_send.append((builder.build(), builder.get_sender(), builder.get_recipients()))
+    
+    # Send all at once
+    sender = EmailSender()
+    results = sender.send_multiple(emails_to_send)
+    print(f"Success: {len(results['success'])}, Failed: {len(results['failed'])}")
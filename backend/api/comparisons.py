@@ -0,0 +1,105 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from datetime import datetime
+from bson import ObjectId
+from bson.errors import InvalidId
+import logging
+
+from db.mongo import regulation_collection, comparison_collection
+from llm import normalize
+from llm.chains import compare_versions
+from llm.ledger import AnalysisLedger
+from llm.governor import LLMUnavailable, DeadlineExceeded
+from services.s3 import s3_client, s3_bucket
+from services.cache import read_cache
+from services.revisions import new_revision, stamp
+
+router = APIRouter()
+
+def _with_content_hash(reg_id: ObjectId, version: dict) -> dict:
+    """Versions uploaded before texts were stored get theirs now, once."""
+    if version.get("contentHash"):
+        return version
+    pdf_bytes = s3_client.get_object(Bucket=s3_bucket, Key=version["s3Key"])["Body"].read()
+    content_hash = normalize.store_text(pdf_bytes)
+    with new_revision() as revision:
+        regulation_collection.update_one(
+            {"_id": reg_id}, stamp({"$set": {"versions.$[v].contentHash": content_hash}}, revision, "versions.$[v]"),
+            array_filters=[{"v.id": version["id"]}],
+        )
+    read_cache.invalidate("regulations")
+    return {**version, "contentHash": content_hash}
+
+def _result(doc: dict, reg_id: str, before: dict, after: dict, cached: bool) -> dict:
+    return {
+        "regulationId": reg_id,
+        "from": {"id": before["id"], "version": before["version"]},
+        "to": {"id": after["id"], "version": after["version"]},
+        "changes": doc["changes"],
+        "analysis": doc.get("analysis"),
+        "comparedAt": doc["createdAt"].strftime("%Y-%m-%d %H:%M:%S"),
+        "cached": cached,
+    }
+
+# Changes between any two versions of a regulation, e.g. ?from=v1&to=v5
+# Each pair of documents is analysed once; pass refresh=true to analyse it again.
+@router.post("/regulations/{reg_id}/compare")
+async def compare_regulation_versions(
+    reg_id: str, from_id: str = Query(..., alias="from"), to_id: str = Query(..., alias="to"), refresh: bool = False,
+):
+    if from_id == to_id:
+        raise HTTPException(status_code=400, detail="Choose two different versions")
+    try:
+        reg_doc = regulation_collection.find_one(
+            {"_id": ObjectId(reg_id)},
+            {"versions.id": 1, "versions.version": 1, "versions.s3Key": 1, "versions.contentHash": 1},
+        )
+    except InvalidId:
+        raise HTTPException(status_code=404, detail="Regulation not found")
+    if not reg_doc:
+        raise HTTPException(status_code=404, detail="Regulation not found")
+    versions = {v["id"]: v for v in reg_doc.get("versions", [])}
+    for version_id in (from_id, to_id):
+        if version_id not in versions:
+            raise HTTPException(status_code=404, detail=f"Version {version_id} not found")
+
+    try:
+        before = await run_in_threadpool(_with_content_hash, reg_doc["_id"], versions[from_id])
+        after = await run_in_threadpool(_with_content_hash, reg_doc["_id"], versions[to_id])
+    except Exception as e:
+        logging.exception("Failed to load the versions to compare")
+        raise HTTPException(status_code=500, detail=f"Could not read the versions: {e}")
+
+    # Keyed by content, so the same two documents are never analysed twice
+    pair_id = f"{before['contentHash']}:{after['contentHash']}"
+    cached = None if refresh else comparison_collection.find_one({"_id": pair_id})
+    if cached:
+        return _result(cached, reg_id, before, after, cached=True)
+
+    ledger = AnalysisLedger()
+    try:
+        changes = await run_in_threadpool(compare_versions, before, after, ledger)
+    except (LLMUnavailable, DeadlineExceeded) as e:
+        retry_after = getattr(e, "retry_after", None) or 60
+        raise HTTPException(
+            status_code=503,
+            detail=f"Analysis service is busy, please retry later: {e}",
+            headers={"Retry-After": str(int(retry_after))},
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Comparison failed: {e}")
+
+    doc = {
+        "_id": pair_id,
+        "regulationId": reg_doc["_id"],
+        "fromVersionId": from_id,
+        "toVersionId": to_id,
+        "changes": changes,
+        "analysis": ledger.to_dict(),
+        "createdAt": datetime.now(),
+    }
+    try:
+        comparison_collection.replace_one({"_id": pair_id}, doc, upsert=True)
+    except Exception as e:
+        print(f"Failed to cache the comparison of {from_id} and {to_id}: {e}")
+    return _result(doc, reg_id, before, after, cached=False)
@@ -1,18 +1,28 @@
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Header, Response
 from bson import ObjectId
+from typing import Optional
 import logging
 
 from db.mongo import notification_collection
+from services.cache import read_cache
+from services.revisions import new_revision, latest_revision, etag, not_modified
 
 router = APIRouter(prefix="/notifications", tags=["notifications"])
 
 # get all notifications for specific user 
 @router.get("/")
-async def get_notifications(username: str):
+async def get_notifications(username: str, response: Response, if_none_match: Optional[str] = Header(None)):
     try:
-        cursor = notification_collection.find().sort("created_at", -1)
+        # Polled often; answer 304 until a notification is added or marked as seen
+        tag = etag(read_cache.get("notifications", "revision", lambda: latest_revision(notification_collection)))
+        if not_modified(if_none_match, tag):
+            return Response(status_code=304, headers={"ETag": tag})
+        response.headers["ETag"] = tag
+
+        # Shared by all users, only "seen" differs
+        docs = read_cache.get("notifications", "all", lambda: list(notification_collection.find().sort("created_at", -1)))
         notifications = []
-        for doc in cursor:
+        for doc in docs:
             notifications.append({
                 "id": str(doc["_id"]),
                 "title": doc["title"],
@@ -37,10 +47,12 @@ async def mark_as_seen(notif_id: str, body: dict = Body(...)):
         if not notif:
             raise HTTPException(status_code=404, detail="Notification not found")
 
-        notification_collection.update_one(
-            {"_id": ObjectId(notif_id)},
-            {"$addToSet": {"seen_by": username}}
-        )
+        with new_revision() as revision:
+            notification_collection.update_one(
+                {"_id": ObjectId(notif_id)},
+                {"$addToSet": {"seen_by": username}, "$set": {"revision": revision}}
+            )
+        read_cache.invalidate("notifications")
 
         return {"message": f"{username} marked notification as seen"}
     except Exception as e:
@@ -0,0 +1,35 @@
+from fastapi import APIRouter, HTTPException, Header
+from fastapi.responses import FileResponse
+from typing import Optional
+
+from services import profiling
+
+router = APIRouter(prefix="/profiles", tags=["profiles"])
+
+def _check_token(x_profile: Optional[str]):
+    # Profiles show queries, paths and code locations, so they need the same token that triggers them
+    if not profiling.authorized(x_profile):
+        raise HTTPException(status_code=403, detail="A valid X-Profile token is required")
+
+# Newest first, without spans or functions
+@router.get("")
+async def list_profiles(limit: int = 50, x_profile: Optional[str] = Header(None)):
+    _check_token(x_profile)
+    return profiling.store.list(limit)
+
+@router.get("/{profile_id}")
+async def get_profile(profile_id: str, x_profile: Optional[str] = Header(None)):
+    _check_token(x_profile)
+    profile = profiling.store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+# cProfile dump, for `python -m pstats` or snakeviz
+@router.get("/{profile_id}/pstats")
+async def download_pstats(profile_id: str, x_profile: Optional[str] = Header(None)):
+    _check_token(x_profile)
+    path = profiling.store.pstats_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="No CPU profile for this request")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
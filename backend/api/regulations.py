@@ -1,8 +1,10 @@
-from fastapi import UploadFile, File, HTTPException, Body
+from fastapi import UploadFile, File, HTTPException, Body, Header, Response
 from fastapi import APIRouter
 from datetime import datetime
 from pathlib import Path
 from bson import ObjectId
+from bson.errors import InvalidId
+from typing import List, Optional
 import logging
 import shutil
 
@@ -10,25 +12,109 @@ from db.mongo import regulation_collection
 from schemas.regulations import ChangeStatusUpdate
 from schemas.regulations import ChangeCommentCreate
 from schemas.regulations import ChangeDetailsUpdate
+from schemas.regulations import RegulationResponse
 from services.s3 import s3_client, s3_bucket
+from services import stats
+from services.cache import read_cache
+from services.responses import dumps
+from services.metrics import percentile
+from services.compression import COMPRESSION_MIN_BYTES, compress, negotiate
+from services.revisions import new_revision, stamp, record_deletion, latest_revision, etag, not_modified
 
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
 router = APIRouter()
 
-@router.get("/regulations")
-async def get_all_regulations():
+# Answers 304 when nothing changed since the ETag the client already has.
+# The body is sent pre-encoded, so RegulationResponse only documents it and is not enforced.
+@router.get(
+    "/regulations",
+    responses={200: {"model": List[RegulationResponse], "description": "Every regulation with its versions"}},
+)
+async def get_all_regulations(if_none_match: Optional[str] = Header(None), accept_encoding: Optional[str] = Header(None)):
     try:
-        docs = []
-        for doc in regulation_collection.find({}):
-            doc["_id"] = str(doc["_id"])
-            docs.append(doc)
-        return docs
+        tag = etag(read_cache.get("regulations", "revision", lambda: latest_revision(regulation_collection, "regulation")))
+        if not_modified(if_none_match, tag):
+            return Response(status_code=304, headers={"ETag": tag})
+
+        # Encoded and compressed once per write to the regulations and sent as is: the documents
+        # are large, so neither response model validation nor jsonable_encoder runs here
+        coding = negotiate(accept_encoding or "", cached=True)
+
+        def load():
+            body = dumps(list(regulation_collection.find({})))
+            return (body, "identity") if len(body) < COMPRESSION_MIN_BYTES else (compress(body, coding), coding)
+
+        body, coding = read_cache.get("regulations", f"all:{coding}", load)
+        headers = {"ETag": tag}
+        if coding != "identity":
+            # Otherwise the compression middleware adds Vary itself
+            headers.update({"Content-Encoding": coding, "Vary": "Accept-Encoding"})
+        return Response(body, media_type="application/json", headers=headers)
     except Exception as e:
         logging.exception("Failed to get all regulations")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _distribution(values: list) -> dict:
+    values = [v for v in values if v is not None]
+    return {
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "max": max(values, default=None),
+    }
+
+# Cost and latency of analyses, grouped by regulation and month of upload
+@router.get("/regulations/analysis-costs")
+async def get_analysis_costs(reg_id: Optional[str] = None):
+    pipeline = []
+    if reg_id:
+        try:
+            pipeline.append({"$match": {"_id": ObjectId(reg_id)}})
+        except InvalidId:
+            raise HTTPException(status_code=400, detail="Invalid regulation id")
+    try:
+        pipeline += [
+            {"$unwind": "$versions"},
+            # Streaming versions that are still running or failed have analysis: null
+            {"$match": {"versions.analysis": {"$type": "object"}}},
+            {"$group": {
+                "_id": {
+                    "regulation": "$_id",
+                    "month": {"$substrBytes": ["$versions.uploadDate", 0, 7]},
+                },
+                "title": {"$first": "$title"},
+                "analyses": {"$sum": 1},
+                "costUsd": {"$sum": "$versions.analysis.costUsd"},
+                "inputTokens": {"$sum": "$versions.analysis.inputTokens"},
+                "cachedTokens": {"$sum": "$versions.analysis.cachedTokens"},
+                "outputTokens": {"$sum": "$versions.analysis.outputTokens"},
+                "costs": {"$push": "$versions.analysis.costUsd"},
+                "durations": {"$push": "$versions.analysis.durationSeconds"},
+            }},
+            {"$sort": {"_id.month": -1, "costUsd": -1}},
+        ]
+
+        results = []
+        for row in regulation_collection.aggregate(pipeline):
+            costs = row.pop("costs")
+            durations = row.pop("durations")
+            group = row.pop("_id")
+            results.append({
+                "regulationId": str(group["regulation"]),
+                "month": group["month"],
+                **row,
+                "costUsd": round(row["costUsd"], 6),
+                # Per analysis: a few very large documents show up here long before they move the total
+                "costUsdPerAnalysis": _distribution(costs),
+                "durationSeconds": _distribution(durations),
+            })
+        return results
+    except Exception as e:
+        logging.exception("Failed to aggregate analysis costs")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/regulations")
 async def create_regulation(title: str = Body(...), version: str = Body(...), file: UploadFile = File(...)):
     try:
@@ -42,20 +128,25 @@ async def create_regulation(title: str = Body(...), version: str = Body(...), fi
         s3_key = f"{datetime.now().strftime('%Y-%m-%d_%H:%M:%S')}_{file.filename}"
         s3_client.upload_file(str(temp_path), s3_bucket, s3_key)
 
-        doc = {
-            "title": title,
-            "status": "pending",
-            "versions": [
-                {
-                    "id": "v1",
-                    "version": version,
-                    "uploadDate": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "s3Key": s3_key,
-                    "detailedChanges": []
-                }
-            ]
-        }
-        result = regulation_collection.insert_one(doc)
+        with new_revision() as revision:
+            doc = {
+                "title": title,
+                "status": "pending",
+                "revision": revision,
+                "versions": [
+                    {
+                        "id": "v1",
+                        "version": version,
+                        "uploadDate": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                        "s3Key": s3_key,
+                        "detailedChanges": [],
+                        "revision": revision,
+                    }
+                ]
+            }
+            result = regulation_collection.insert_one(doc)
+        stats.record_regulation_added(doc)
+        read_cache.invalidate("regulations")
         
         return {"id": str(result.inserted_id), "message": "Regulation created"}
     
@@ -84,15 +175,18 @@ async def update_change_status(reg_id: str, version_id: str, change_id: str, bod
     new_status = body.new_status
 
     # Update using array filters
-    regulation_collection.update_one(
-        {"_id": ObjectId(reg_id)},
-        {
-            "$set": {
-                "versions.$[v].detailedChanges.$[c].status": new_status
-            }
-        },
-        array_filters=[{"v.id": version_id}, {"c.id": change_id}]
-    )
+    with new_revision() as revision:
+        regulation_collection.update_one(
+            {"_id": ObjectId(reg_id)},
+            stamp({
+                "$set": {
+                    "versions.$[v].detailedChanges.$[c].status": new_status
+                }
+            }, revision, "versions.$[v].detailedChanges.$[c]"),
+            array_filters=[{"v.id": version_id}, {"c.id": change_id}]
+        )
+    stats.record_change_updated(change, {**change, "status": new_status})
+    read_cache.invalidate("regulations")
 
     return {"message": "Change status updated", "status": new_status}
 
@@ -116,10 +210,14 @@ async def delete_regulation_version(reg_id: str, version_id: str):
             raise HTTPException(status_code=500, detail=f"Failed to delete from S3: {str(e)}")
 
         # Remove version from MongoDB
-        regulation_collection.update_one(
-            {"_id": ObjectId(reg_id)},
-            {"$pull": {"versions": {"id": version_id}}}
-        )
+        with new_revision() as revision:
+            result = regulation_collection.update_one(
+                {"_id": ObjectId(reg_id)},
+                stamp({"$pull": {"versions": {"id": version_id}}}, revision)
+            )
+        if result.modified_count:
+            stats.record_version_deleted(version)
+            read_cache.invalidate("regulations")
 
         return {"message": f"Version {version_id} deleted successfully"}
 
@@ -150,7 +248,11 @@ async def delete_regulation(reg_id: str):
                 raise HTTPException(status_code=500, detail=f"Failed to delete S3 objects: {str(e)}")
 
         # Remove regulation from MongoDB
-        regulation_collection.delete_one({"_id": ObjectId(reg_id)})
+        result = regulation_collection.delete_one({"_id": ObjectId(reg_id)})
+        if result.deleted_count:
+            stats.record_regulation_deleted(reg_doc)
+            record_deletion("regulation", reg_id)
+            read_cache.invalidate("regulations")
 
         return {"message": f"Regulation '{reg_doc['title']}' and all its versions deleted successfully"}
 
@@ -186,15 +288,17 @@ async def add_comment(reg_id: str, version_id: str, change_id: str, body: Change
     }
 
     try:
-        regulation_collection.update_one(
-            {"_id": ObjectId(reg_id)},
-            {
-                "$push": {
-                    "versions.$[v].detailedChanges.$[c].comments": new_comment
-                }
-            },
-            array_filters=[{"v.id": version_id}, {"c.id": change_id}]
-        )
+        with new_revision() as revision:
+            regulation_collection.update_one(
+                {"_id": ObjectId(reg_id)},
+                stamp({
+                    "$push": {
+                        "versions.$[v].detailedChanges.$[c].comments": new_comment
+                    }
+                }, revision, "versions.$[v].detailedChanges.$[c]"),
+                array_filters=[{"v.id": version_id}, {"c.id": change_id}]
+            )
+        read_cache.invalidate("regulations")
 
         return {"message": "Comment added", "comment": new_comment}
     
@@ -229,16 +333,20 @@ async def update_single_change(reg_id: str, version_id: str, change_id: str, bod
         updated_change = {**change, **updates}
         updated_change["status"] = "pending"  # Reset status
 
-        regulation_collection.update_one(
-            {"_id": ObjectId(reg_id)},
-            {
-                "$set": {
-                    "versions.$[v].detailedChanges.$[c]": updated_change,
-                    "lastUpdated": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                }
-            },
-            array_filters=[{"v.id": version_id}, {"c.id": change_id}]
-        )
+        with new_revision() as revision:
+            updated_change["revision"] = revision
+            regulation_collection.update_one(
+                {"_id": ObjectId(reg_id)},
+                stamp({
+                    "$set": {
+                        "versions.$[v].detailedChanges.$[c]": updated_change,
+                        "lastUpdated": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    }
+                }, revision),
+                array_filters=[{"v.id": version_id}, {"c.id": change_id}]
+            )
+        stats.record_change_updated(change, updated_change)
+        read_cache.invalidate("regulations")
 
         return {
             "message": f"Change {change_id} updated successfully and reset to pending",
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+import logging
+
+from services.stats import get_stats, rebuild
+
+router = APIRouter(prefix="/stats", tags=["stats"])
+
+# Dashboard counts of changes by status, classification and type, read from a single counters document
+@router.get("")
+async def get_dashboard_stats():
+    try:
+        return await run_in_threadpool(get_stats)
+    except Exception as e:
+        logging.exception("Failed to get dashboard stats")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Recount everything from the regulations, e.g. after editing the database by hand
+@router.post("/rebuild")
+async def rebuild_stats():
+    try:
+        stats = await run_in_threadpool(rebuild)
+        stats.pop("_id", None)
+        return stats
+    except Exception as e:
+        logging.exception("Failed to rebuild dashboard stats")
+        raise HTTPException(status_code=500, detail=str(e))
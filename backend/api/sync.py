@@ -0,0 +1,72 @@
+from fastapi import APIRouter, HTTPException, Header, Response
+from typing import Optional
+import logging
+
+from db.mongo import regulation_collection, notification_collection, deletion_collection
+from services.revisions import committed_revision, etag, not_modified
+
+router = APIRouter(prefix="/sync", tags=["sync"])
+
+def _is_new(item: dict, floor: int) -> bool:
+    return floor < 0 or item.get("revision", 0) > floor
+
+def _regulation_delta(doc: dict, floor: int) -> dict:
+    """The regulation's own fields plus only the versions and changes newer than `floor`."""
+    delta = {k: v for k, v in doc.items() if k != "versions"}
+    delta["_id"] = str(doc["_id"])
+    # Lets the client drop versions that were deleted
+    delta["versionIds"] = [v["id"] for v in doc.get("versions", [])]
+    delta["versions"] = []
+    delta["changes"] = []
+    for version in doc.get("versions", []):
+        if _is_new(version, floor):
+            delta["versions"].append(version)
+            continue
+        for change in version.get("detailedChanges", []):
+            if _is_new(change, floor):
+                delta["changes"].append({"versionId": version["id"], **change})
+    return delta
+
+def _notification(doc: dict, username: Optional[str]) -> dict:
+    # Same shape as GET /notifications/
+    return {
+        "id": str(doc["_id"]),
+        "title": doc["title"],
+        "message": doc["message"],
+        "seen": username in doc.get("seen_by", []),
+        "created_at": doc["created_at"].strftime("%Y-%m-%d %H:%M"),
+        "revision": doc.get("revision", 0),
+    }
+
+# Everything that changed after revision `since`; pass the returned `revision` as `since` next time.
+# since=0 returns everything.
+@router.get("")
+async def sync(response: Response, since: int = 0, username: Optional[str] = None, if_none_match: Optional[str] = Header(None)):
+    try:
+        # Every write up to this revision has landed, so the next sync can start from it. Read
+        # before the queries: items newer than it are sent again next time, and are applied by id.
+        revision = committed_revision()
+        tag = etag(revision)
+        if not_modified(if_none_match, tag):
+            return Response(status_code=304, headers={"ETag": tag})
+        response.headers["ETag"] = tag
+
+        result = {"revision": revision, "regulations": [], "deletedRegulations": [], "notifications": []}
+        if since >= revision:
+            return result
+
+        # Documents written before revisions existed only come with a full sync
+        floor = since if since > 0 else -1
+        query = {"revision": {"$gt": floor}} if floor >= 0 else {}
+
+        for doc in regulation_collection.find(query):
+            result["regulations"].append(_regulation_delta(doc, floor))
+        for doc in notification_collection.find(query).sort("created_at", -1):
+            result["notifications"].append(_notification(doc, username))
+        if floor >= 0:
+            for doc in deletion_collection.find({"kind": "regulation", **query}):
+                result["deletedRegulations"].append(doc["docId"])
+        return result
+    except Exception as e:
+        logging.exception("Failed to sync")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -3,6 +3,7 @@ from fastapi import APIRouter, HTTPException, Body
 from bson import ObjectId
 import bcrypt
 from db.mongo import user_collection
+from services.cache import read_cache
 from schemas.users import UserCreate, UserLogin, UserResponse, UserUpdate, ResetPasswordRequest
 from typing import List
 
@@ -37,6 +38,9 @@ def login(credentials: UserLogin):
 # get all accounts - admin route
 @router.get("/users", response_model=List[UserResponse])
 def fetch_all_accounts():
+    return read_cache.get("users", "all", _load_accounts)
+
+def _load_accounts() -> List[UserResponse]:
     users = list(user_collection.find({}, {"password": 0}))
     return [
         UserResponse(
@@ -62,6 +66,7 @@ def create_account(payload: UserCreate):
         "role": payload.role
     }
     result = user_collection.insert_one(new_user)
+    read_cache.invalidate("users")
 
     return UserResponse(
         id=str(result.inserted_id),
@@ -87,6 +92,7 @@ def edit_user_details(user_id: str, payload: UserUpdate):
         update_fields["email"] = payload.email
 
     user_collection.update_one({"_id": ObjectId(user_id)}, {"$set": update_fields})
+    read_cache.invalidate("users")
 
     updated_user = user_collection.find_one({"_id": ObjectId(user_id)})
     return UserResponse(
@@ -107,6 +113,7 @@ def reset_password(user_id: str, payload: ResetPasswordRequest):
         {"_id": ObjectId(user_id)},
         {"$set": {"password": hashed_pw}}
     )
+    read_cache.invalidate("users")
 
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
@@ -120,6 +127,7 @@ def delete_account(user_id: str):
         raise HTTPException(status_code=400, detail="Invalid user ID")
 
     result = user_collection.delete_one({"_id": ObjectId(user_id)})
+    read_cache.invalidate("users")
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
 
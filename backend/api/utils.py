@@ -1,5 +1,7 @@
 from fastapi import APIRouter, Request
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import PlainTextResponse, Response
+
+from services.metrics import render_latest
 
 router = APIRouter()
 
@@ -7,6 +9,12 @@ router = APIRouter()
 async def health_check():
     return {"status": "healthy"}
 
+# Prometheus scrape target, kept above the catch-all so it is not swallowed by it
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    payload, content_type = render_latest()
+    return Response(content=payload, media_type=content_type)
+
 @router.api_route("/{path_name:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
 async def catch_all(request: Request, path_name: str):
     print("Unhandled route:", request.url.path)
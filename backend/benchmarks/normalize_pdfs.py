@@ -0,0 +1,84 @@
+"""
+Benchmark of the PDF normalization stage.
+
+Run from the backend folder:
+
+    python -m benchmarks.normalize_pdfs before.pdf after.pdf [--runs 3] [--analyze]
+
+Without --analyze only local work is measured (upload size and extraction time),
+so no credentials are needed. With --analyze both PDFs are also uploaded, indexed
+and compared through OpenAI once with normalization off and once with it on, using
+the .env credentials; this costs real tokens.
+"""
+import argparse
+import statistics
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from llm import normalize
+
+
+def measure_sizes(paths: list, runs: int):
+    print(f"{'file':<30}{'pdf KB':>10}{'text KB':>10}{'ratio':>8}{'extract ms':>12}")
+    for path in paths:
+        data = path.read_bytes()
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            pages = normalize.extract_pages(data)
+            timings.append((time.perf_counter() - start) * 1000)
+        text = normalize.render_pages(pages).encode("utf-8")
+        note = "" if normalize.has_text(pages) else "  (no text layer, uploaded as PDF)"
+        print(
+            f"{path.name[:29]:<30}{len(data) / 1024:>10.1f}{len(text) / 1024:>10.1f}"
+            f"{len(text) / len(data):>8.2f}{statistics.median(timings):>12.1f}{note}"
+        )
+
+
+def measure_analysis(before: Path, after: Path, runs: int):
+    # Imported here so the size benchmark runs without OpenAI or AWS credentials
+    from llm.chains import choose_route, comparison, prepare_vector_store
+    from llm.governor import Deadline
+    from llm.ledger import AnalysisLedger
+    from llm.resources import RemoteResources
+
+    stages = ("normalize", "upload", "indexing", "comparison")
+    print(f"\n{'mode':<8}" + "".join(f"{s + ' s':>14}" for s in stages) + f"{'total s':>10}{'input tok':>11}{'upload KB':>11}")
+    for mode in ("off", "text"):
+        normalize.PDF_NORMALIZATION = mode
+        rows = []
+        for _ in range(runs):
+            ledger = AnalysisLedger()
+            with RemoteResources(ledger=ledger) as resources:
+                vector_store_id = prepare_vector_store(resources, before.read_bytes, after.read_bytes(), ledger)
+                deadline = Deadline.for_stage("comparison")
+                route = choose_route("comparison", ledger.uploaded_bytes(), ledger, deadline)
+                with ledger.stage("comparison"):
+                    comparison(vector_store_id, route, ledger=ledger, deadline=deadline)
+            rows.append(ledger.to_dict())
+        medians = [statistics.median(r["stageSeconds"].get(s, 0.0) for r in rows) for s in stages]
+        total = statistics.median(r["durationSeconds"] for r in rows)
+        tokens = statistics.median(r["inputTokens"] for r in rows)
+        upload = statistics.median(r["uploadBytes"] for r in rows) / 1024
+        print(f"{mode:<8}" + "".join(f"{m:>14.2f}" for m in medians) + f"{total:>10.2f}{tokens:>11.0f}{upload:>11.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare upload size and analysis latency with and without PDF normalization.")
+    parser.add_argument("before", type=Path)
+    parser.add_argument("after", type=Path)
+    parser.add_argument("--runs", type=int, default=3, help="repetitions per measurement, the median is reported")
+    parser.add_argument("--analyze", action="store_true", help="also time upload, indexing and comparison against OpenAI")
+    args = parser.parse_args()
+
+    measure_sizes([args.before, args.after], args.runs)
+    if args.analyze:
+        measure_analysis(args.before, args.after, args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+"""
+Offline benchmark suite: both services against local stand-ins, no credentials needed.
+
+Run from the backend folder:
+
+    python -m benchmarks.offline [--scenarios list-regulations,notification-polling] [--output results.json]
+    python -m benchmarks.offline --output after.json --compare before.json
+
+The main and analysis apps are served by uvicorn in this process, on top of:
+- MongoDB: mongomock with `array_filters` support (benchmarks/standins/mongo.py), or a
+  real deployment with --mongo-uri (its `fineprint_benchmark` database is dropped first)
+- S3: moto
+- OpenAI: a fake Files / Vector Stores / Responses server with configurable latency
+- SMTP: a sink that accepts and counts every email
+
+Each scenario reports requests, errors, throughput and p50/p90/p99 latency. With
+--output the results are saved with the current commit, and --compare prints the
+change against an earlier run. Both apps and the load share one process, so compare
+runs made on the same machine rather than reading the numbers as capacity.
+"""
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import bcrypt
+import httpx
+import uvicorn
+
+from benchmarks.standins import fake_openai, mongo
+from benchmarks.standins.smtp_sink import SMTPSink
+
+SCENARIOS = ("list-regulations", "list-regulations-uncached", "notification-polling", "review-burst", "version-uploads")
+BENCHMARK_DB = "fineprint_benchmark"
+BENCHMARK_BUCKET = "fineprint-benchmark"
+BASE_PDF_KEY = "benchmark/base.pdf"
+# The apps print per email and per analysis; the report goes here even while that is silenced
+REPORT = sys.stdout
+
+
+# -----------------------
+# Fixtures
+# -----------------------
+def text_pdf(pages: list) -> bytes:
+    """A minimal PDF with one line of Helvetica text per page."""
+    objects = [b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    pages_id = 2 + 2 * len(pages)
+    page_ids = []
+    for text in pages:
+        text = text.replace("(", "").replace(")", "")
+        stream = f"BT /F1 10 Tf 40 800 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream".encode())
+        objects.append((
+            f"<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 595 842] /Contents {len(objects)} 0 R "
+            f"/Resources << /Font << /F1 1 0 R >> >> >>"
+        ).encode())
+        page_ids.append(len(objects))
+    objects.append(f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(pages)} >>".encode())
+    objects.append(f"<< /Type /Catalog /Pages {pages_id} 0 R >>".encode())
+
+    out, offsets = b"%PDF-1.4\n", []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root {len(objects)} 0 R >>\nstartxref\n{xref}\n%%EOF".encode()
+    return out
+
+
+def seed(args, rng: random.Random) -> list:
+    """Fill the stand-ins. Returns (regulation id, [(version id, [change ids])]) for the scenarios to pick from."""
+    from db.mongo import regulation_collection, user_collection, notification_collection
+    from services import stats
+    from services.cache import read_cache
+    from services.revisions import next_revision
+    from services.s3 import s3_client, s3_bucket
+
+    s3_client.create_bucket(Bucket=s3_bucket)
+    s3_client.put_object(Bucket=s3_bucket, Key=BASE_PDF_KEY, Body=text_pdf([f"Article {i + 1}: notify within 72 hours." for i in range(5)]))
+
+    # One cheap hash for everyone, logins are not benchmarked
+    password = bcrypt.hashpw(b"benchmark", bcrypt.gensalt(4)).decode()
+    user_collection.insert_many([
+        {"username": f"user{i}", "email": f"user{i}@example.com", "password": password, "role": "admin" if i == 0 else "user"}
+        for i in range(args.users)
+    ])
+
+    now = datetime.now()
+    changes = fake_openai.fake_changes(args.changes)
+    docs = []
+    for r in range(args.regulations):
+        revision = next_revision()
+        versions = [
+            {
+                "id": f"v{v + 1}", "version": f"{v + 1}.0", "uploadDate": now.strftime("%Y-%m-%d %H:%M:%S"),
+                "fileName": "base.pdf", "s3Key": BASE_PDF_KEY, "revision": revision,
+                "detailedChanges": [
+                    {**change, "status": rng.choice(["pending", "relevant", "not-relevant"]), "revision": revision}
+                    for change in changes
+                ],
+            }
+            for v in range(args.versions)
+        ]
+        docs.append({
+            "title": f"Regulation {r + 1}", "status": "pending", "revision": revision,
+            "lastUpdated": now.strftime("%Y-%m-%d %H:%M:%S"), "versions": versions,
+        })
+    ids = regulation_collection.insert_many(docs).inserted_ids if docs else []
+
+    notification_collection.insert_many([
+        {
+            "title": f"New Version Added: Regulation {i + 1}", "message": "A new version has been added.",
+            "created_at": now - timedelta(minutes=i), "revision": next_revision(),
+            "seen_by": [f"user{u}" for u in range(args.users) if rng.random() < 0.5],
+        }
+        for i in range(args.notifications)
+    ] or [{"title": "-", "message": "-", "created_at": now, "seen_by": [], "revision": next_revision()}])
+
+    stats.rebuild()
+    read_cache.invalidate("regulations", "users", "notifications")
+    return [
+        (str(reg_id), [(v["id"], [c["id"] for c in v["detailedChanges"]]) for v in doc["versions"]])
+        for reg_id, doc in zip(ids, docs)
+    ]
+
+
+# -----------------------
+# Servers
+# -----------------------
+def serve(app, name: str):
+    """Serve an ASGI app with uvicorn in a daemon thread. Returns (base URL, server)."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False))
+    threading.Thread(target=server.run, name=name, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", server
+
+
+# -----------------------
+# Load
+# -----------------------
+async def run_load(send, total: int, concurrency: int) -> dict:
+    """Call `await send(i)` for i in range(total) from `concurrency` workers and summarise the latencies."""
+    from services.metrics import percentile
+    latencies, errors = [], 0
+    counter = itertools.count()
+
+    async def worker():
+        nonlocal errors
+        while (i := next(counter)) < total:
+            start = time.perf_counter()
+            try:
+                response = await send(i)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(min(concurrency, total), 1))))
+    seconds = time.perf_counter() - start
+    return {
+        "requests": total, "errors": errors, "seconds": round(seconds, 3),
+        "throughput": round(total / seconds, 2) if seconds else 0.0,
+        **{f"p{q}": round(percentile(latencies, q) or 0.0, 2) for q in (50, 90, 99)},
+        "max": round(max(latencies, default=0.0), 2),
+    }
+
+
+async def list_regulations(client, main_url, args, targets, rng):
+    headers = {"Accept-Encoding": "br, gzip"}
+    return await run_load(lambda i: client.get(f"{main_url}/regulations", headers=headers), args.list_requests, args.concurrency)
+
+
+async def list_regulations_uncached(client, main_url, args, targets, rng):
+    from services.cache import read_cache
+
+    read_cache.enabled = False
+    try:
+        headers = {"Accept-Encoding": "br, gzip"}
+        return await run_load(lambda i: client.get(f"{main_url}/regulations", headers=headers), max(args.list_requests // 5, 1), args.concurrency)
+    finally:
+        read_cache.enabled = True
+
+
+async def notification_polling(client, main_url, args, targets, rng):
+    # Every user polls like the frontend, revalidating with the ETag of its last response
+    etags = {}
+
+    async def poll(i):
+        user = f"user{i % args.users}"
+        headers = {"If-None-Match": etags[user]} if user in etags else {}
+        response = await client.get(f"{main_url}/notifications/", params={"username": user}, headers=headers)
+        if "etag" in response.headers:
+            etags[user] = response.headers["etag"]
+        return response
+
+    return await run_load(poll, args.users * args.polls, args.users)
+
+
+async def review_burst(client, main_url, args, targets, rng):
+    # Reviewers triaging changes: status updates, comments and edits on random changes
+    def pick():
+        reg_id, versions = rng.choice(targets)
+        version_id, change_ids = rng.choice(versions)
+        return f"{main_url}/regulations/{reg_id}/versions/{version_id}/changes/{rng.choice(change_ids)}"
+
+    async def review(i):
+        url = pick()
+        action = rng.random()
+        if action < 0.6:
+            return await client.put(url, json={"new_status": rng.choice(["relevant", "not-relevant"])})
+        if action < 0.9:
+            return await client.post(f"{url}/comments", json={"username": f"user{i % args.users}", "comment": "Checked against policy."})
+        return await client.put(f"{url}/edit", json={"summary": f"Reviewed summary {i}"})
+
+    return await run_load(review, args.reviews, args.concurrency)
+
+
+async def version_uploads(client, analysis_url, args, targets, rng):
+    pdf = text_pdf([f"Article {i + 1}: notify within 48 hours." for i in range(5)])
+
+    async def upload(i):
+        reg_id, _ = targets[i % len(targets)]
+        return await client.post(
+            f"{analysis_url}/regulations/{reg_id}/versions",
+            data={"version": f"bench-{i}"},
+            files={"file": (f"bench-{i}.pdf", pdf, "application/pdf")},
+            timeout=None,
+        )
+
+    return await run_load(upload, args.uploads, args.uploads)
+
+
+RUNNERS = {
+    "list-regulations": (list_regulations, "main"),
+    "list-regulations-uncached": (list_regulations_uncached, "main"),
+    "notification-polling": (notification_polling, "main"),
+    "review-burst": (review_burst, "main"),
+    "version-uploads": (version_uploads, "analysis"),
+}
+
+
+async def run_scenarios(names: list, urls: dict, args, targets: list, sink: SMTPSink) -> dict:
+    rng = random.Random(args.seed)
+    results = {}
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        for name in names:
+            runner, service = RUNNERS[name]
+            emails = sink.messages
+            results[name] = await runner(client, urls[service], args, targets, rng)
+            if sink.messages > emails:
+                results[name]["emails"] = sink.messages - emails
+            print_row(name, results[name])
+    return results
+
+
+# -----------------------
+# Report
+# -----------------------
+def print_header():
+    print(f"{'scenario':<28}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}", file=REPORT)
+
+
+def print_row(name: str, result: dict):
+    print(
+        f"{name:<28}{result['requests']:>9}{result['errors']:>8}{result['throughput']:>9.1f}"
+        f"{result['p50']:>10.1f}{result['p90']:>10.1f}{result['p99']:>10.1f}{result['max']:>10.1f}",
+        file=REPORT, flush=True,
+    )
+
+
+def print_comparison(before: dict, after: dict):
+    print(f"\nCompared with {before.get('commit') or 'baseline'} ({before.get('startedAt', '?')}):", file=REPORT)
+    ignored = {"output", "compare", "verbose", "scenarios"}
+    changed = sorted(k for k, v in after["settings"].items() if k not in ignored and before.get("settings", {}).get(k) != v)
+    if changed:
+        print(f"(settings differ: {', '.join(changed)})", file=REPORT)
+    print(f"{'scenario':<28}{'p50 ms':>26}{'p99 ms':>26}{'req/s':>26}", file=REPORT)
+
+    def cell(old, new):
+        change = f"{(new - old) / old * 100:+.0f}%" if old else "n/a"
+        return f"{old:.1f} -> {new:.1f} {change:>6}"
+
+    for name, result in after["scenarios"].items():
+        base = before.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        print(
+            f"{name:<28}{cell(base['p50'], result['p50']):>26}{cell(base['p99'], result['p99']):>26}"
+            f"{cell(base['throughput'], result['throughput']):>26}",
+            file=REPORT,
+        )
+
+
+def current_commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# -----------------------
+# Main
+# -----------------------
+def configure_environment(args, openai_url: str, sink: SMTPSink):
+    """Point every client at the stand-ins. Must run before the apps are imported."""
+    os.environ.update({
+        "OPENAI_API_KEY": "sk-offline-benchmark",
+        "OPENAI_BASE_URL": openai_url,
+        "AWS_ACCESS_KEY_ID": "offline", "AWS_SECRET_ACCESS_KEY": "offline", "AWS_DEFAULT_REGION": "us-east-1",
+        "S3_BUCKET": BENCHMARK_BUCKET,
+        "SMTP_SERVER": "127.0.0.1", "SMTP_PORT": str(sink.port), "SMTP_USER": "benchmark@example.com", "SMTP_PASSWORD": "offline",
+        "DB_ENV": BENCHMARK_DB,
+        "LANGSMITH_TRACING": "false",
+        # Both apps share this process, so the in-memory broadcast reaches every cache
+        "CACHE_BROADCAST": "memory",
+    })
+    if args.mongo_uri:
+        os.environ["MONGO_URI"] = args.mongo_uri
+    else:
+        mongo.install()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark both services against local stand-ins for Mongo, S3, OpenAI and SMTP.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated, from: {', '.join(SCENARIOS)}")
+    parser.add_argument("--regulations", type=int, default=500)
+    parser.add_argument("--versions", type=int, default=2, help="versions per seeded regulation")
+    parser.add_argument("--changes", type=int, default=10, help="changes per seeded version and per fake analysis")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--notifications", type=int, default=50)
+    parser.add_argument("--list-requests", type=int, default=100)
+    parser.add_argument("--polls", type=int, default=5, help="notification polls per user")
+    parser.add_argument("--reviews", type=int, default=300)
+    parser.add_argument("--uploads", type=int, default=8, help="concurrent version uploads")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--openai-latency-scale", type=float, default=1.0, help="multiplies the fake OpenAI latencies")
+    parser.add_argument("--mongo-uri", help="use this MongoDB instead of the in-memory one")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="save the results as JSON")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--verbose", action="store_true", help="show what the apps print")
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    latency = {k: v * args.openai_latency_scale for k, v in fake_openai.DEFAULT_LATENCY.items()}
+    openai_url, openai_server = serve(fake_openai.create_app(latency, args.changes), "fake-openai")
+    sink = SMTPSink().start()
+    configure_environment(args, f"{openai_url}/v1", sink)
+
+    # Imported here: moto has to be active before the S3 client is created
+    from moto import mock_aws
+
+    with mock_aws():
+        if args.mongo_uri:
+            from db.mongo import mongo_client
+            mongo_client.drop_database(BENCHMARK_DB)
+        import analysis as analysis_service
+        import main as main_service
+
+        started = datetime.now()
+        print(f"Seeding {args.regulations} regulations, {args.users} users and {args.notifications} notifications...")
+        targets = seed(args, random.Random(args.seed))
+        main_url, main_server = serve(main_service.app, "main-service")
+        analysis_url, analysis_server = serve(analysis_service.app, "analysis-service")
+
+        print_header()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+            results = asyncio.run(run_scenarios(names, {"main": main_url, "analysis": analysis_url}, args, targets, sink))
+
+        for server in (main_server, analysis_server, openai_server):
+            server.should_exit = True
+        sink.shutdown()
+
+    report = {"commit": current_commit(), "startedAt": started.isoformat(timespec="seconds"), "settings": vars(args), "scenarios": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
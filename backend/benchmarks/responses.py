@@ -0,0 +1,141 @@
+"""
+Benchmark of the GET /regulations response path.
+
+Run from the backend folder (no credentials needed, the data is synthetic):
+
+    python -m benchmarks.responses [--changes 1000] [--runs 20]
+
+Encodes one regulation with `--changes` changes, shaped like a Mongo document,
+the way the endpoint used to (jsonable_encoder and json.dumps), through the typed
+response models, and the way it does now (orjson straight from the document).
+Then reports the bytes on the wire with each content encoding. The endpoint caches
+the compressed body until the next write, so compression is paid once per write;
+other large responses are compressed per request by the middleware.
+"""
+import argparse
+import gzip
+import random
+import statistics
+import time
+from datetime import datetime
+from typing import List
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from schemas.regulations import RegulationResponse
+from services import compression
+from services.responses import dumps
+
+# Varied text, so compression ratios are not flattered by identical changes
+WORDS = (
+    "personal data controller processor shall must may erase retain transfer consent lawful basis "
+    "purpose period days article paragraph subject request access rectification portability "
+    "security breach notify authority within hours third country safeguards contract"
+).split()
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def make_regulation(changes: int, versions: int = 4) -> dict:
+    rng = random.Random(changes)
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    per_version = max(changes // versions, 1)
+    return {
+        "_id": ObjectId(),
+        "title": "General Data Protection Regulation",
+        "status": "pending",
+        "lastUpdated": now,
+        "revision": 1,
+        "versions": [
+            {
+                "id": f"v{v + 1}",
+                "version": f"{2020 + v}.1",
+                "uploadDate": now,
+                "fileName": f"gdpr-{v + 1}.pdf",
+                "s3Key": f"{now}_gdpr-{v + 1}.pdf",
+                "revision": 1,
+                "analysis": {"model": "gpt-5", "inputTokens": 182_000, "costUsd": 0.61, "stageSeconds": {"comparison": 212.4}},
+                "detailedChanges": [
+                    {
+                        "id": f"change-{c + 1}",
+                        "summary": sentence(rng, 10),
+                        "analysis": " ".join(sentence(rng, 15) for _ in range(3)),
+                        "change": sentence(rng, 15),
+                        "before_quote": sentence(rng, 30),
+                        "after_quote": sentence(rng, 30),
+                        "type": rng.choice(["addition", "deletion", "modification"]),
+                        "confidence": round(rng.random(), 2),
+                        "classification": rng.choice(["Data retention", "Data transfers", "Cloud data usage", "Others"]),
+                        "status": "pending",
+                        "revision": 1,
+                        "comments": [
+                            {"id": "v1", "username": "analyst", "comment": sentence(rng, 8), "timestamp": now},
+                        ],
+                    }
+                    for c in range(per_version)
+                ],
+            }
+            for v in range(versions)
+        ],
+    }
+
+
+def old_path(docs: list) -> bytes:
+    for doc in docs:
+        doc["_id"] = str(doc["_id"])
+    return JSONResponse(jsonable_encoder(docs)).body
+
+
+def typed_path(docs: list) -> bytes:
+    adapter = TypeAdapter(List[RegulationResponse])
+    return adapter.dump_json(adapter.validate_python(docs), by_alias=True)
+
+
+def time_ms(fn, make_input, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        data = make_input()
+        start = time.perf_counter()
+        fn(data)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time response encoding and measure compressed sizes of a large regulation.")
+    parser.add_argument("--changes", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=20, help="repetitions per measurement, the median is reported")
+    args = parser.parse_args()
+
+    regulation = make_regulation(args.changes)
+    # Each path gets fresh documents, like a Mongo read would give it
+    fresh = lambda: [make_regulation(args.changes)]
+
+    print(f"{'encoding path':<36}{'ms':>10}{'KB':>10}")
+    for name, fn in (
+        ("jsonable_encoder + json.dumps", old_path),
+        ("response models (pydantic)", typed_path),
+        ("orjson from the document", dumps),
+    ):
+        size = len(fn([make_regulation(args.changes)])) / 1024
+        print(f"{name:<36}{time_ms(fn, fresh, args.runs):>10.2f}{size:>10.1f}")
+
+    body = dumps([regulation])
+    encoders = [("identity", lambda b: b), ("gzip", lambda b: gzip.compress(b, compression.GZIP_LEVEL))]
+    if compression.brotli is not None:
+        encoders.append(("br", lambda b: compression.brotli.compress(b, quality=compression.BROTLI_QUALITY)))
+        encoders.append(("br (cached /regulations)", lambda b: compression.compress(b, "br")))
+    else:
+        print("\n(brotli is not installed, skipping br)")
+    print(f"\n{'content encoding':<36}{'ms':>10}{'KB':>10}")
+    for name, encode in encoders:
+        print(f"{name:<36}{time_ms(encode, lambda: body, args.runs):>10.2f}{len(encode(body)) / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Throughput of the main service under serve.py as the number of workers grows.
+
+Run from the backend folder (Linux or macOS):
+
+    python -m benchmarks.scaling [--workers 1,2,4] [--requests 4000] [--output scaling.json]
+
+For each worker count, serve.py is started in a subprocess on top of the offline
+stand-ins (see benchmarks/offline.py). The data is seeded once in the server before
+its workers are forked, so with the in-memory MongoDB every worker starts with its
+own identical copy; pass --mongo-uri to share a real one instead. Several client
+processes then send a mix of GET /regulations, /notifications/ and /stats, and the
+report gives throughput, latency and the speedup over the first worker count.
+
+The clients run on the same machine and take CPU from the servers, so the speedup
+flattens before the core count; what matters is the trend.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import httpx
+
+from benchmarks.offline import BENCHMARK_BUCKET, BENCHMARK_DB, REPORT, current_commit, seed
+from benchmarks.standins import mongo
+
+STARTUP_TIMEOUT = 60
+
+
+# -----------------------
+# Server (runs in the subprocess)
+# -----------------------
+def run_server(args):
+    os.environ.update({
+        "OPENAI_API_KEY": "sk-offline-benchmark",
+        "AWS_ACCESS_KEY_ID": "offline", "AWS_SECRET_ACCESS_KEY": "offline", "AWS_DEFAULT_REGION": "us-east-1",
+        "S3_BUCKET": BENCHMARK_BUCKET,
+        "DB_ENV": BENCHMARK_DB,
+        "LANGSMITH_TRACING": "false",
+        # Nothing is written during the run, and the in-memory database is per worker anyway
+        "CACHE_BROADCAST": "memory",
+    })
+    if args.no_cache:
+        os.environ["CACHE_TTL_SECONDS"] = "0"
+    if args.mongo_uri:
+        os.environ["MONGO_URI"] = args.mongo_uri
+    else:
+        mongo.install()
+
+    from moto import mock_aws
+
+    import serve
+
+    # moto and the seeded in-memory database are inherited by the forked workers
+    with mock_aws():
+        serve.prepare_metrics_dir("main", args.serve)
+        serve.share_llm_limits(args.serve)
+        import main  # noqa: F401, preloaded here so the seed below lands in the forked workers
+        from db.mongo import mongo_client
+        if args.mongo_uri:
+            mongo_client.drop_database(BENCHMARK_DB)
+        seed(args, random.Random(args.seed))
+        # Workers must not inherit the connections used for seeding
+        mongo_client.close()
+        options = serve.options("main", args.serve, "127.0.0.1", args.port)
+        options["accesslog"] = None
+        serve.Server("main:app", options).run()
+
+
+def start_server(args, workers: int) -> tuple:
+    """Start serve.py with `workers` workers in a subprocess. Returns (process, base URL)."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    command = [
+        sys.executable, "-m", "benchmarks.scaling", "--serve", str(workers), "--port", str(port),
+        "--regulations", str(args.regulations), "--users", str(args.users), "--notifications", str(args.notifications),
+        "--seed", str(args.seed),
+    ]
+    if args.mongo_uri:
+        command += ["--mongo-uri", args.mongo_uri]
+    if args.no_cache:
+        command.append("--no-cache")
+    output = None if args.verbose else subprocess.DEVNULL
+    process = subprocess.Popen(command, stdout=output, stderr=output)
+    url = f"http://127.0.0.1:{port}"
+
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"serve.py exited with {process.returncode}, rerun with --verbose to see why")
+        try:
+            if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                return process, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"serve.py did not answer within {STARTUP_TIMEOUT}s")
+
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+# -----------------------
+# Clients (run in a process pool)
+# -----------------------
+def paths(users: int) -> list:
+    return ["/regulations", "/stats"] + [f"/notifications/?username=user{i}" for i in range(min(users, 50))]
+
+
+def run_client(url: str, requests: int, concurrency: int, users: int, offset: int) -> tuple:
+    """Send `requests` GETs from `concurrency` connections. Returns (latencies in ms, errors)."""
+    targets = paths(users)
+    latencies, errors = [], 0
+
+    async def worker(index: int):
+        nonlocal errors
+        async with httpx.AsyncClient(base_url=url, timeout=60, headers={"Accept-Encoding": "br, gzip"}) as client:
+            for i in range(index, requests, concurrency):
+                start = time.perf_counter()
+                try:
+                    response = await client.get(targets[(offset + i) % len(targets)])
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    async def all_workers():
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+
+    asyncio.run(all_workers())
+    return latencies, errors
+
+
+def measure(pool, url: str, args, requests: int) -> dict:
+    from services.metrics import percentile
+    per_client = max(requests // args.clients, 1)
+    start = time.perf_counter()
+    futures = [
+        pool.submit(run_client, url, per_client, args.concurrency, args.users, offset)
+        for offset in range(args.clients)
+    ]
+    latencies, errors = [], 0
+    for future in futures:
+        client_latencies, client_errors = future.result()
+        latencies += client_latencies
+        errors += client_errors
+    seconds = time.perf_counter() - start
+    return {
+        "requests": len(latencies), "errors": errors, "seconds": round(seconds, 3),
+        "throughput": round(len(latencies) / seconds, 2) if seconds else 0.0,
+        **{f"p{q}": round(percentile(latencies, q) or 0.0, 2) for q in (50, 90, 99)},
+    }
+
+
+# -----------------------
+# Report
+# -----------------------
+def print_header():
+    print(f"{'workers':<10}{'requests':>9}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'speedup':>10}", file=REPORT)
+
+
+def print_row(workers: int, result: dict):
+    print(
+        f"{workers:<10}{result['requests']:>9}{result['errors']:>8}{result['throughput']:>10.1f}"
+        f"{result['p50']:>10.1f}{result['p90']:>10.1f}{result['p99']:>10.1f}{result['speedup']:>9.2f}x",
+        file=REPORT, flush=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how the main service scales with serve.py workers.")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--requests", type=int, default=4000, help="per worker count, after the warm-up")
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=4, help="load-generating processes")
+    parser.add_argument("--concurrency", type=int, default=16, help="connections per client process")
+    parser.add_argument("--regulations", type=int, default=200)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--notifications", type=int, default=50)
+    parser.add_argument("--no-cache", action="store_true", help="disable the read cache (CACHE_TTL_SECONDS=0)")
+    parser.add_argument("--mongo-uri", help="use this MongoDB instead of an in-memory copy per worker")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="save the results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="show what the servers print")
+    # Internal: run serve.py with this many workers
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        # seed() expects the offline benchmark's sizes
+        args.versions, args.changes = 2, 10
+        run_server(args)
+        return
+
+    counts = [int(n) for n in args.workers.split(",") if n.strip()]
+    print(f"{os.cpu_count()} cores; {args.clients} client processes x {args.concurrency} connections")
+    print_header()
+    started = datetime.now()
+    results = {}
+    with ProcessPoolExecutor(max_workers=args.clients) as pool:
+        for workers in counts:
+            process, url = start_server(args, workers)
+            try:
+                measure(pool, url, args, args.warmup)
+                result = measure(pool, url, args, args.requests)
+            finally:
+                stop_server(process)
+            first = results[counts[0]]["throughput"] if results else result["throughput"]
+            result["speedup"] = round(result["throughput"] / first, 2) if first else 0.0
+            results[workers] = result
+            print_row(workers, result)
+
+    if args.output:
+        report = {"commit": current_commit(), "startedAt": started.isoformat(timespec="seconds"), "settings": vars(args), "workers": results}
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
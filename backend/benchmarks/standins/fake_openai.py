@@ -0,0 +1,205 @@
+"""
+Fake OpenAI API for the offline benchmarks: the Files, Vector Stores and Responses
+endpoints the analysis uses, with configurable latencies instead of real models.
+
+Point the SDK at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+"""
+import asyncio
+import itertools
+import json
+import time
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+# Seconds. Files are reported "processed" and vector stores indexed once this long has passed
+DEFAULT_LATENCY = {
+    "request": 0.02,
+    "file_processing": 0.3,
+    "indexing": 1.0,
+    "comparison": 3.0,
+    "structuring": 1.0,
+}
+STREAM_CHUNK_CHARS = 200
+
+
+def fake_changes(count: int) -> list:
+    return [
+        {
+            "id": f"change-{i + 1}",
+            "summary": f"Obligation {i + 1} changed",
+            "analysis": "The new version tightens the deadline and widens the scope of the obligation.",
+            "change": f"Article {i + 1} now requires notification within 48 hours instead of 72.",
+            "before_quote": f"Article {i + 1}: notify within 72 hours (p{i % 5 + 1})",
+            "after_quote": f"Article {i + 1}: notify within 48 hours (p{i % 5 + 1})",
+            "type": "modification",
+            "confidence": 0.9,
+            "classification": "Others",
+            "status": "relevant",
+            "comments": [],
+        }
+        for i in range(count)
+    ]
+
+
+def create_app(latency: dict = None, changes: int = 10) -> Starlette:
+    latency = {**DEFAULT_LATENCY, **(latency or {})}
+    ids = itertools.count(1)
+    files = {}
+    stores = {}
+    change_list = fake_changes(changes)
+
+    def new_id(prefix: str) -> str:
+        return f"{prefix}-{next(ids)}"
+
+    async def pause(kind: str):
+        await asyncio.sleep(latency[kind])
+
+    def listing(items: list) -> JSONResponse:
+        return JSONResponse({"object": "list", "data": items, "has_more": False})
+
+    # --- Files ---
+    def file_view(file: dict) -> dict:
+        done = time.time() - file["created_at"] >= latency["file_processing"]
+        return {**file, "status": "processed" if done else "uploaded"}
+
+    async def create_file(request):
+        await pause("request")
+        form = await request.form()
+        upload = form["file"]
+        data = await upload.read()
+        file = {
+            "id": new_id("file"), "object": "file", "bytes": len(data), "created_at": int(time.time()),
+            "filename": upload.filename, "purpose": form.get("purpose", "assistants"),
+        }
+        # Kept as a float so processing can take less than a second
+        files[file["id"]] = {**file, "created_at": time.time()}
+        return JSONResponse({**file, "status": "uploaded"})
+
+    async def retrieve_file(request):
+        await pause("request")
+        file = files.get(request.path_params["file_id"])
+        if file is None:
+            return JSONResponse({"error": {"message": "No such file", "type": "invalid_request_error"}}, status_code=404)
+        return JSONResponse({**file_view(file), "created_at": int(file["created_at"])})
+
+    async def delete_file(request):
+        await pause("request")
+        files.pop(request.path_params["file_id"], None)
+        return JSONResponse({"id": request.path_params["file_id"], "object": "file", "deleted": True})
+
+    async def list_files(request):
+        await pause("request")
+        return listing([{**file_view(f), "created_at": int(f["created_at"])} for f in files.values()])
+
+    # --- Vector stores ---
+    def store_view(store: dict) -> dict:
+        total = len(store["file_ids"])
+        indexed = store["indexed_at"] is not None and time.time() >= store["indexed_at"]
+        return {
+            "id": store["id"], "object": "vector_store", "created_at": int(store["created_at"]),
+            "name": store["name"], "metadata": store["metadata"], "status": "completed", "usage_bytes": 0,
+            "file_counts": {
+                "in_progress": 0 if indexed else total, "completed": total if indexed else 0,
+                "failed": 0, "cancelled": 0, "total": total,
+            },
+        }
+
+    async def create_store(request):
+        await pause("request")
+        body = await request.json()
+        store = {
+            "id": new_id("vs"), "created_at": time.time(), "name": body.get("name"),
+            "metadata": body.get("metadata") or {}, "file_ids": [], "indexed_at": None,
+        }
+        stores[store["id"]] = store
+        return JSONResponse(store_view(store))
+
+    async def retrieve_store(request):
+        await pause("request")
+        store = stores.get(request.path_params["store_id"])
+        if store is None:
+            return JSONResponse({"error": {"message": "No such vector store", "type": "invalid_request_error"}}, status_code=404)
+        return JSONResponse(store_view(store))
+
+    async def delete_store(request):
+        await pause("request")
+        stores.pop(request.path_params["store_id"], None)
+        return JSONResponse({"id": request.path_params["store_id"], "object": "vector_store.deleted", "deleted": True})
+
+    async def list_stores(request):
+        await pause("request")
+        return listing([store_view(s) for s in stores.values()])
+
+    async def create_file_batch(request):
+        await pause("request")
+        store = stores[request.path_params["store_id"]]
+        body = await request.json()
+        store["file_ids"].extend(body.get("file_ids", []))
+        store["indexed_at"] = time.time() + latency["indexing"]
+        view = store_view(store)
+        return JSONResponse({
+            "id": new_id("vsfb"), "object": "vector_store.files_batch", "created_at": int(time.time()),
+            "vector_store_id": store["id"], "status": "in_progress", "file_counts": view["file_counts"],
+        })
+
+    # --- Responses ---
+    def response_body(model: str, text: str, input_chars: int) -> dict:
+        output_tokens = len(text) // 4
+        return {
+            "id": new_id("resp"), "object": "response", "created_at": int(time.time()), "status": "completed",
+            "model": model, "parallel_tool_calls": True, "tool_choice": "auto", "tools": [],
+            "output": [{
+                "type": "message", "id": new_id("msg"), "status": "completed", "role": "assistant",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }],
+            "usage": {
+                "input_tokens": input_chars // 4, "input_tokens_details": {"cached_tokens": 0},
+                "output_tokens": output_tokens, "output_tokens_details": {"reasoning_tokens": 0},
+                "total_tokens": input_chars // 4 + output_tokens,
+            },
+        }
+
+    async def create_response(request):
+        body = await request.json()
+        input_chars = len(json.dumps(body.get("input", "")))
+        structured = (body.get("text") or {}).get("format", {}).get("type") == "json_schema"
+        model = body.get("model", "gpt-5")
+        if body.get("stream"):
+            return StreamingResponse(stream_response(model, input_chars), media_type="text/event-stream")
+        if structured and not body.get("tools"):
+            await pause("structuring")
+            return JSONResponse(response_body(model, json.dumps({"changes": change_list}), input_chars))
+        await pause("comparison")
+        return JSONResponse(response_body(model, json.dumps(change_list), input_chars))
+
+    async def stream_response(model: str, input_chars: int):
+        text = json.dumps({"changes": change_list})
+        chunks = [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)]
+        final = response_body(model, text, input_chars)
+        sequence = itertools.count()
+
+        def event(kind: str, data: dict) -> str:
+            return f"event: {kind}\ndata: {json.dumps({'type': kind, 'sequence_number': next(sequence), **data})}\n\n"
+
+        yield event("response.created", {"response": {**final, "status": "in_progress", "output": []}})
+        for chunk in chunks:
+            await asyncio.sleep(latency["comparison"] / len(chunks))
+            yield event("response.output_text.delta", {
+                "item_id": final["output"][0]["id"], "output_index": 0, "content_index": 0, "delta": chunk, "logprobs": [],
+            })
+        yield event("response.completed", {"response": final})
+
+    return Starlette(routes=[
+        Route("/v1/files", create_file, methods=["POST"]),
+        Route("/v1/files", list_files, methods=["GET"]),
+        Route("/v1/files/{file_id}", retrieve_file, methods=["GET"]),
+        Route("/v1/files/{file_id}", delete_file, methods=["DELETE"]),
+        Route("/v1/vector_stores", create_store, methods=["POST"]),
+        Route("/v1/vector_stores", list_stores, methods=["GET"]),
+        Route("/v1/vector_stores/{store_id}", retrieve_store, methods=["GET"]),
+        Route("/v1/vector_stores/{store_id}", delete_store, methods=["DELETE"]),
+        Route("/v1/vector_stores/{store_id}/file_batches", create_file_batch, methods=["POST"]),
+        Route("/v1/responses", create_response, methods=["POST"]),
+    ])
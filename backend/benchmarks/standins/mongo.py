@@ -0,0 +1,92 @@
+"""
+In-memory MongoDB for the offline benchmarks, built on mongomock.
+
+mongomock does not implement `array_filters`, which every change update uses, so
+`$[name]` paths are resolved here against the matched document before the update
+is applied. Only the filters this backend writes are supported: equality on a
+field of the array element, e.g. {"v.id": "v2"}.
+"""
+import re
+
+import mongomock
+import pymongo
+from pymongo.results import UpdateResult
+
+_PLACEHOLDER = re.compile(r"\$\[(\w+)\]")
+
+
+def _matches(element, conditions: dict) -> bool:
+    return isinstance(element, dict) and all(element.get(field) == value for field, value in conditions.items())
+
+
+def _expand(doc, path: str, filters: dict) -> list:
+    """Concrete dotted paths of `path` in `doc`, with every $[name] replaced by the matching indexes."""
+    paths = [([], doc)]
+    for segment in path.split("."):
+        placeholder = _PLACEHOLDER.fullmatch(segment)
+        expanded = []
+        for parts, node in paths:
+            if placeholder:
+                conditions = filters[placeholder.group(1)]
+                for i, element in enumerate(node if isinstance(node, list) else []):
+                    if _matches(element, conditions):
+                        expanded.append((parts + [str(i)], element))
+            else:
+                child = node[int(segment)] if isinstance(node, list) and segment.isdigit() else (
+                    node.get(segment) if isinstance(node, dict) else None
+                )
+                expanded.append((parts + [segment], child))
+        paths = expanded
+    return [".".join(parts) for parts, _ in paths]
+
+
+def _resolve(doc: dict, update: dict, array_filters: list) -> dict:
+    filters = {}
+    for array_filter in array_filters:
+        for key, value in array_filter.items():
+            name, _, field = key.partition(".")
+            filters.setdefault(name, {})[field] = value
+    resolved = {}
+    for operator, fields in update.items():
+        resolved[operator] = {}
+        for path, value in fields.items():
+            targets = _expand(doc, path, filters) if "$[" in path else [path]
+            for target in targets:
+                resolved[operator][target] = value
+    return {op: fields for op, fields in resolved.items() if fields}
+
+
+class Collection(mongomock.Collection):
+    def update_one(self, filter, update, upsert=False, array_filters=None, **kwargs):
+        if not array_filters:
+            return super().update_one(filter, update, upsert=upsert, **kwargs)
+        doc = self.find_one(filter)
+        resolved = _resolve(doc, update, array_filters) if doc is not None else None
+        if not resolved:
+            # Nothing to change, as Mongo reports it
+            return UpdateResult({"n": int(doc is not None), "nModified": 0}, acknowledged=True)
+        return super().update_one({"_id": doc["_id"]}, resolved, **kwargs)
+
+
+class Database(mongomock.Database):
+    def get_collection(self, name, *args, **kwargs):
+        collection = super().get_collection(name, *args, **kwargs)
+        collection.__class__ = Collection
+        return collection
+
+
+class MongoClient(mongomock.MongoClient):
+    """Accepts and ignores the real client's options (URI, event listeners...)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+
+    def get_database(self, name=None, *args, **kwargs):
+        database = super().get_database(name, *args, **kwargs)
+        database.__class__ = Database
+        return database
+
+
+def install():
+    """Make `pymongo.MongoClient` the in-memory client. Call before anything imports db.mongo."""
+    pymongo.MongoClient = MongoClient
@@ -0,0 +1,417 @@
+"""
+Bulk version import.
+
+Adds new versions to many regulations at once, e.g. after a consolidated release.
+Run from the backend folder:
+
+    python bulk_import.py manifest.csv [--parallel 4] [--batch]
+
+The manifest is a CSV with the columns regulation_id, version and pdf (a path,
+relative to the manifest). Rows for the same regulation are imported in file
+order, each compared with the row before it; different regulations run in
+parallel. With --batch the comparison and structuring LLM calls go through the
+OpenAI Batch API (half price, results within 24h) instead of running online.
+
+Progress is journaled to <manifest>.progress.jsonl. Rerunning the same command
+resumes after a crash: finished rows are skipped and submitted batches are
+picked up again instead of being resubmitted.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from openai.types.responses import ResponseUsage
+from pydantic import BaseModel, ValidationError
+
+from api.analysis import save_version, notify_users
+from db.mongo import regulation_collection
+from llm import batch as batch_api
+from llm.chains import (
+    CHANGE_LIST_FORMAT, ChangeList, analyze_pdfs, comparison_request, number_changes,
+    prepare_vector_store, structure_changes, structuring_input, version_loader,
+)
+from llm.ledger import AnalysisLedger
+from llm.resources import RemoteResources, release_many
+from llm.routing import router
+
+# Vector stores must survive until the comparison batch has run
+BATCH_HOLD_SECONDS = batch_api.BATCH_TIMEOUT
+
+
+class ManifestEntry(BaseModel):
+    regulation_id: str
+    version: str
+    pdf: Path
+    key: str = ""
+
+
+def load_manifest(path: Path) -> list:
+    entries = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            pdf = (path.parent / row["pdf"]).resolve()
+            entry = ManifestEntry(regulation_id=row["regulation_id"].strip(), version=row["version"].strip(), pdf=pdf)
+            # Stable across reruns, and stored on the version so a crash between the
+            # database write and the journal write never imports a row twice
+            digest = hashlib.sha256(pdf.read_bytes()).hexdigest()
+            entry.key = hashlib.sha256(f"{entry.regulation_id}|{entry.version}|{digest}".encode()).hexdigest()[:20]
+            entries.append(entry)
+    return entries
+
+
+def group_by_regulation(entries: list) -> "OrderedDict[str, list]":
+    groups = OrderedDict()
+    for entry in entries:
+        groups.setdefault(entry.regulation_id, []).append(entry)
+    return groups
+
+
+class Journal:
+    """Append-only JSONL log of everything the import did."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.events = []
+        if path.exists():
+            with open(path, encoding="utf-8") as f:
+                self.events = [json.loads(line) for line in f if line.strip()]
+
+    def write(self, event: str, **fields):
+        record = {"event": event, **fields}
+        with self.lock:
+            self.events.append(record)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+
+    def latest(self, event: str, stage: str = None) -> dict:
+        """Last record of `event` (and `stage`) per entry key."""
+        found = {}
+        for record in self.events:
+            if record["event"] == event and (stage is None or record.get("stage") == stage):
+                found[record["key"]] = record
+        return found
+
+    def open_failures(self, stage: str) -> dict:
+        """Last `stage` failure per entry key, except for entries prepared again since."""
+        found = {}
+        for record in self.events:
+            if record["event"] == "failed" and record.get("stage") == stage:
+                found[record["key"]] = record
+            elif record["event"] == "prepared":
+                found.pop(record["key"], None)
+        return found
+
+
+class Progress:
+    def __init__(self, total: int):
+        self.total = total
+        self.finished = 0
+        self.lock = threading.Lock()
+
+    def report(self, entry: ManifestEntry, status: str):
+        with self.lock:
+            self.finished += 1
+            print(f"[{self.finished}/{self.total}] {entry.regulation_id} {entry.version}: {status}")
+
+
+def already_imported(entry: ManifestEntry) -> bool:
+    return regulation_collection.count_documents(
+        {"_id": ObjectId(entry.regulation_id), "versions.importKey": entry.key}, limit=1
+    ) > 0
+
+
+def persist(entry: ManifestEntry, changes: list, ledger: AnalysisLedger, journal: Journal) -> dict:
+    reg_doc = regulation_collection.find_one({"_id": ObjectId(entry.regulation_id)})
+    if not reg_doc:
+        raise ValueError(f"Regulation {entry.regulation_id} not found")
+    new_version = save_version(
+        reg_doc, entry.version, entry.pdf, entry.pdf.name, changes, ledger.to_dict(), {"importKey": entry.key}
+    )
+    journal.write("done", key=entry.key, versionId=new_version["id"])
+    return new_version
+
+
+# -----------------------
+# Online mode
+# -----------------------
+def import_group(group: list, journal: Journal, progress: Progress) -> int:
+    """Import one regulation's rows in order, stopping at the first failure."""
+    done = journal.latest("done")
+    imported = 0
+    for i, entry in enumerate(group):
+        try:
+            if entry.key in done or already_imported(entry):
+                progress.report(entry, "already imported")
+                continue
+            reg_doc = regulation_collection.find_one({"_id": ObjectId(entry.regulation_id)})
+            if not reg_doc:
+                raise ValueError(f"Regulation {entry.regulation_id} not found")
+            ledger = AnalysisLedger()
+            before = reg_doc["versions"][-1]
+            changes = analyze_pdfs(before["s3Key"], entry.pdf, ledger=ledger, before_hash=before.get("contentHash"))
+            new_version = persist(entry, changes, ledger, journal)
+            imported += 1
+            progress.report(entry, f"added as {new_version['id']} with {len(changes)} change(s)")
+        except Exception as e:
+            journal.write("failed", key=entry.key, error=str(e))
+            progress.report(entry, f"failed: {e}")
+            # Later rows of this regulation would be compared with the wrong "before" version
+            for skipped in group[i + 1:]:
+                progress.report(skipped, "skipped after an earlier failure")
+            break
+    return imported
+
+
+def run_online(entries: list, journal: Journal, parallel: int) -> int:
+    groups = group_by_regulation(entries)
+    progress = Progress(len(entries))
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        futures = [pool.submit(import_group, group, journal, progress) for group in groups.values()]
+        return sum(f.result() for f in as_completed(futures))
+
+
+# -----------------------
+# Batch API mode
+# -----------------------
+def _before_loader(entry: ManifestEntry, previous: ManifestEntry):
+    """The "before" PDF is the previous row of the same regulation, or its latest stored version."""
+    if previous is not None:
+        return previous.pdf.read_bytes
+
+    def download():
+        reg_doc = regulation_collection.find_one({"_id": ObjectId(entry.regulation_id)}, {"versions.s3Key": 1, "versions.contentHash": 1})
+        if not reg_doc:
+            raise ValueError(f"Regulation {entry.regulation_id} not found")
+        before = reg_doc["versions"][-1]
+        return version_loader(before["s3Key"], before.get("contentHash"))()
+    return download
+
+
+def _prepare(entry: ManifestEntry, previous: ManifestEntry, journal: Journal):
+    ledger = AnalysisLedger()
+    with RemoteResources(keep=True, ledger=ledger, hold_seconds=BATCH_HOLD_SECONDS) as resources:
+        vector_store_id = prepare_vector_store(resources, _before_loader(entry, previous), entry.pdf.read_bytes(), ledger)
+    journal.write(
+        "prepared", key=entry.key, vectorStoreId=vector_store_id,
+        resources=resources.created, stageSeconds=ledger.to_dict()["stageSeconds"],
+        uploadBytes=ledger.uploaded_bytes(),
+    )
+
+
+def _comparison_request(prepared: dict):
+    route, _ = router.choose("comparison", prepared["uploadBytes"])
+    return route, prepared["uploadBytes"], comparison_request(prepared["vectorStoreId"], route)
+
+
+def _structuring_request(raw_text: str):
+    route, _ = router.choose("structuring", len(raw_text))
+    body = {
+        **route.request_options(),
+        "input": structuring_input(raw_text),
+        "text": CHANGE_LIST_FORMAT,
+    }
+    return route, len(raw_text), body
+
+
+def _run_batch_stage(stage: str, entries: list, build_request, journal: Journal):
+    """
+    Make sure every entry has a `stage` result, resuming open batches before submitting new ones.
+
+    `build_request(entry)` returns the (route, input size, request body) of the entry.
+    """
+    def collect(batch_id, routes):
+        batch = batch_api.wait_for_batch(batch_id)
+        outcome = batch_api.batch_results(batch) if batch.status == "completed" else {}
+        for entry in entries:
+            if entry.key not in outcome:
+                continue
+            item = outcome[entry.key]
+            if "error" in item:
+                journal.write("failed", key=entry.key, stage=stage, error=item["error"])
+            else:
+                journal.write(
+                    "result", key=entry.key, stage=stage, route=routes.get(entry.key),
+                    text=batch_api.output_text(item["body"]), usage=item["body"].get("usage"),
+                )
+        journal.write("batch_done", key=batch_id, stage=stage, status=batch.status)
+
+    finished = journal.latest("batch_done", stage)
+    for batch_id, submitted in journal.latest("batch", stage).items():
+        if batch_id not in finished:
+            print(f"Resuming {stage} batch {batch_id}")
+            collect(batch_id, submitted["routes"])
+
+    results = journal.latest("result", stage)
+    failed = journal.open_failures(stage)
+    missing = [e for e in entries if e.key not in results and e.key not in failed]
+    if missing:
+        requests, routes = {}, {}
+        for entry in missing:
+            route, input_chars, requests[entry.key] = build_request(entry)
+            routes[entry.key] = {"route": route.name, "model": route.model, "effort": route.effort, "inputChars": input_chars}
+        batch_id = batch_api.submit_batch(requests)
+        journal.write("batch", key=batch_id, stage=stage, routes=routes)
+        print(f"Submitted {stage} batch {batch_id} with {len(missing)} request(s)")
+        collect(batch_id, routes)
+
+
+def _compared(journal: Journal) -> set:
+    """Keys of the entries whose latest comparison batch completed, so their vector stores are no longer needed."""
+    finished = journal.latest("batch_done", "comparison")
+    last_batch = {}
+    for batch_id, submitted in journal.latest("batch", "comparison").items():
+        for key in submitted["routes"]:
+            last_batch[key] = batch_id
+    return {key for key, batch_id in last_batch.items() if finished.get(batch_id, {}).get("status") == "completed"}
+
+
+def _release_compared(entries: list, journal: Journal):
+    """
+    Delete the uploads of entries whose comparison has run. Anything else stays
+    on hold for a rerun to resume with, and is left to the janitor after that.
+    """
+    prepared = journal.latest("prepared")
+    released = journal.latest("released")
+    compared = _compared(journal)
+    for entry in entries:
+        record = prepared.get(entry.key)
+        if entry.key not in compared or record is None:
+            continue
+        if released.get(entry.key, {}).get("vectorStoreId") == record["vectorStoreId"]:
+            continue
+        if release_many([tuple(r) for r in record["resources"]], "batch") == len(record["resources"]):
+            journal.write("released", key=entry.key, vectorStoreId=record["vectorStoreId"])
+
+
+def run_batch(entries: list, journal: Journal, parallel: int) -> int:
+    groups = group_by_regulation(entries)
+    done = journal.latest("done")
+    pending, previous_of, rejected = [], {}, {}
+    for group in groups.values():
+        for i, entry in enumerate(group):
+            previous_of[entry.key] = group[i - 1] if i else None
+            try:
+                if entry.key in done or already_imported(entry):
+                    continue
+            except InvalidId as e:
+                journal.write("failed", key=entry.key, stage="manifest", error=str(e))
+                rejected[entry.key] = str(e)
+                continue
+            pending.append(entry)
+
+    # --- Upload and index every pair ---
+    # Entries whose comparison failed since they were prepared are prepared and compared again
+    prepared = journal.latest("prepared")
+    retry = journal.open_failures("comparison")
+    to_prepare = [e for e in pending if e.key not in prepared or e.key in retry]
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        futures = {pool.submit(_prepare, e, previous_of[e.key], journal): e for e in to_prepare}
+        for future in as_completed(futures):
+            entry = futures[future]
+            try:
+                future.result()
+                print(f"Indexed {entry.regulation_id} {entry.version}")
+            except Exception as e:
+                journal.write("failed", key=entry.key, stage="prepare", error=str(e))
+                print(f"Failed to index {entry.regulation_id} {entry.version}: {e}")
+
+    prepared = journal.latest("prepared")
+    ready = [e for e in pending if e.key in prepared]
+
+    # --- LLM stages through the Batch API ---
+    _run_batch_stage(
+        "comparison", ready,
+        lambda e: _comparison_request(prepared[e.key]), journal,
+    )
+    # Vector stores are only needed by the comparison batch
+    _release_compared(ready, journal)
+    comparisons = journal.latest("result", "comparison")
+    _run_batch_stage(
+        "structuring", [e for e in ready if e.key in comparisons],
+        lambda e: _structuring_request(comparisons[e.key]["text"]), journal,
+    )
+
+    # --- Save versions in manifest order ---
+    comparisons = journal.latest("result", "comparison")
+    structured = journal.latest("result", "structuring")
+    progress = Progress(len(entries))
+    failed = journal.latest("failed")
+    pending_keys = {e.key for e in pending}
+    imported = 0
+    for group in groups.values():
+        blocked = False
+        for entry in group:
+            if entry.key in rejected:
+                progress.report(entry, f"failed: {rejected[entry.key]}")
+                blocked = True
+                continue
+            if entry.key not in pending_keys:
+                progress.report(entry, "already imported")
+                continue
+            if blocked:
+                progress.report(entry, "skipped after an earlier failure")
+                continue
+            try:
+                if entry.key not in comparisons:
+                    raise RuntimeError(failed.get(entry.key, {}).get("error", "no comparison result"))
+                ledger = AnalysisLedger()
+                for results in (comparisons, structured):
+                    result = results.get(entry.key)
+                    if result is None:
+                        continue
+                    route = result["route"]
+                    ledger.record_route(result["stage"], route["route"], route["model"], route["effort"], "batch", route["inputChars"])
+                    if result.get("usage"):
+                        ledger.record_usage(result["stage"], route["model"], ResponseUsage.model_validate(result["usage"]), batch=True)
+                try:
+                    change_list = ChangeList.model_validate_json(structured[entry.key]["text"])
+                except (KeyError, ValidationError):
+                    # Structure online instead: strict parsing, with the usual escalation if it still does not validate
+                    change_list = structure_changes(comparisons[entry.key]["text"], ledger)
+                changes = number_changes(change_list)
+                new_version = persist(entry, changes, ledger, journal)
+                imported += 1
+                progress.report(entry, f"added as {new_version['id']} with {len(changes)} change(s)")
+            except Exception as e:
+                journal.write("failed", key=entry.key, stage="save", error=str(e))
+                progress.report(entry, f"failed: {e}")
+                blocked = True
+    return imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add new versions to many regulations from a manifest.")
+    parser.add_argument("manifest", type=Path, help="CSV with regulation_id, version and pdf columns")
+    parser.add_argument("--parallel", type=int, default=4, help="analyses (or uploads, with --batch) run at once")
+    parser.add_argument("--batch", action="store_true", help="run the LLM stages through the OpenAI Batch API")
+    args = parser.parse_args()
+
+    entries = load_manifest(args.manifest)
+    journal = Journal(args.manifest.with_name(args.manifest.name + ".progress.jsonl"))
+    run = run_batch if args.batch else run_online
+    imported = run(entries, journal, args.parallel)
+
+    regulations = len({e.regulation_id for e in entries})
+    print(f"Imported {imported} of {len(entries)} version(s) across {regulations} regulation(s)")
+    # One summary instead of an email per version
+    if imported:
+        notify_users(
+            "Bulk Import Completed",
+            f"{imported} new version(s) have been added across {regulations} regulation(s).",
+        )
+
+
+if __name__ == "__main__":
+    main()
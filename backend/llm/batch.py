@@ -0,0 +1,83 @@
+import json
+from datetime import datetime, timedelta
+
+from llm.client import client
+from llm.governor import governor
+from llm.polling import AdaptivePoller
+from llm.resources import APP_TAG, track, release_many
+
+# The Batch API promises results within this window; anything unfinished after it is expired
+COMPLETION_WINDOW = "24h"
+BATCH_TIMEOUT = 26 * 3600
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def submit_batch(requests: dict, endpoint: str = "/v1/responses") -> str:
+    """Submit {custom_id: request body} as one Batch API job. Returns the batch id."""
+    lines = "\n".join(
+        json.dumps({"custom_id": custom_id, "method": "POST", "url": endpoint, "body": body})
+        for custom_id, body in requests.items()
+    )
+    input_file = governor.call(
+        "batch", "files.create", client.files.create,
+        file=("batch.jsonl", lines.encode("utf-8")), purpose="batch",
+    )
+    track("file", input_file.id, datetime.now() + timedelta(seconds=BATCH_TIMEOUT))
+    # Wrapped because the governor's own `endpoint` parameter would swallow the Batch API's
+    batch = governor.call(
+        "batch", "batches.create",
+        lambda **kw: client.batches.create(
+            input_file_id=input_file.id, endpoint=endpoint,
+            completion_window=COMPLETION_WINDOW, metadata={"app": APP_TAG}, **kw,
+        ),
+    )
+    return batch.id
+
+
+def wait_for_batch(batch_id: str, ledger=None):
+    """Block until the batch reaches a terminal status and return it."""
+    def check():
+        batch = governor.call("batch", "batches.retrieve", client.batches.retrieve, batch_id)
+        return batch.status in TERMINAL_STATUSES, batch
+
+    poller = AdaptivePoller("batch", BATCH_TIMEOUT, ledger, initial=10, factor=1.5, max_interval=120)
+    return poller.wait(check, f"Batch {batch_id} did not finish in time")
+
+
+def batch_results(batch) -> dict:
+    """
+    Map custom_id to {"body": response body} or {"error": message}, then
+    delete the batch's input, output and error files.
+    """
+    results = {}
+    for file_id, is_error in ((batch.output_file_id, False), (batch.error_file_id, True)):
+        if not file_id:
+            continue
+        content = governor.call("batch", "files.content", client.files.content, file_id)
+        for line in content.text.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get("response") or {}
+            if is_error or item.get("error") or response.get("status_code", 200) >= 400:
+                error = item.get("error") or response.get("body", {}).get("error") or "unknown error"
+                results[item["custom_id"]] = {"error": str(error)}
+            else:
+                results[item["custom_id"]] = {"body": response["body"]}
+
+    release_many(
+        [("file", f) for f in (batch.input_file_id, batch.output_file_id, batch.error_file_id) if f],
+        "batch",
+    )
+    return results
+
+
+def output_text(body: dict) -> str:
+    """Equivalent of Response.output_text for a raw Responses API body."""
+    return "".join(
+        part.get("text", "")
+        for item in body.get("output", [])
+        if item.get("type") == "message"
+        for part in item.get("content", [])
+        if part.get("type") == "output_text"
+    )
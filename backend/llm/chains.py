@@ -1,19 +1,29 @@
+import json
 import os
-import io
 import time
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
-from pydantic import BaseModel, Field
-from openai import OpenAI
+import openai
+from pydantic import BaseModel, Field, ValidationError
 from langsmith import traceable
 from services.s3 import s3_client, s3_bucket
+from services import metrics, profiling
+from llm.ledger import AnalysisLedger
+from llm.client import client
+from llm.governor import governor, Deadline, DeadlineExceeded
+from llm.resources import RemoteResources
+from llm.polling import AdaptivePoller
+from llm.routing import Route, router, low_confidence
+from llm import local_index, normalize
 from enum import Enum
 
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-MODEL = "gpt-5"
+# Rough token cost of a comparison call (file_search context plus reasoning and output),
+# used to pace the token bucket before the real usage is known
+COMPARISON_TOKEN_ESTIMATE = int(os.getenv("LLM_COMPARISON_TOKEN_ESTIMATE", 40_000))
 
 SYSTEM_MSG = (
     "You are a legal expert. Compare regulation PDFs to find out what was changed."
@@ -41,37 +51,68 @@ class Change(BaseModel):
 class ChangeList(BaseModel):
     changes: List[Change]
 
+# Responses API `text` parameter asking for a ChangeList directly. Not strict, since
+# strict schemas cannot have optional fields such as `comments`.
+CHANGE_LIST_FORMAT = {
+    "format": {
+        "type": "json_schema",
+        "name": "ChangeList",
+        "schema": ChangeList.model_json_schema(),
+        "strict": False,
+    }
+}
+
 # -----------------------
 # Wait Helpers
 # -----------------------
-def wait_for_file(file_id, timeout=30):
+def wait_for_file(file_id, timeout=30, ledger: AnalysisLedger = None, deadline: Deadline = None):
     """Wait until an uploaded file is fully processed."""
-    start = time.time()
-    while True:
-        file_obj = client.files.retrieve(file_id)
-        if file_obj.status == "processed":
-            break
-        if time.time() - start > timeout:
-            raise TimeoutError(f"File {file_id} not processed in {timeout}s")
-        time.sleep(1)
-
-def wait_for_vector_store_ready(vector_store_id, timeout=120):
+    def check():
+        file_obj = governor.poll("upload", "files.retrieve", client.files.retrieve, file_id, deadline=deadline)
+        if file_obj.status == "error":
+            raise RuntimeError(f"File {file_id} failed processing: {getattr(file_obj, 'status_details', None)}")
+        return file_obj.status == "processed", file_obj
+
+    return AdaptivePoller("upload", timeout, ledger).wait(check, f"File {file_id} not processed in {timeout}s")
+
+def wait_for_vector_store_ready(vector_store_id, timeout=120, ledger: AnalysisLedger = None, deadline: Deadline = None):
     """Wait until all files in the vector store have status 'completed'."""
-    start = time.time()
-    while True:
-        files = client.vector_stores.files.list(vector_store_id=vector_store_id).data
-        if files and all(f.status == "completed" for f in files):
-            break
-        if time.time() - start > timeout:
-            raise TimeoutError("Vector store files not ready in time")
-        time.sleep(2)
+    # A single retrieve reports the counts of every file, instead of listing them one by one
+    def check():
+        store = governor.poll(
+            "indexing", "vector_stores.retrieve", client.vector_stores.retrieve,
+            vector_store_id, deadline=deadline,
+        )
+        counts = store.file_counts
+        if counts.failed or counts.cancelled:
+            raise RuntimeError(f"Vector store {vector_store_id} failed to index {counts.failed + counts.cancelled} file(s)")
+        return counts.total > 0 and counts.in_progress == 0, store
+
+    return AdaptivePoller("indexing", timeout, ledger).wait(check, "Vector store files not ready in time")
+
+def _record_usage(ledger, stage, model, usage):
+    if ledger:
+        ledger.record_usage(stage, model, usage)
+    else:
+        metrics.record_llm_usage(model, stage, usage)
+
+def choose_route(stage: str, input_chars: int, ledger: AnalysisLedger = None, deadline: Deadline = None) -> Route:
+    """Pick the model and reasoning effort of a stage and note the decision in the ledger."""
+    route, reason = router.choose(stage, input_chars, deadline)
+    if ledger:
+        ledger.record_route(stage, route.name, route.model, route.effort, reason, input_chars)
+    return route
+
+def _escalate(stage: str, route: Route, reason: str, input_chars: int, ledger: AnalysisLedger = None, deadline: Deadline = None):
+    escalated = router.escalation(stage, route, deadline)
+    if escalated and ledger:
+        ledger.record_route(stage, escalated.name, escalated.model, escalated.effort, reason, input_chars)
+    return escalated
 
 # -----------------------
 # Comparison
 # -----------------------
-@traceable(run_type="chain")
-def comparison(vectorstore_id):
-    user_msg = """
+COMPARISON_PROMPT = """
 You are a legal expert specializing in regulations and compliance.  
 Your task is to compare two PDFs — a "before" version and an "after" version — and identify **ALL meaningful changes** in the regulatory text.
 
@@ -115,96 +156,451 @@ Rules:
 5. Provide enough context in before_quote and after_quote to understand the change.
 
 """
-    response = client.responses.create(
-        model=MODEL,
-        input=[
+
+def comparison_request(vectorstore_id, route: Route) -> dict:
+    """Body of the file_search comparison call, shared with the Batch API importer."""
+    return {
+        **route.request_options(),
+        "input": [
             {"role": "system", "content": SYSTEM_MSG},
-            {"role": "user", "content": user_msg}
+            {"role": "user", "content": COMPARISON_PROMPT}
         ],
-        tools=[{"type": "file_search", "vector_store_ids": [vectorstore_id]}]
+        "tools": [{"type": "file_search", "vector_store_ids": [vectorstore_id]}],
+    }
+
+@traceable(run_type="chain")
+def comparison(vectorstore_id, route: Route, ledger: AnalysisLedger = None, deadline: Deadline = None):
+    start = time.perf_counter()
+    response = governor.call(
+        "comparison", "responses.create", client.responses.create,
+        **comparison_request(vectorstore_id, route),
+        estimated_tokens=COMPARISON_TOKEN_ESTIMATE,
+        deadline=deadline,
     )
+    router.observe("comparison", route, time.perf_counter() - start)
+    _record_usage(ledger, "comparison", route.model, response.usage)
     return response.output_text
 
-# -----------------------
-# Structuring step (parse)
-# -----------------------
-@traceable(run_type="chain")
-def structure_changes(raw_text: str) -> ChangeList:
-    """Convert raw LLM text output into a validated ChangeList using structured parsing."""
-    response = client.responses.parse(
-        model=MODEL,
-        input=[
-            {
-                "role": "system",
-                "content": (
-                    "You are a data formatter. Convert the following text into valid JSON "
-                    "matching the ChangeList schema. Ensure the result strictly follows the schema. The status field must be exactly one of: 'relevant', 'not-relevant'. Any other value is invalid."
-                ),
-            },
-            {"role": "user", "content": raw_text},
+def comparison_local_request(passages_text: str, route: Route) -> dict:
+    """Same comparison as `comparison_request`, over passages picked by the local index instead of file_search."""
+    return {
+        **route.request_options(),
+        "input": [
+            {"role": "system", "content": SYSTEM_MSG},
+            {"role": "user", "content": (
+                COMPARISON_PROMPT
+                + "\nThe passages below are the parts of the two versions that differ, "
+                "each labelled with its page number. Base your answer on them.\n\n"
+                + passages_text
+            )},
         ],
-        text_format=ChangeList
+    }
+
+def local_token_estimate(passages_text: str) -> int:
+    return len(passages_text) // 4 + COMPARISON_TOKEN_ESTIMATE // 2
+
+@traceable(run_type="chain")
+def comparison_local(passages_text: str, route: Route, ledger: AnalysisLedger = None, deadline: Deadline = None):
+    start = time.perf_counter()
+    response = governor.call(
+        "comparison", "responses.create", client.responses.create,
+        **comparison_local_request(passages_text, route),
+        estimated_tokens=local_token_estimate(passages_text),
+        deadline=deadline,
     )
-    return response.output_parsed
+    router.observe("comparison", route, time.perf_counter() - start)
+    _record_usage(ledger, "comparison", route.model, response.usage)
+    return response.output_text
 
 # -----------------------
-# Auto-cleanup Helpers
+# Structuring step (parse)
 # -----------------------
-def delete_vector_store(vector_store_id):
+def structuring_input(raw_text: str) -> list:
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You are a data formatter. Convert the following text into valid JSON "
+                "matching the ChangeList schema. Ensure the result strictly follows the schema. The status field must be exactly one of: 'relevant', 'not-relevant'. Any other value is invalid."
+            ),
+        },
+        {"role": "user", "content": raw_text},
+    ]
+
+@traceable(run_type="chain")
+def structure_changes(raw_text: str, ledger: AnalysisLedger = None, deadline: Deadline = None) -> ChangeList:
+    """
+    Convert raw LLM text output into a validated ChangeList using structured parsing.
+
+    Runs on the routed (small) model first and once more on the escalation
+    route if that output does not validate.
+    """
+    route = choose_route("structuring", len(raw_text), ledger, deadline)
     try:
-        client.vector_stores.delete(vector_store_id)
-    except Exception as e:
-        print(f"Failed to delete vector store: {e}")
+        return _parse_changes(raw_text, route, ledger, deadline)
+    except (ValueError, openai.LengthFinishReasonError, openai.ContentFilterFinishReasonError) as e:
+        escalated = _escalate("structuring", route, "validation-failed", len(raw_text), ledger, deadline)
+        if escalated is None:
+            raise
+        print(f"Structuring on {route.model} did not validate, retrying on {escalated.model}: {e}")
+        return _parse_changes(raw_text, escalated, ledger, deadline)
 
-def delete_uploaded_files(file_ids):
-    for fid in file_ids:
-        try:
-            client.files.delete(fid)
-        except Exception as e:
-            print(f"Failed to delete file {fid}: {e}")
+def _parse_changes(raw_text: str, route: Route, ledger: AnalysisLedger, deadline: Deadline) -> ChangeList:
+    start = time.perf_counter()
+    response = governor.call(
+        "structuring", "responses.parse", client.responses.parse,
+        **route.request_options(),
+        input=structuring_input(raw_text),
+        text_format=ChangeList,
+        # Output is roughly the size of the input plus the JSON scaffolding
+        estimated_tokens=2 * len(raw_text) // 4 + 2000,
+        deadline=deadline,
+    )
+    router.observe("structuring", route, time.perf_counter() - start)
+    _record_usage(ledger, "structuring", route.model, response.usage)
+    if response.output_parsed is None:
+        raise ValueError("Structuring returned no parsed output")
+    return response.output_parsed
 
 # -----------------------
 # Main Analysis
 # -----------------------
-def analyze_pdfs(before_key: str, after_path: str, auto_delete=True):
-    # --- Download from S3 ---
-    before_obj = s3_client.get_object(Bucket=s3_bucket, Key=before_key)
-    before_stream = io.BytesIO(before_obj["Body"].read())
-    before_stream.name = "before.pdf"
-    before_upload = client.files.create(file=before_stream, purpose="assistants")
-    wait_for_file(before_upload.id)
-
-    after_file = Path(after_path)
-    with open(after_file, "rb") as f:
-        after_upload = client.files.create(
-            file=("after.pdf", f),  
-            purpose="assistants"
+def upload_file(resources: RemoteResources, name: str, data: bytes, ledger: AnalysisLedger = None, deadline: Deadline = None) -> str:
+    """Upload one file for file_search and wait until it is processed. Returns the file id."""
+    uploaded = resources.create_file(name, data, deadline=deadline)
+    wait_for_file(uploaded.id, ledger=ledger, deadline=deadline)
+    return uploaded.id
+
+def analyze_pdfs(before_key: str, after_path: str, auto_delete=True, ledger: AnalysisLedger = None, before_hash: str = None):
+    """
+    Compare the stored "before" PDF with the uploaded "after" PDF.
+
+    Pass an AnalysisLedger to collect token usage, cost and stage timings.
+    The OpenAI files and vector store are always deleted if the analysis fails,
+    and on success too unless auto_delete is False. With the "before" version's
+    `before_hash` (its contentHash), its stored text is used instead of its PDF.
+    """
+    ledger = ledger or AnalysisLedger()
+    with metrics.analysis():
+        return _run_analysis(before_key, after_path, auto_delete, ledger, before_hash)
+
+def _run_analysis(before_key: str, after_path: str, auto_delete: bool, ledger: AnalysisLedger, before_hash: str = None):
+    if local_index.RETRIEVAL_BACKEND == "local":
+        passages_text = _select_passages(before_key, after_path, ledger, before_hash)
+        if passages_text == "":
+            return []
+        # Scanned PDFs without a text layer give nothing to index, so fall back to file_search
+        if passages_text is not None:
+            return _compare_and_structure(
+                lambda route, deadline: comparison_local(passages_text, route, ledger, deadline),
+                len(passages_text), ledger,
+            )
+
+    with RemoteResources(keep=not auto_delete, ledger=ledger) as resources:
+        return _compare_remotely(resources, before_key, after_path, ledger, before_hash)
+
+def compare_versions(before: dict, after: dict, ledger: AnalysisLedger = None) -> list:
+    """
+    Compare two stored versions of a regulation from their cached texts, without
+    downloading or parsing their PDFs again. Both need a contentHash.
+    """
+    ledger = ledger or AnalysisLedger()
+    with metrics.analysis():
+        return _run_version_comparison(before, after, ledger)
+
+def _run_version_comparison(before: dict, after: dict, ledger: AnalysisLedger) -> list:
+    if local_index.RETRIEVAL_BACKEND == "local":
+        with ledger.stage("indexing"):
+            before_index, after_index = (
+                local_index.index_for(v["contentHash"], lambda v=v: normalize.version_pages(v["s3Key"], v["contentHash"]))
+                for v in (before, after)
+            )
+        passages_text = _changed_passages(before_index, after_index, ledger)
+        if passages_text == "":
+            return []
+        if passages_text is not None:
+            return _compare_and_structure(
+                lambda route, deadline: comparison_local(passages_text, route, ledger, deadline),
+                len(passages_text), ledger,
+            )
+
+    with RemoteResources(ledger=ledger) as resources:
+        after_upload = version_loader(after["s3Key"], after["contentHash"], ledger)()
+        vector_store_id = prepare_vector_store(
+            resources, version_loader(before["s3Key"], before["contentHash"], ledger), after_upload, ledger,
         )
-    wait_for_file(after_upload.id)
+        return _compare_and_structure(
+            lambda route, deadline: comparison(vector_store_id, route, ledger, deadline),
+            ledger.uploaded_bytes(), ledger,
+        )
+
+def version_loader(s3_key: str, digest: str = None, ledger: AnalysisLedger = None):
+    """
+    A `load_before` for prepare_vector_store that reads a stored version: the page
+    texts cached under its content hash when they would be uploaded anyway, else its PDF.
+    """
+    ledger = ledger or AnalysisLedger()
+
+    def load():
+        with ledger.stage("download"):
+            pages = normalize.stored_pages(digest) if digest else None
+            if pages is not None and normalize.uploads_text(pages):
+                return pages
+            return s3_client.get_object(Bucket=s3_bucket, Key=s3_key)["Body"].read()
+    return load
+
+def prepare_vector_store(resources: RemoteResources, load_before, after_bytes: bytes, ledger: AnalysisLedger, on_stage=None) -> str:
+    """
+    Upload both versions and index them in a new vector store. Returns its id.
 
-    uploaded_file_ids = [before_upload.id, after_upload.id]
+    `load_before` returns the "before" PDF bytes, or its already extracted page
+    texts (as does `after_bytes`); it runs concurrently with the "after" upload and
+    the vector store creation. `on_stage` is called with "uploading" and "indexing"
+    as each step starts.
+    """
+    on_stage = on_stage or (lambda stage: None)
+    on_stage("uploading")
+    # Uploads are sent as bytes so a retried request can resend the same body
+    def upload_version(name, load):
+        data = load()
+        # A text rendering is a fraction of the size of a PDF with images, and is indexed faster
+        with ledger.stage("normalize"):
+            if isinstance(data, list):
+                normalized = normalize.normalize_pages(name, data)
+            else:
+                normalized = normalize.normalize_pdf(name, data)
+        if normalized:
+            name, data = normalized
+        ledger.record_upload(len(data))
+        return upload_file(resources, name, data, ledger, deadline)
 
-    # --- Create and populate vector store ---
-    vector_store = client.vector_stores.create(name="knowledge_base")
-    client.vector_stores.files.create(vector_store_id=vector_store.id, file_id=before_upload.id)
-    client.vector_stores.files.create(vector_store_id=vector_store.id, file_id=after_upload.id)
-    wait_for_vector_store_ready(vector_store.id)
+    with ledger.stage("upload"), ThreadPoolExecutor(max_workers=3) as pool:
+        deadline = Deadline.for_stage("upload")
+        store_future = pool.submit(profiling.carry(resources.create_vector_store), deadline)
+        before_future = pool.submit(profiling.carry(upload_version), "before.pdf", load_before)
+        after_future = pool.submit(profiling.carry(upload_version), "after.pdf", lambda: after_bytes)
+        uploaded_file_ids = [before_future.result(), after_future.result()]
+        vector_store = store_future.result()
+
+    on_stage("indexing")
+    with ledger.stage("indexing"):
+        deadline = Deadline.for_stage("indexing")
+        governor.call(
+            "indexing", "vector_stores.file_batches.create", client.vector_stores.file_batches.create,
+            vector_store_id=vector_store.id, file_ids=uploaded_file_ids, deadline=deadline,
+        )
+        wait_for_vector_store_ready(vector_store.id, ledger=ledger, deadline=deadline)
+    return vector_store.id
+
+def _compare_remotely(resources: RemoteResources, before_key: str, after_path: str, ledger: AnalysisLedger, before_hash: str = None):
+    # --- Upload and index both versions ---
+    vector_store_id = prepare_vector_store(resources, version_loader(before_key, before_hash, ledger), Path(after_path).read_bytes(), ledger)
 
     # --- Run comparison ---
-    raw_output = comparison(vector_store.id)
+    # Uploaded bytes stand in for the document size; with normalization they are the text itself
+    return _compare_and_structure(
+        lambda route, deadline: comparison(vector_store_id, route, ledger, deadline),
+        ledger.uploaded_bytes(), ledger,
+    )
+
+def _compare_and_structure(run_comparison, input_chars: int, ledger: AnalysisLedger) -> list:
+    """
+    Run the comparison on its routed model and structure the result. If the
+    changes look unsure, repeat both once on the comparison escalation route.
+    """
+    deadline = Deadline.for_stage("comparison")
+    route = choose_route("comparison", input_chars, ledger, deadline)
+    with ledger.stage("comparison"):
+        raw_output = run_comparison(route, deadline)
+    changes = _structure(raw_output, ledger)
+
+    if low_confidence(changes):
+        escalated = _escalate("comparison", route, "low-confidence", input_chars, ledger, deadline)
+        if escalated:
+            with ledger.stage("comparison"):
+                raw_output = run_comparison(escalated, deadline)
+            changes = _structure(raw_output, ledger)
+    return changes
+
+def _select_passages(before_key: str, after_path: str, ledger: AnalysisLedger, before_hash: str = None):
+    """Changed passages as prompt text, an empty string when none differ, or None if either PDF has no text."""
+    with ledger.stage("download"):
+        # With its hash, the "before" index (or its stored text) is found without the PDF
+        before_bytes = None if before_hash else s3_client.get_object(Bucket=s3_bucket, Key=before_key)["Body"].read()
+        after_bytes = Path(after_path).read_bytes()
 
+    # Each index is built once per PDF and reused by every later comparison
+    with ledger.stage("indexing"):
+        if before_bytes is None:
+            before_index = local_index.index_for(before_hash, lambda: normalize.version_pages(before_key, before_hash))
+        else:
+            before_index = local_index.get_or_build_index(before_bytes)
+        after_index = local_index.get_or_build_index(after_bytes)
+    return _changed_passages(before_index, after_index, ledger)
+
+def _changed_passages(before_index, after_index, ledger: AnalysisLedger):
+    if not len(before_index) or not len(after_index):
+        ledger.record_retrieval("remote", reason="no-text")
+        return None
+
+    passages = local_index.select_changed_passages(before_index, after_index)
+    if len(passages) > local_index.MAX_PASSAGES:
+        # Leaving some out would silently drop changes from the analysis
+        print(f"{len(passages)} changed passages exceed {local_index.MAX_PASSAGES}, falling back to file_search")
+        ledger.record_retrieval("remote", len(passages), reason="too-many-passages")
+        return None
+    ledger.record_retrieval("local", len(passages))
+    if not passages:
+        return ""
+    return local_index.format_passages(passages)
+
+def _structure(raw_output: str, ledger: AnalysisLedger) -> list:
     # --- Structure into Pydantic object ---
-    structured = structure_changes(raw_output)
+    with ledger.stage("structuring"):
+        structured = structure_changes(raw_output, ledger=ledger, deadline=Deadline.for_stage("structuring"))
+
+    return number_changes(structured)
 
+def number_changes(structured: ChangeList) -> list:
     changes_list = []
     for idx, change in enumerate(structured.changes, start=1):
         change.id = f"change-{idx}"          # assign sequential IDs
         change.comments = []                 # ensure comments field exists
         changes_list.append(change.model_dump())  # convert Pydantic model → dict
+    return changes_list
+
+# -----------------------
+# Streaming Analysis
+# -----------------------
+class ChangeStreamParser:
+    """
+    Incrementally cut a streamed ChangeList JSON document into its change objects.
+
+    Feed it text deltas; every change object whose closing brace has arrived is
+    returned as a dict, without waiting for the rest of the document.
+    """
 
-    # --- Cleanup ---
-    if auto_delete:
-        delete_vector_store(vector_store.id)
-        delete_uploaded_files(uploaded_file_ids)
+    def __init__(self):
+        self.buffer = []
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.capturing = False
 
-    return changes_list
\ No newline at end of file
+    def feed(self, delta: str) -> list:
+        completed = []
+        for char in delta:
+            if self.capturing:
+                self.buffer.append(char)
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                # {"changes": [ {...}, ... ]} puts every change at depth 2
+                if char == "{" and self.depth == 2:
+                    self.capturing = True
+                    self.buffer = ["{"]
+                self.depth += 1
+            elif char in "}]":
+                self.depth -= 1
+                if char == "}" and self.depth == 2 and self.capturing:
+                    try:
+                        completed.append(json.loads("".join(self.buffer)))
+                    except json.JSONDecodeError as e:
+                        print(f"Skipping unparsable streamed change: {e}")
+                    self.capturing = False
+                    self.buffer = []
+        return completed
+
+def stream_changes(build_request, input_chars: int, estimated_tokens: int, ledger: AnalysisLedger, on_change) -> int:
+    """
+    Run the comparison request `build_request(route)` with structured output in
+    streaming mode, calling `on_change(change dict)` for every change as soon as
+    it validates. Returns the number of changes emitted.
+
+    Changes are already delivered, so there is no low-confidence escalation here.
+    """
+    deadline = Deadline.for_stage("comparison")
+    route = choose_route("comparison", input_chars, ledger, deadline)
+    start = time.perf_counter()
+    parser = ChangeStreamParser()
+    emitted = skipped = 0
+    # The LLM slot is held until the stream is read; retries cover opening it, an interrupted stream fails the analysis
+    with governor.stream(
+        "comparison", "responses.create", client.responses.create,
+        **build_request(route), text=CHANGE_LIST_FORMAT, stream=True,
+        estimated_tokens=estimated_tokens, deadline=deadline,
+    ) as stream:
+        for event in stream:
+            if deadline.remaining() <= 0:
+                raise DeadlineExceeded("Comparison stream did not finish before the stage deadline")
+            if event.type == "response.output_text.delta":
+                for item in parser.feed(event.delta):
+                    try:
+                        change = Change.model_validate(item)
+                    except ValidationError as e:
+                        skipped += 1
+                        print(f"Skipping invalid streamed change ({e.error_count()} validation errors)")
+                        continue
+                    emitted += 1
+                    change.id = f"change-{emitted}"
+                    change.comments = []
+                    if emitted == 1:
+                        ledger.record_milestone("firstChange")
+                    on_change(change.model_dump())
+            elif event.type == "response.completed":
+                usage = event.response.usage
+                router.observe("comparison", route, time.perf_counter() - start)
+                _record_usage(ledger, "comparison", route.model, usage)
+                governor.settle(usage, estimated_tokens)
+            elif event.type in ("response.failed", "response.incomplete"):
+                raise RuntimeError(f"Comparison stream ended with {event.type}")
+            elif event.type == "error":
+                raise RuntimeError(f"Comparison stream failed: {event.message}")
+    if skipped:
+        print(f"Skipped {skipped} streamed change(s) that did not match the schema")
+    return emitted
+
+def analyze_pdfs_streaming(before_key: str, after_path: str, on_stage, on_change, ledger: AnalysisLedger = None, before_hash: str = None) -> int:
+    """
+    Streaming variant of `analyze_pdfs`.
+
+    Comparison and structuring are a single streamed call with a ChangeList
+    output format, so every change reaches `on_change` as soon as the model has
+    written it. `on_stage` is called with "uploading", "indexing" and "comparing".
+    Returns the number of changes.
+    """
+    ledger = ledger or AnalysisLedger()
+    with metrics.analysis():
+        return _run_streaming_analysis(before_key, after_path, on_stage, on_change, ledger, before_hash)
+
+def _run_streaming_analysis(before_key: str, after_path: str, on_stage, on_change, ledger: AnalysisLedger, before_hash: str = None) -> int:
+    if local_index.RETRIEVAL_BACKEND == "local":
+        on_stage("indexing")
+        passages_text = _select_passages(before_key, after_path, ledger, before_hash)
+        if passages_text == "":
+            return 0
+        if passages_text is not None:
+            on_stage("comparing")
+            with ledger.stage("comparison"):
+                return stream_changes(
+                    lambda route: comparison_local_request(passages_text, route),
+                    len(passages_text), local_token_estimate(passages_text), ledger, on_change,
+                )
+
+    with RemoteResources(ledger=ledger) as resources:
+        vector_store_id = prepare_vector_store(
+            resources, version_loader(before_key, before_hash, ledger), Path(after_path).read_bytes(), ledger, on_stage,
+        )
+        on_stage("comparing")
+        with ledger.stage("comparison"):
+            return stream_changes(
+                lambda route: comparison_request(vector_store_id, route),
+                ledger.uploaded_bytes(), COMPARISON_TOKEN_ESTIMATE, ledger, on_change,
+            )
@@ -0,0 +1,13 @@
+import os
+
+import httpx
+from openai import OpenAI
+
+from llm.governor import REQUEST_TIMEOUT
+
+# Retries are handled by the governor, so the SDK's own retry loop is disabled
+client = OpenAI(
+    api_key=os.environ.get("OPENAI_API_KEY"),
+    timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=10.0),
+    max_retries=0,
+)
@@ -0,0 +1,275 @@
+import email.utils
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+import openai
+
+from services import metrics, profiling
+
+# The limits below are for the whole service. Each process enforces its share of them:
+# serve.py sets LLM_PROCESSES to its worker count before the app is imported.
+PROCESSES = max(int(os.getenv("LLM_PROCESSES", 1)), 1)
+MAX_CONCURRENCY = max(int(os.getenv("LLM_MAX_CONCURRENCY", 8)) // PROCESSES, 1)
+REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", 300)) / PROCESSES
+TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", 400_000)) / PROCESSES
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 6))
+BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", 1))
+BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", 60))
+REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", 300))
+# Fire a duplicate of an idempotent status poll when the first one is slower than this. 0 disables hedging.
+HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER_SECONDS", 0))
+
+# Wall-clock budget of each analysis stage, including queueing and retries
+STAGE_DEADLINES = {
+    "upload": float(os.getenv("LLM_UPLOAD_DEADLINE_SECONDS", 120)),
+    "indexing": float(os.getenv("LLM_INDEXING_DEADLINE_SECONDS", 180)),
+    "comparison": float(os.getenv("LLM_COMPARISON_DEADLINE_SECONDS", 900)),
+    "structuring": float(os.getenv("LLM_STRUCTURING_DEADLINE_SECONDS", 300)),
+}
+
+# 409 is left out: a conflict (e.g. a file attached twice) fails the same way when repeated
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class LLMUnavailable(Exception):
+    """Raised when retries are exhausted on rate limits or transient errors."""
+
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Deadline:
+    """Absolute point in time a stage must finish by."""
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    @classmethod
+    def for_stage(cls, stage: str):
+        return cls(STAGE_DEADLINES.get(stage, REQUEST_TIMEOUT))
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `rate_per_minute`."""
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float, deadline: Deadline = None) -> float:
+        """Take `amount` from the bucket, waiting for it to refill. Returns what was taken."""
+        # Requests bigger than the bucket would wait forever, so clamp them
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return amount
+                wait_for = (amount - self.level) / self.rate
+            if deadline and deadline.remaining() < wait_for:
+                raise DeadlineExceeded("Rate limit budget would outlast the stage deadline")
+            time.sleep(min(wait_for, 1.0))
+
+    def adjust(self, amount: float):
+        """Debit (positive) or credit (negative) the bucket after the real usage is known."""
+        with self.lock:
+            self._refill()
+            self.level = min(self.capacity, self.level - amount)
+
+
+def parse_retry_after(headers) -> float:
+    """Seconds to wait according to the rate-limit headers of a response, or None."""
+    if headers is None:
+        return None
+    try:
+        return float(headers.get("retry-after-ms")) / 1000
+    except (TypeError, ValueError):
+        pass
+    retry_after = headers.get("retry-after")
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        pass
+    if retry_after:
+        parsed = email.utils.parsedate_tz(retry_after)
+        if parsed:
+            return max(email.utils.mktime_tz(parsed) - time.time(), 0.0)
+    # OpenAI also reports when each limit resets, e.g. "1s", "6m0s" or "250ms"
+    resets = [_parse_duration(headers.get(h)) for h in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")]
+    resets = [r for r in resets if r is not None]
+    return max(resets) if resets else None
+
+
+def _parse_duration(value: str) -> float:
+    if not value:
+        return None
+    parts = re.findall(r"([\d.]+)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    scale = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    return sum(float(n) * scale[unit] for n, unit in parts)
+
+
+class LLMGovernor:
+    """
+    Process-wide limiter in front of every OpenAI call.
+
+    Bounds concurrency, paces requests and tokens with token buckets, retries
+    429/5xx/timeouts with exponential backoff and full jitter (honouring
+    retry-after headers), and enforces per-stage deadlines.
+    """
+
+    def __init__(self):
+        self.slots = threading.BoundedSemaphore(MAX_CONCURRENCY)
+        self.requests = TokenBucket(REQUESTS_PER_MINUTE)
+        self.tokens = TokenBucket(TOKENS_PER_MINUTE)
+        self.hedge_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="llm-hedge")
+
+    def _admit(self, estimated_tokens: int, deadline: Deadline) -> float:
+        """Wait for the budget and a free slot. Returns the tokens taken from the token bucket."""
+        start = time.perf_counter()
+        self.requests.acquire(1, deadline)
+        spent = 0
+        try:
+            if estimated_tokens:
+                spent = self.tokens.acquire(estimated_tokens, deadline)
+            timeout = deadline.remaining() if deadline else None
+            if timeout is not None and timeout <= 0:
+                raise DeadlineExceeded("Stage deadline reached before the call could start")
+            if not self.slots.acquire(timeout=timeout):
+                raise DeadlineExceeded("No free LLM slot before the stage deadline")
+        except DeadlineExceeded:
+            # Nothing was sent, so give the budget back to the other callers
+            self.requests.adjust(-1)
+            if spent:
+                self.tokens.adjust(-spent)
+            raise
+        waited = time.perf_counter() - start
+        metrics.LLM_QUEUE.observe(waited)
+        profiling.record_span("llm-queue", "admit", waited)
+        return spent
+
+    def call(self, stage: str, endpoint: str, fn, *args, estimated_tokens: int = 0, deadline: Deadline = None, **kwargs):
+        """Call `fn(*args, **kwargs)` through the limiter and retry policy."""
+        result = self._attempt(stage, endpoint, fn, args, kwargs, estimated_tokens, deadline, hold=False)
+        self.settle(getattr(result, "usage", None), estimated_tokens)
+        return result
+
+    @contextmanager
+    def stream(self, stage: str, endpoint: str, fn, *args, estimated_tokens: int = 0, deadline: Deadline = None, **kwargs):
+        """
+        Open a streaming response with `fn(*args, **kwargs)` like `call`, and keep
+        its slot until the block has read and closed the stream. Retries only cover
+        opening it. Report the usage of the final event with `settle`.
+        """
+        stream = self._attempt(stage, endpoint, fn, args, kwargs, estimated_tokens, deadline, hold=True)
+        try:
+            with stream:
+                yield stream
+        finally:
+            self.slots.release()
+
+    def settle(self, usage, estimated_tokens: int):
+        """Correct the token bucket by the difference between the real usage of a call and its estimate."""
+        if usage is not None and estimated_tokens:
+            spent = min(estimated_tokens, self.tokens.capacity)
+            self.tokens.adjust((usage.input_tokens or 0) + (usage.output_tokens or 0) - spent)
+
+    def _attempt(self, stage: str, endpoint: str, fn, args, kwargs, estimated_tokens: int, deadline: Deadline, hold: bool):
+        """Run `fn` until it succeeds or may not be retried. With `hold`, the caller releases the slot of the success."""
+        attempt = 0
+        while True:
+            spent = self._admit(estimated_tokens, deadline)
+            timeout = REQUEST_TIMEOUT
+            if deadline:
+                timeout = min(timeout, max(deadline.remaining(), 1.0))
+            try:
+                with metrics.llm_call(stage, endpoint):
+                    result = fn(*args, timeout=timeout, **kwargs)
+            except Exception as e:
+                error = e
+            else:
+                error = None
+            if error is not None or not hold:
+                self.slots.release()
+
+            if error is None:
+                return result
+            # A failed call reports no usage to settle against: return its estimate so that
+            # the retry takes it once more instead of on top
+            if spent:
+                self.tokens.adjust(-spent)
+
+            retry_after, reason = self._classify(error)
+            if reason is None:
+                raise error
+            attempt += 1
+            if attempt > MAX_RETRIES:
+                raise LLMUnavailable(f"{endpoint} failed after {MAX_RETRIES} retries: {error}", retry_after) from error
+            delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            if deadline and deadline.remaining() < delay:
+                raise LLMUnavailable(f"{endpoint} could not be retried before the {stage} deadline: {error}", retry_after) from error
+            metrics.LLM_RETRIES.labels(stage, reason).inc()
+            time.sleep(delay)
+
+    def poll(self, stage: str, endpoint: str, fn, *args, deadline: Deadline = None, **kwargs):
+        """Like `call`, for idempotent status reads; hedged when LLM_HEDGE_AFTER_SECONDS is set."""
+        if HEDGE_AFTER <= 0:
+            return self.call(stage, endpoint, fn, *args, deadline=deadline, **kwargs)
+
+        def attempt():
+            return self.call(stage, endpoint, fn, *args, deadline=deadline, **kwargs)
+
+        first = self.hedge_pool.submit(attempt)
+        done, _ = wait([first], timeout=HEDGE_AFTER)
+        if done:
+            return first.result()
+        metrics.LLM_HEDGES.labels(stage).inc()
+        second = self.hedge_pool.submit(attempt)
+        done, pending = wait([first, second], return_when=FIRST_COMPLETED)
+        winner = done.pop()
+        # Only fall back to the slower request if the faster one failed
+        if winner.exception() is not None and pending:
+            return pending.pop().result()
+        return winner.result()
+
+    @staticmethod
+    def _classify(error):
+        """Return (retry_after, reason) for retryable errors, (None, None) otherwise."""
+        if isinstance(error, openai.APITimeoutError):
+            return None, "timeout"
+        if isinstance(error, openai.APIConnectionError):
+            return None, "connection"
+        if isinstance(error, openai.RateLimitError) and error.code == "insufficient_quota":
+            return None, None
+        if isinstance(error, openai.APIStatusError) and error.status_code in RETRYABLE_STATUS:
+            reason = "rate_limit" if error.status_code == 429 else f"http_{error.status_code}"
+            return parse_retry_after(error.response.headers), reason
+        return None, None
+
+
+governor = LLMGovernor()
@@ -0,0 +1,148 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from services import metrics
+
+# USD per 1M tokens: (input, cached input, output). Reasoning tokens are billed as output.
+PRICING = {
+    "gpt-5": (1.25, 0.125, 10.00),
+    "gpt-5-mini": (0.25, 0.025, 2.00),
+    "gpt-5-nano": (0.05, 0.005, 0.40),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+}
+
+# Batch API requests are billed at half price
+BATCH_DISCOUNT = 0.5
+
+def estimate_cost(model: str, input_tokens: int, cached_tokens: int, output_tokens: int, batch: bool = False) -> float:
+    """Estimated USD cost of one call, 0.0 for models missing from PRICING."""
+    price_in, price_cached, price_out = PRICING.get(model, (0.0, 0.0, 0.0))
+    uncached = max(input_tokens - cached_tokens, 0)
+    cost = (uncached * price_in + cached_tokens * price_cached + output_tokens * price_out) / 1_000_000
+    return cost * BATCH_DISCOUNT if batch else cost
+
+
+class AnalysisLedger:
+    """
+    Collects token usage, cost, stage timings and polling counts for one analysis.
+
+    Stored as the "analysis" field of the version it produced. Safe to share
+    between the threads of a single analysis.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self.calls = []
+        self.stages = {}
+        self.polls = {}
+        self.poll_waits = {}
+        self.milestones = {}
+        self.routes = []
+        self.retrieval = None
+        self.upload_bytes = 0
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a stage, adding to both this ledger and the Prometheus histogram."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.ANALYSIS_STAGE_LATENCY.labels(name).observe(elapsed)
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def record_poll(self, stage: str):
+        metrics.ANALYSIS_POLLS.labels(stage).inc()
+        with self._lock:
+            self.polls[stage] = self.polls.get(stage, 0) + 1
+
+    def record_wait(self, stage: str, seconds: float):
+        """Record time spent sleeping between readiness checks."""
+        metrics.ANALYSIS_POLL_WAIT.labels(stage).inc(seconds)
+        with self._lock:
+            self.poll_waits[stage] = self.poll_waits.get(stage, 0.0) + seconds
+
+    def record_milestone(self, name: str):
+        """Remember how far into the analysis something first happened, e.g. the first streamed change."""
+        with self._lock:
+            self.milestones.setdefault(name, time.perf_counter() - self._start)
+
+    def record_upload(self, size: int):
+        with self._lock:
+            self.upload_bytes += size
+
+    def uploaded_bytes(self) -> int:
+        with self._lock:
+            return self.upload_bytes
+
+    def record_route(self, stage: str, route: str, model: str, effort: str, reason: str, input_chars: int):
+        """Record which model route a stage took and why, to tune the routing rules from data."""
+        with self._lock:
+            self.routes.append({
+                "stage": stage,
+                "route": route,
+                "model": model,
+                "effort": effort,
+                "reason": reason,
+                "inputChars": input_chars,
+            })
+
+    def record_retrieval(self, backend: str, changed_passages: int = None, reason: str = None):
+        """Record whether the local passage selection was used, or why the analysis fell back to file_search."""
+        with self._lock:
+            self.retrieval = {"backend": backend, "changedPassages": changed_passages, "reason": reason}
+
+    def record_usage(self, stage: str, model: str, usage, batch: bool = False):
+        """Record the usage block of a Responses API call."""
+        metrics.record_llm_usage(model, stage, usage)
+        if usage is None:
+            return
+        input_details = getattr(usage, "input_tokens_details", None)
+        output_details = getattr(usage, "output_tokens_details", None)
+        call = {
+            "stage": stage,
+            "model": model,
+            "inputTokens": usage.input_tokens or 0,
+            "cachedTokens": (input_details.cached_tokens or 0) if input_details else 0,
+            "outputTokens": usage.output_tokens or 0,
+            "reasoningTokens": (output_details.reasoning_tokens or 0) if output_details else 0,
+        }
+        call["costUsd"] = estimate_cost(model, call["inputTokens"], call["cachedTokens"], call["outputTokens"], batch)
+        if batch:
+            call["batch"] = True
+        with self._lock:
+            self.calls.append(call)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            calls = list(self.calls)
+            stages = dict(self.stages)
+            polls = dict(self.polls)
+            poll_waits = dict(self.poll_waits)
+            milestones = dict(self.milestones)
+            routes = list(self.routes)
+            retrieval = self.retrieval
+            upload_bytes = self.upload_bytes
+        totals = {
+            key: sum(c[key] for c in calls)
+            for key in ("inputTokens", "cachedTokens", "outputTokens", "reasoningTokens")
+        }
+        return {
+            "models": sorted({c["model"] for c in calls}),
+            **totals,
+            "costUsd": round(sum(c["costUsd"] for c in calls), 6),
+            "durationSeconds": round(time.perf_counter() - self._start, 3),
+            "stageSeconds": {k: round(v, 3) for k, v in stages.items()},
+            "polls": polls,
+            "pollWaitSeconds": {k: round(v, 3) for k, v in poll_waits.items()},
+            "milestoneSeconds": {k: round(v, 3) for k, v in milestones.items()},
+            "uploadBytes": upload_bytes,
+            "routes": routes,
+            "retrieval": retrieval,
+            "calls": calls,
+        }
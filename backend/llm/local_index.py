@@ -0,0 +1,220 @@
+import difflib
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from llm.normalize import content_hash, load_pages
+from services import metrics
+
+# "remote" uses OpenAI vector stores per analysis, "local" uses the on-disk index below
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "remote")
+# Folder holding an ONNX sentence-embedding model (model.onnx) and its tokenizer.json,
+# e.g. an export of sentence-transformers/all-MiniLM-L6-v2
+EMBED_MODEL_DIR = Path(os.getenv("LOCAL_EMBED_MODEL_DIR", "models/all-MiniLM-L6-v2"))
+INDEX_DIR = Path(os.getenv("LOCAL_INDEX_DIR", "indexes"))
+
+CHUNK_CHARS = 1200
+CHUNK_OVERLAP = 200
+MAX_TOKENS = 256
+BATCH_SIZE = 32
+# More changed passages than this do not fit one prompt; the analysis then uses file_search
+MAX_PASSAGES = 60
+
+
+# -----------------------
+# Chunking
+# -----------------------
+def chunk_pages(pages: List[str]) -> List[dict]:
+    """Split page texts into overlapping chunks that remember their page number."""
+    chunks = []
+    for page_number, text in enumerate(pages, start=1):
+        text = " ".join(text.split())
+        start = 0
+        while start < len(text):
+            end = min(start + CHUNK_CHARS, len(text))
+            # Prefer to cut at a sentence or word boundary
+            if end < len(text):
+                cut = max(text.rfind(". ", start, end), text.rfind(" ", start, end))
+                if cut > start + CHUNK_CHARS // 2:
+                    end = cut + 1
+            chunks.append({"page": page_number, "text": text[start:end].strip()})
+            if end == len(text):
+                break
+            start = end - CHUNK_OVERLAP
+    return chunks
+
+
+# -----------------------
+# Embeddings
+# -----------------------
+class Embedder:
+    """Mean-pooled, L2-normalised sentence embeddings from an ONNX model."""
+
+    def __init__(self, model_dir: Path = EMBED_MODEL_DIR):
+        # Imported here so the remote backend does not need the ONNX runtime loaded
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=MAX_TOKENS)
+        self.tokenizer.enable_padding()
+        self.session = onnxruntime.InferenceSession(
+            str(model_dir / "model.onnx"), providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = []
+        for i in range(0, len(texts), BATCH_SIZE):
+            encodings = self.tokenizer.encode_batch(texts[i:i + BATCH_SIZE])
+            ids = np.array([e.ids for e in encodings], dtype=np.int64)
+            mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {"input_ids": ids, "attention_mask": mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.zeros_like(ids)
+            hidden = self.session.run(None, feeds)[0]
+            weights = mask[..., None].astype(np.float32)
+            pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+            vectors.append(pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None))
+        if not vectors:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.vstack(vectors).astype(np.float32)
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+def get_embedder() -> Embedder:
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            _embedder = Embedder()
+        return _embedder
+
+
+# -----------------------
+# Per-version index
+# -----------------------
+class VersionIndex:
+    """Chunks and memory-mapped vectors of one PDF, keyed by its content hash."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.chunks = json.loads((path / "chunks.json").read_text(encoding="utf-8"))
+        self.vectors = np.load(path / "vectors.npy", mmap_mode="r")
+
+    def __len__(self):
+        return len(self.chunks)
+
+
+def get_or_build_index(pdf_bytes: bytes) -> VersionIndex:
+    """Load the index of this PDF, building it on first use. Safe across workers."""
+    return index_for(content_hash(pdf_bytes), lambda: load_pages(pdf_bytes))
+
+
+def index_for(digest: str, pages) -> VersionIndex:
+    """Load the index of the PDF with this content hash, building it from `pages()` on first use."""
+    path = INDEX_DIR / digest
+    if (path / "vectors.npy").exists():
+        metrics.CACHE_LOOKUPS.labels("local_index", "hit").inc()
+        return VersionIndex(path)
+    metrics.CACHE_LOOKUPS.labels("local_index", "miss").inc()
+
+    chunks = chunk_pages(pages())
+    vectors = get_embedder().embed([c["text"] for c in chunks])
+
+    # Build in a private folder, then rename so readers never see a half-written index
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.mkdir(parents=True, exist_ok=True)
+    np.save(tmp / "vectors.npy", vectors)
+    (tmp / "chunks.json").write_text(json.dumps(chunks), encoding="utf-8")
+    try:
+        os.replace(tmp, path)
+    except OSError:
+        # Another worker finished the same index first
+        shutil.rmtree(tmp, ignore_errors=True)
+    return VersionIndex(path)
+
+
+def _edge(chunks: List[dict], i: int) -> tuple:
+    """Whether chunk `i` starts and ends its page, where its boundaries cannot move."""
+    page = chunks[i]["page"]
+    first = i == 0 or chunks[i - 1]["page"] != page
+    last = i == len(chunks) - 1 or chunks[i + 1]["page"] != page
+    return first, last
+
+
+def passage_differs(before: VersionIndex, b: int, after: VersionIndex, a: int) -> bool:
+    """
+    Whether the text of a passage pair differs. Chunks are cut at fixed lengths, so
+    text added or removed earlier on a page shifts where later chunks start and end:
+    differences at the ends of a pair only count at the start or end of the page.
+    """
+    before_words = before.chunks[b]["text"].split()
+    after_words = after.chunks[a]["text"].split()
+    if before_words == after_words:
+        return False
+    before_first, before_last = _edge(before.chunks, b)
+    after_first, after_last = _edge(after.chunks, a)
+    # Inside a page a chunk can start or end in the middle of a word
+    start = 0 if before_first and after_first else 1
+    end = None if before_last and after_last else -1
+    before_words, after_words = before_words[start:end], after_words[start:end]
+    if before_words == after_words:
+        return False
+    opcodes = difflib.SequenceMatcher(None, before_words, after_words, autojunk=False).get_opcodes()
+    if not any(tag == "equal" for tag, *_ in opcodes):
+        return True
+    for i, (tag, *_) in enumerate(opcodes):
+        if tag == "equal":
+            continue
+        if i == 0 and not (before_first and after_first):
+            continue
+        if i == len(opcodes) - 1 and not (before_last and after_last):
+            continue
+        return True
+    return False
+
+
+def select_changed_passages(before: VersionIndex, after: VersionIndex) -> List[dict]:
+    """
+    Pair every passage with its most similar counterpart in the other version and
+    keep the pairs whose text differs, most different first. The embeddings only
+    find the counterpart; even a single changed word makes a pair count.
+    """
+    if not len(before) or not len(after):
+        return []
+    similarity = np.asarray(after.vectors) @ np.asarray(before.vectors).T
+
+    pairs = {}
+    for a, b in enumerate(similarity.argmax(axis=1)):
+        pairs[(int(b), a)] = float(similarity[a, int(b)])
+    for b, a in enumerate(similarity.argmax(axis=0)):
+        pairs[(b, int(a))] = float(similarity[int(a), b])
+
+    passages = []
+    for (b, a), score in sorted(pairs.items(), key=lambda item: item[1]):
+        if passage_differs(before, b, after, a):
+            passages.append({
+                "similarity": round(score, 3),
+                "before": before.chunks[b],
+                "after": after.chunks[a],
+            })
+    return passages
+
+
+def format_passages(passages: List[dict]) -> str:
+    """Render passage pairs as prompt context with page numbers for the citations."""
+    blocks = []
+    for i, p in enumerate(passages, start=1):
+        blocks.append(
+            f"### Passage pair {i} (similarity {p['similarity']})\n"
+            f"[BEFORE, page {p['before']['page']}]\n{p['before']['text']}\n\n"
+            f"[AFTER, page {p['after']['page']}]\n{p['after']['text']}"
+        )
+    return "\n\n".join(blocks)
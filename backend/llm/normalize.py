@@ -0,0 +1,166 @@
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+from typing import List, Optional
+
+import pdfplumber
+import pypdfium2
+from botocore.exceptions import ClientError
+
+from services import metrics
+from services.s3 import s3_client, s3_bucket
+
+# "text" uploads a text-only rendering of each PDF (with page markers) instead of the PDF itself, "off" uploads the PDF
+PDF_NORMALIZATION = os.getenv("PDF_NORMALIZATION", "text")
+# Extracted text is cached in the S3 bucket under this prefix, keyed by PDF content
+TEXT_CACHE_PREFIX = os.getenv("TEXT_CACHE_PREFIX", "text-cache/")
+# Bump when the extraction changes so old cache entries are ignored
+EXTRACTOR_VERSION = 1
+
+# file_search only reads the text layer, so the images of scanned annexes never helped the
+# comparison; below this many characters per page a PDF is treated as having no usable text
+MIN_CHARS_PER_PAGE = 20
+
+# PDFium is not thread-safe
+_pdfium_lock = threading.Lock()
+
+
+# -----------------------
+# Extraction
+# -----------------------
+def _clean(text: str) -> str:
+    lines = [" ".join(line.split()) for line in text.replace("\r", "\n").splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def extract_pages(pdf_bytes: bytes) -> List[str]:
+    """Text of every page, in order. Pages without a text layer come back empty."""
+    try:
+        with _pdfium_lock:
+            pdf = pypdfium2.PdfDocument(pdf_bytes)
+            try:
+                pages = []
+                for page in pdf:
+                    textpage = page.get_textpage()
+                    pages.append(_clean(textpage.get_text_range()))
+                    textpage.close()
+                    page.close()
+                return pages
+            finally:
+                pdf.close()
+    except pypdfium2.PdfiumError:
+        # PDFium is much faster but stricter; pdfplumber still reads some damaged files
+        with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+            return [_clean(page.extract_text() or "") for page in pdf.pages]
+
+
+def has_text(pages: List[str]) -> bool:
+    return sum(len(p) for p in pages) >= MIN_CHARS_PER_PAGE * max(len(pages), 1)
+
+
+def render_pages(pages: List[str]) -> str:
+    """Linear text of the document with a marker before every page, so quotes can cite page numbers."""
+    header = "Page numbers are given by the [Page N] markers.\n\n"
+    return header + "\n\n".join(f"[Page {number}]\n{text}" for number, text in enumerate(pages, start=1))
+
+
+# -----------------------
+# Cache
+# -----------------------
+def content_hash(pdf_bytes: bytes) -> str:
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+def cache_key(digest: str) -> str:
+    return f"{TEXT_CACHE_PREFIX}{digest}.json.gz"
+
+
+def stored_pages(digest: str) -> Optional[List[str]]:
+    """Page texts cached for the PDF with this content hash, or None if there are none."""
+    key = cache_key(digest)
+    try:
+        cached = json.loads(gzip.decompress(s3_client.get_object(Bucket=s3_bucket, Key=key)["Body"].read()))
+        if cached.get("extractorVersion") == EXTRACTOR_VERSION:
+            metrics.CACHE_LOOKUPS.labels("pdf_text", "hit").inc()
+            return cached["pages"]
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+            print(f"Text cache read failed for {key}: {e}")
+    except Exception as e:
+        print(f"Text cache read failed for {key}: {e}")
+    metrics.CACHE_LOOKUPS.labels("pdf_text", "miss").inc()
+    return None
+
+
+def load_pages(pdf_bytes: bytes) -> List[str]:
+    """
+    Page texts of a PDF, extracted once per version and cached in S3.
+
+    A failing cache never fails the analysis, it only costs a re-extraction.
+    """
+    digest = content_hash(pdf_bytes)
+    pages = stored_pages(digest)
+    if pages is not None:
+        return pages
+
+    key = cache_key(digest)
+    pages = extract_pages(pdf_bytes)
+    body = gzip.compress(json.dumps({"extractorVersion": EXTRACTOR_VERSION, "pages": pages}).encode("utf-8"))
+    try:
+        s3_client.put_object(
+            Bucket=s3_bucket, Key=key, Body=body,
+            ContentType="application/json", ContentEncoding="gzip",
+        )
+    except Exception as e:
+        print(f"Text cache write failed for {key}: {e}")
+    return pages
+
+
+def store_text(pdf_bytes: bytes) -> str:
+    """
+    Extract and cache the page texts of a newly uploaded version, so later
+    analyses and comparisons never parse its PDF again. Returns its content hash,
+    stored as the version's contentHash.
+    """
+    try:
+        load_pages(pdf_bytes)
+    except Exception as e:
+        print(f"Text extraction failed, it will be retried on first use: {e}")
+    return content_hash(pdf_bytes)
+
+
+def version_pages(s3_key: str, digest: str = None) -> List[str]:
+    """
+    Page texts of a stored version, from the text cache when its content hash is
+    known. Otherwise (or if the entry is gone) the PDF is downloaded and extracted once more.
+    """
+    if digest:
+        pages = stored_pages(digest)
+        if pages is not None:
+            return pages
+    return load_pages(s3_client.get_object(Bucket=s3_bucket, Key=s3_key)["Body"].read())
+
+
+def uploads_text(pages: List[str]) -> bool:
+    """Whether these pages are uploaded as text instead of their PDF."""
+    return PDF_NORMALIZATION == "text" and has_text(pages)
+
+
+def normalize_pages(name: str, pages: List[str]) -> Optional[tuple]:
+    if not uploads_text(pages):
+        return None
+    return f"{name.rsplit('.', 1)[0]}.txt", render_pages(pages).encode("utf-8")
+
+
+def normalize_pdf(name: str, pdf_bytes: bytes) -> Optional[tuple]:
+    """
+    (file name, bytes) to upload in place of the PDF, or None to upload the PDF
+    as is (normalization disabled, or no usable text layer).
+    """
+    if PDF_NORMALIZATION != "text":
+        return None
+    return normalize_pages(name, load_pages(pdf_bytes))
@@ -0,0 +1,49 @@
+import os
+import time
+
+from llm.governor import LLMUnavailable
+
+# First check comes quickly since small files are often ready almost immediately,
+# then the interval grows geometrically up to a cap
+POLL_INITIAL_INTERVAL = float(os.getenv("POLL_INITIAL_INTERVAL_SECONDS", 0.25))
+POLL_BACKOFF_FACTOR = float(os.getenv("POLL_BACKOFF_FACTOR", 1.6))
+POLL_MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL_SECONDS", 4))
+
+
+class AdaptivePoller:
+    """
+    Calls `check` until it reports readiness, sleeping with capped exponential backoff.
+
+    `check` returns a (done, value) tuple. Every check and every second spent
+    sleeping is reported to the ledger under `stage`.
+    """
+
+    def __init__(self, stage: str, timeout: float, ledger=None,
+                 initial: float = POLL_INITIAL_INTERVAL, factor: float = POLL_BACKOFF_FACTOR,
+                 max_interval: float = POLL_MAX_INTERVAL):
+        self.stage = stage
+        self.timeout = timeout
+        self.ledger = ledger
+        self.initial = initial
+        self.factor = factor
+        self.max_interval = max_interval
+
+    def wait(self, check, timeout_message: str):
+        start = time.monotonic()
+        interval = self.initial
+        while True:
+            done, value = check()
+            if self.ledger:
+                self.ledger.record_poll(self.stage)
+            if done:
+                return value
+
+            elapsed = time.monotonic() - start
+            if elapsed > self.timeout:
+                # OpenAI is slow to process, not broken: answered as 503 so the client retries later
+                raise LLMUnavailable(timeout_message)
+            sleep_for = min(interval, self.timeout - elapsed)
+            time.sleep(sleep_for)
+            if self.ledger:
+                self.ledger.record_wait(self.stage, sleep_for)
+            interval = min(interval * self.factor, self.max_interval)
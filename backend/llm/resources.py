@@ -0,0 +1,254 @@
+import atexit
+import math
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+
+import openai
+from db.mongo import remote_resource_collection
+from llm.client import client
+from llm.governor import governor, Deadline
+from llm.ledger import AnalysisLedger
+from services import metrics, profiling
+from services.leases import acquire_lease
+
+VECTOR_STORE_NAME = "knowledge_base"
+# Vector stores carry it in their metadata; files cannot, so their names start with FILE_PREFIX.
+# That is how the janitor recognises untracked leftovers without touching anything else in the account.
+APP_TAG = "fineprint-finder"
+FILE_PREFIX = f"{APP_TAG}--"
+
+# Anything older than this is considered leaked; keep it well above the longest analysis
+JANITOR_MAX_AGE = float(os.getenv("JANITOR_MAX_AGE_SECONDS", 3600))
+JANITOR_INTERVAL = float(os.getenv("JANITOR_INTERVAL_SECONDS", 900))
+# Server-side expiry as a last line of defence if both the cleanup and the janitor miss something
+FILE_EXPIRY_SECONDS = int(os.getenv("OPENAI_FILE_EXPIRY_SECONDS", 86400))
+
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+_live = set()
+_live_lock = threading.Lock()
+
+
+def _after_fork():
+    # Each worker of a preloaded app (serve.py) owns the resources it creates
+    global OWNER, _live_lock
+    OWNER = f"{socket.gethostname()}:{os.getpid()}"
+    _live.clear()
+    _live_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+DELETERS = {
+    "file": ("files.delete", lambda remote_id, **kw: client.files.delete(remote_id, **kw)),
+    "vector_store": ("vector_stores.delete", lambda remote_id, **kw: client.vector_stores.delete(remote_id, **kw)),
+}
+
+
+# -----------------------
+# Ledger
+# -----------------------
+def track(kind: str, remote_id: str, hold_until: datetime = None):
+    """
+    Record a freshly created remote resource so it can always be found again.
+
+    The janitor leaves it alone until `hold_until`, for resources that must
+    outlive JANITOR_MAX_AGE (e.g. vector stores used by a Batch API job).
+    """
+    metrics.REMOTE_RESOURCES_CREATED.labels(kind).inc()
+    with _live_lock:
+        _live.add((kind, remote_id))
+    remote_resource_collection.insert_one({
+        "kind": kind,
+        "remoteId": remote_id,
+        "owner": OWNER,
+        "createdAt": datetime.now(),
+        "releasedAt": None,
+        "holdUntil": hold_until,
+    })
+
+
+def release(kind: str, remote_id: str, source: str) -> bool:
+    """Delete a remote resource and mark it released. Already-deleted resources count as released."""
+    endpoint, delete = DELETERS[kind]
+    try:
+        governor.call("cleanup", endpoint, delete, remote_id)
+    except openai.NotFoundError:
+        pass
+    except Exception as e:
+        print(f"Failed to delete {kind} {remote_id}: {e}")
+        return False
+
+    metrics.REMOTE_RESOURCES_DELETED.labels(kind, source).inc()
+    with _live_lock:
+        _live.discard((kind, remote_id))
+    remote_resource_collection.update_many(
+        {"kind": kind, "remoteId": remote_id, "releasedAt": None},
+        {"$set": {"releasedAt": datetime.now()}},
+    )
+    return True
+
+
+def release_many(resources, source: str) -> int:
+    """Delete (kind, remote_id) pairs concurrently. Returns how many were released."""
+    resources = list(resources)
+    if not resources:
+        return 0
+    with ThreadPoolExecutor(max_workers=min(8, len(resources))) as pool:
+        return sum(pool.map(profiling.carry(lambda r: release(r[0], r[1], source)), resources))
+
+
+@atexit.register
+def _release_on_exit():
+    with _live_lock:
+        leftovers = list(_live)
+    if leftovers:
+        print(f"Releasing {len(leftovers)} OpenAI resource(s) left by this process")
+        # Sequential: thread pools can no longer be started while the interpreter shuts down
+        for kind, remote_id in leftovers:
+            release(kind, remote_id, "exit")
+
+
+class RemoteResources:
+    """
+    Creates the OpenAI files and vector stores of one analysis and tracks them.
+
+    Everything is deleted on exit. With keep=True resources survive only if the
+    block succeeds, and then also outlive the process; on failure they are
+    always deleted. `hold_seconds` protects
+    kept resources from the janitor for that long.
+    """
+
+    def __init__(self, keep: bool = False, ledger: AnalysisLedger = None, hold_seconds: float = None):
+        self.keep = keep
+        self.ledger = ledger
+        self.hold_until = datetime.now() + timedelta(seconds=hold_seconds) if hold_seconds else None
+        # Server-side expiry must not kick in while the resources are still on hold
+        self.file_expiry = max(FILE_EXPIRY_SECONDS, int(hold_seconds or 0) + 3600)
+        self.vector_store_expiry_days = 1 + math.ceil((hold_seconds or 0) / 86400)
+        self.created = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None or not self.keep:
+            with self.ledger.stage("cleanup") if self.ledger else nullcontext():
+                release_many(self.created, "analysis")
+        else:
+            # Kept resources outlive this process: they are left to their hold and the janitor
+            with _live_lock:
+                _live.difference_update(self.created)
+        return False
+
+    def create_file(self, name: str, data: bytes, deadline: Deadline = None):
+        uploaded = governor.call(
+            "upload", "files.create", client.files.create,
+            file=(f"{FILE_PREFIX}{name}", data), purpose="assistants",
+            expires_after={"anchor": "created_at", "seconds": self.file_expiry},
+            deadline=deadline,
+        )
+        self._track("file", uploaded.id)
+        return uploaded
+
+    def create_vector_store(self, deadline: Deadline = None):
+        store = governor.call(
+            "indexing", "vector_stores.create", client.vector_stores.create,
+            name=VECTOR_STORE_NAME, metadata={"app": APP_TAG},
+            expires_after={"anchor": "last_active_at", "days": self.vector_store_expiry_days},
+            deadline=deadline,
+        )
+        self._track("vector_store", store.id)
+        return store
+
+    def _track(self, kind, remote_id):
+        self.created.append((kind, remote_id))
+        try:
+            track(kind, remote_id, self.hold_until)
+        except Exception as e:
+            # Cleanup on exit still covers it; the janitor's remote sweep covers the rest
+            print(f"Failed to record {kind} {remote_id} in the resource ledger: {e}")
+
+
+# -----------------------
+# Janitor
+# -----------------------
+def _list_all(endpoint: str, fn, **kwargs):
+    after = None
+    while True:
+        page = governor.call("janitor", endpoint, fn, limit=100, **({"after": after} if after else {}), **kwargs)
+        yield from page.data
+        if not page.data or not getattr(page, "has_more", False):
+            return
+        after = page.data[-1].id
+
+
+def run_janitor(max_age: float = JANITOR_MAX_AGE) -> dict:
+    """
+    Delete leaked OpenAI resources older than `max_age` seconds.
+
+    First reconciles the ledger (tracked but never released), then sweeps the
+    account for untracked resources tagged by this app: vector stores with
+    metadata app=APP_TAG and files named FILE_PREFIX*.
+    """
+    start = time.perf_counter()
+    now = datetime.now()
+    cutoff = now - timedelta(seconds=max_age)
+    cutoff_epoch = time.time() - max_age
+
+    held = {
+        (doc["kind"], doc["remoteId"])
+        for doc in remote_resource_collection.find(
+            {"releasedAt": None, "holdUntil": {"$gte": now}}, {"kind": 1, "remoteId": 1}
+        )
+    }
+    stale = {
+        (doc["kind"], doc["remoteId"])
+        for doc in remote_resource_collection.find(
+            {"releasedAt": None, "createdAt": {"$lt": cutoff}}, {"kind": 1, "remoteId": 1}
+        )
+    } - held
+    reconciled = release_many(stale, "janitor")
+
+    orphans = set()
+    for store in _list_all("vector_stores.list", client.vector_stores.list):
+        if (store.metadata or {}).get("app") == APP_TAG and store.created_at < cutoff_epoch:
+            orphans.add(("vector_store", store.id))
+    for file_obj in _list_all("files.list", client.files.list, purpose="assistants"):
+        if (file_obj.filename or "").startswith(FILE_PREFIX) and file_obj.created_at < cutoff_epoch:
+            orphans.add(("file", file_obj.id))
+    orphans -= stale | held
+    swept = release_many(orphans, "janitor")
+
+    metrics.JANITOR_DURATION.observe(time.perf_counter() - start)
+    summary = {"reconciled": reconciled, "stale": len(stale), "swept": swept, "orphans": len(orphans), "held": len(held)}
+    print(f"Resource janitor: {summary}")
+    return summary
+
+
+def start_janitor(interval: float = JANITOR_INTERVAL) -> threading.Event:
+    """Run the janitor in a daemon thread every `interval` seconds. Set the returned event to stop it."""
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            try:
+                if acquire_lease("remote-resource-janitor", interval * 0.9):
+                    run_janitor()
+                    metrics.JANITOR_RUNS.labels("success").inc()
+            except Exception as e:
+                metrics.JANITOR_RUNS.labels("failed").inc()
+                print(f"Resource janitor failed: {e}")
+
+    threading.Thread(target=loop, name="resource-janitor", daemon=True).start()
+    return stop
+
+
+if __name__ == "__main__":
+    # Manual run from the backend folder, with the .env variables exported: python -m llm.resources
+    run_janitor()
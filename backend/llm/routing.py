@@ -0,0 +1,128 @@
+import json
+import os
+import threading
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from llm.governor import Deadline
+from llm.ledger import estimate_cost
+
+# JSON file overriding DEFAULT_ROUTES, same shape
+ROUTES_FILE = os.getenv("LLM_ROUTES_FILE")
+# Re-run the comparison on the escalation route when the mean confidence of its changes is below this. 0 disables it.
+ESCALATE_BELOW_CONFIDENCE = float(os.getenv("LLM_ESCALATE_BELOW_CONFIDENCE", 0.6))
+# Weight of the newest observation in the running latency estimate of a route
+LATENCY_SMOOTHING = 0.3
+
+# Rules are tried in order; the first one whose size limit, cost budget and expected
+# latency all fit is used. Structuring only reformats text, so a small model is enough.
+DEFAULT_ROUTES = {
+    "comparison": {
+        "budget_usd": 2.0,
+        "output_tokens": 12_000,
+        "rules": [
+            {"name": "small-document", "max_chars": 60_000, "model": "gpt-5", "effort": "low", "expected_seconds": 120},
+            {"name": "default", "model": "gpt-5", "effort": "medium", "expected_seconds": 300},
+        ],
+        "escalation": {"name": "escalated", "model": "gpt-5", "effort": "high", "expected_seconds": 600},
+    },
+    "structuring": {
+        "budget_usd": 0.5,
+        "output_tokens": 8_000,
+        "rules": [
+            {"name": "default", "model": "gpt-5-mini", "effort": "minimal", "expected_seconds": 30},
+        ],
+        "escalation": {"name": "escalated", "model": "gpt-5", "effort": "low", "expected_seconds": 90},
+    },
+}
+
+
+class Route(BaseModel):
+    name: str
+    model: str
+    effort: Optional[str] = None
+    max_chars: Optional[int] = None
+    expected_seconds: float = 60.0
+
+    def request_options(self) -> dict:
+        """Model and reasoning parameters of a Responses API call on this route."""
+        options = {"model": self.model}
+        if self.effort:
+            options["reasoning"] = {"effort": self.effort}
+        return options
+
+
+class StagePolicy(BaseModel):
+    rules: List[Route]
+    escalation: Optional[Route] = None
+    budget_usd: Optional[float] = None
+    output_tokens: int = 8_000
+
+
+def load_policies() -> dict:
+    config = DEFAULT_ROUTES
+    if ROUTES_FILE:
+        with open(ROUTES_FILE, encoding="utf-8") as f:
+            config = {**DEFAULT_ROUTES, **json.load(f)}
+    return {stage: StagePolicy.model_validate(policy) for stage, policy in config.items()}
+
+
+class ModelRouter:
+    """
+    Picks the model and reasoning effort of each LLM stage.
+
+    Latency expectations start from the configured `expected_seconds` and follow
+    the latencies observed in this process, so routes that turn out slow are
+    skipped when a stage deadline is short.
+    """
+
+    def __init__(self, policies: dict = None):
+        self.policies = policies or load_policies()
+        self._latency = {}
+        self._lock = threading.Lock()
+
+    def expected_seconds(self, stage: str, route: Route) -> float:
+        with self._lock:
+            return self._latency.get((stage, route.name), route.expected_seconds)
+
+    def observe(self, stage: str, route: Route, seconds: float):
+        with self._lock:
+            previous = self._latency.get((stage, route.name), route.expected_seconds)
+            self._latency[(stage, route.name)] = previous + LATENCY_SMOOTHING * (seconds - previous)
+
+    def estimated_cost(self, stage: str, route: Route, input_chars: int) -> float:
+        return estimate_cost(route.model, input_chars // 4, 0, self.policies[stage].output_tokens)
+
+    def choose(self, stage: str, input_chars: int, deadline: Deadline = None) -> tuple:
+        """Return (route, reason) for a call of `stage` over roughly `input_chars` characters of input."""
+        policy = self.policies[stage]
+        candidates = [r for r in policy.rules if r.max_chars is None or input_chars <= r.max_chars] or policy.rules[-1:]
+        remaining = deadline.remaining() if deadline else None
+        for route in candidates:
+            if policy.budget_usd is not None and self.estimated_cost(stage, route, input_chars) > policy.budget_usd:
+                continue
+            if remaining is not None and self.expected_seconds(stage, route) > remaining:
+                continue
+            return route, "rule"
+        # Nothing fits the budgets: take the quickest route and let the deadline decide
+        return min(candidates, key=lambda r: self.expected_seconds(stage, r)), "over-budget"
+
+    def escalation(self, stage: str, current: Route, deadline: Deadline = None) -> Optional[Route]:
+        """The bigger route to retry `stage` on, or None if there is none or it would miss the deadline."""
+        route = self.policies[stage].escalation
+        if route is None or route.name == current.name:
+            return None
+        if deadline and self.expected_seconds(stage, route) > deadline.remaining():
+            return None
+        return route
+
+
+def low_confidence(changes: list) -> bool:
+    """Whether the comparison looks unsure of itself and is worth repeating on a bigger route."""
+    if not changes or ESCALATE_BELOW_CONFIDENCE <= 0:
+        return False
+    return sum(c["confidence"] for c in changes) / len(changes) < ESCALATE_BELOW_CONFIDENCE
+
+
+router = ModelRouter()
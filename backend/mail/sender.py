@@ -4,6 +4,9 @@ from typing import List
 import os
 from dotenv import load_dotenv
 
+from services import profiling
+from services.metrics import SMTP_MESSAGES, SMTP_CONNECTION_FAILURES
+
 
 class EmailSender:
     """Handle SMTP connection and email sending"""
@@ -31,14 +34,16 @@ class EmailSender:
             bool: True if successful, False otherwise
         """
         try:
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
+            with profiling.span("smtp", "send"), smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
                 server.starttls()
                 server.login(self.username, self.password)
                 server.sendmail(sender, recipients, message.as_string())
                 print(f"Email sent successfully to {', '.join(recipients)}")
+                SMTP_MESSAGES.labels("success").inc()
                 return True
         except Exception as e:
             print(f"Error sending email: {e}")
+            SMTP_MESSAGES.labels("failed").inc()
             return False
     
     def send_multiple(self, messages: List[tuple]) -> dict:
@@ -54,7 +59,7 @@ class EmailSender:
         results = {"success": [], "failed": []}
         
         try:
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
+            with profiling.span("smtp", "send_multiple"), smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
                 server.starttls()
                 server.login(self.username, self.password)
                 
@@ -62,12 +67,16 @@ class EmailSender:
                     try:
                         server.sendmail(sender, recipients, message.as_string())
                         results["success"].append(recipients)
+                        SMTP_MESSAGES.labels("success").inc()
                         print(f"Email sent to {', '.join(recipients)}")
                     except Exception as e:
                         results["failed"].append((recipients, str(e)))
+                        SMTP_MESSAGES.labels("failed").inc()
                         print(f"Failed to send to {', '.join(recipients)}: {e}")
         except Exception as e:
             print(f"SMTP connection error: {e}")
+            SMTP_CONNECTION_FAILURES.inc()
+            SMTP_MESSAGES.labels("failed").inc(len(messages))
             return {"success": [], "failed": messages}
         
         return results
@@ -1,5 +1,6 @@
-from builder import EmailBuilder
-from sender import EmailSender
+# Run from the backend folder with `python -m mail.test`
+from mail.builder import EmailBuilder
+from mail.sender import EmailSender
 
 def send_multiple_emails():
     """Example: Send multiple emails efficiently"""
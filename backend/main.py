@@ -5,12 +5,22 @@ from dotenv import load_dotenv
 from api.regulations import router as regulations_router
 from api.users import router as users_router
 from api.notifications import router as notifications_router
+from api.stats import router as stats_router
+from api.sync import router as sync_router
+from api.profiles import router as profiles_router
 from api.utils import router as utils_router
 from db.mongo import mongo_client
+from services.metrics import MetricsMiddleware
+from services.compression import CompressionMiddleware
+from services.profiling import ProfilingMiddleware
+from services.responses import ORJSONResponse
+from services.stats import start_rebuilder
+from services.revisions import ensure_indexes
+from services.cache import read_cache
 
 load_dotenv()
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Add CORS BEFORE defining endpoints
 app.add_middleware(
@@ -20,16 +30,42 @@ app.add_middleware(
     allow_headers=["*"],
     allow_origins=["*"]
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware, service="main")
+# Outermost, so a profile covers the whole request
+app.add_middleware(ProfilingMiddleware, service="main")
 
 @app.on_event("startup")
 def startup_db_client():
     try:
         mongo_client.admin.command("ping")
         print("MongoDB connection successful from main service")
+        ensure_indexes()
     except Exception as e:
         print("MongoDB connection failed from main service:", e)
 
+# Periodically recount the dashboard stats from scratch to correct any drift in the counters
+@app.on_event("startup")
+def startup_stats_rebuilder():
+    app.state.stop_stats_rebuilder = start_rebuilder()
+
+@app.on_event("shutdown")
+def shutdown_stats_rebuilder():
+    app.state.stop_stats_rebuilder.set()
+
+# Drop cached reads when another worker or the analysis service writes
+@app.on_event("startup")
+def startup_cache_listener():
+    app.state.stop_cache_listener = read_cache.start_listener()
+
+@app.on_event("shutdown")
+def shutdown_cache_listener():
+    app.state.stop_cache_listener.set()
+
 app.include_router(regulations_router)
 app.include_router(users_router)
 app.include_router(notifications_router)
+app.include_router(stats_router)
+app.include_router(sync_router)
+app.include_router(profiles_router)
 app.include_router(utils_router)
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+from typing import Any, Dict, List, Optional
 
 class ChangeStatusUpdate(BaseModel):
     new_status: str
@@ -15,3 +15,59 @@ class ChangeDetailsUpdate(BaseModel):
     before_quote: Optional[str] = None
     after_quote: Optional[str] = None
     classification: Optional[str] = None
+
+# Response models mirror the documents stored in the "regulations" collection. Fields
+# written by later features (analysis summaries, revisions, import keys...) are kept as extras.
+class CommentResponse(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    id: str
+    username: str
+    comment: str
+    timestamp: str
+
+class ChangeResponse(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    id: str
+    summary: Optional[str] = None
+    analysis: Optional[str] = None
+    change: Optional[str] = None
+    before_quote: Optional[str] = None
+    after_quote: Optional[str] = None
+    type: Optional[str] = None
+    confidence: Optional[float] = None
+    classification: Optional[str] = None
+    status: Optional[str] = None
+    comments: List[CommentResponse] = []
+    revision: Optional[int] = None
+
+class VersionResponse(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    id: str
+    version: str
+    uploadDate: str
+    s3Key: str
+    contentHash: Optional[str] = None
+    fileName: Optional[str] = None
+    detailedChanges: List[ChangeResponse] = []
+    analysis: Optional[Dict[str, Any]] = None
+    analysisStatus: Optional[str] = None
+    revision: Optional[int] = None
+
+class RegulationResponse(BaseModel):
+    model_config = ConfigDict(extra="allow", populate_by_name=True)
+
+    id: str = Field(alias="_id")
+    title: str
+    status: Optional[str] = None
+    lastUpdated: Optional[str] = None
+    versions: List[VersionResponse] = []
+    revision: Optional[int] = None
+
+    # Accepts documents straight from Mongo
+    @field_validator("id", mode="before")
+    @classmethod
+    def object_id_to_str(cls, value):
+        return str(value)
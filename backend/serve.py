@@ -0,0 +1,144 @@
+"""
+Production server for the main and analysis services (Linux and macOS).
+
+Run from the backend folder:
+
+    python serve.py main [--workers 4] [--port 9000]
+    python serve.py analysis [--workers 2] [--port 9001]
+
+Gunicorn manages several uvicorn workers (uvloop event loop, httptools parser).
+The app is imported once before the workers are forked, so they start quickly and
+share the imported code. Nothing connects at import time: MongoDB, S3 and OpenAI
+connections, background threads and the read cache are set up in each worker.
+
+SIGTERM (or Ctrl+C) stops gracefully: workers stop accepting connections, finish
+their requests and, on the analysis service, wait up to ANALYSIS_DRAIN_SECONDS for
+streaming analyses whose client has gone. `server.sh` and `llm.sh` remain the
+single-process development servers with auto-reload.
+"""
+import argparse
+import os
+import tempfile
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from gunicorn.app.base import BaseApplication
+from uvicorn_worker import UvicornWorker
+
+ROLES = {
+    "main": ("main:app", 9000),
+    "analysis": ("analysis:app", 9001),
+}
+# Seconds for in-flight requests to finish once a worker is told to stop
+GRACEFUL_TIMEOUT = float(os.getenv("GRACEFUL_TIMEOUT_SECONDS", 30))
+
+
+class Worker(UvicornWorker):
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools"}
+
+
+def default_workers(role: str) -> int:
+    """
+    The main service is CPU-bound between short Mongo calls, so one worker per core.
+    An analysis mostly waits on OpenAI in threads and each worker has its own LLM
+    limiter and PDF memory, so half as many.
+    """
+    cores = os.cpu_count() or 1
+    if role == "analysis":
+        return max(2, cores // 2)
+    return max(2, cores)
+
+
+def prepare_metrics_dir(role: str, workers: int):
+    """Give the workers a shared, empty Prometheus directory. Must run before the app is imported."""
+    base = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if base is None:
+        if workers == 1:
+            return
+        base = tempfile.mkdtemp(prefix="fineprint-metrics-")
+    # One folder per service, so running both on one host does not mix or wipe their samples
+    directory = Path(base) / role
+    directory.mkdir(parents=True, exist_ok=True)
+    for stale in directory.glob("*.db"):
+        stale.unlink()
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = str(directory)
+
+
+def share_llm_limits(workers: int):
+    """
+    Split the OpenAI limits (LLM_MAX_CONCURRENCY, LLM_REQUESTS_PER_MINUTE,
+    LLM_TOKENS_PER_MINUTE) between the workers, each of which has its own governor.
+    Must run before the app is imported. An LLM_PROCESSES already set is kept, e.g.
+    to share the limits with the workers of another host.
+    """
+    os.environ.setdefault("LLM_PROCESSES", str(workers))
+
+
+# -----------------------
+# Gunicorn hooks
+# -----------------------
+def child_exit(server, worker):
+    # Drops the worker's live gauges (e.g. requests in progress) from /metrics
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+class Server(BaseApplication):
+    def __init__(self, app_path: str, options: dict):
+        self.app_path = app_path
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from gunicorn.util import import_app
+        return import_app(self.app_path)
+
+
+def options(role: str, workers: int, host: str, port: int) -> dict:
+    graceful_timeout = GRACEFUL_TIMEOUT
+    if role == "analysis":
+        from api.analysis import ANALYSIS_DRAIN_SECONDS
+        graceful_timeout += ANALYSIS_DRAIN_SECONDS
+    return {
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "worker_class": Worker,
+        "preload_app": True,
+        "graceful_timeout": int(graceful_timeout),
+        # A worker whose event loop is stuck this long is restarted
+        "timeout": 120,
+        "keepalive": 5,
+        "accesslog": "-",
+        "child_exit": child_exit,
+    }
+
+
+def run(role: str, workers: int = None, host: str = "0.0.0.0", port: int = None):
+    app_path, default_port = ROLES[role]
+    workers = workers or int(os.getenv("WEB_CONCURRENCY", 0)) or default_workers(role)
+    prepare_metrics_dir(role, workers)
+    share_llm_limits(workers)
+    print(f"Starting the {role} service on {host}:{port or default_port} with {workers} workers")
+    Server(app_path, options(role, workers, host, port or default_port)).run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a service with several workers.")
+    parser.add_argument("role", choices=sorted(ROLES))
+    parser.add_argument("--workers", type=int, help="default: WEB_CONCURRENCY, else derived from the CPU count")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, help="default: 9000 for main, 9001 for analysis")
+    args = parser.parse_args()
+    run(args.role, args.workers, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import itertools
+import os
+import socket
+import threading
+from datetime import datetime
+
+from cachetools import TTLCache
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+from services import metrics
+
+# Entries expire after this even if an invalidation is lost, which bounds how stale a read can be. 0 disables the cache.
+CACHE_TTL = float(os.getenv("CACHE_TTL_SECONDS", 30))
+# Least recently used entries are evicted beyond this
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 256))
+# How invalidations reach the other workers and services: "mongo", or "memory" for a single process (and tests)
+CACHE_BROADCAST = os.getenv("CACHE_BROADCAST", "mongo")
+INVALIDATION_COLLECTION = "cache_invalidations"
+# The capped collection keeps only the newest invalidations, tailing workers only need the latest ones
+INVALIDATION_COLLECTION_BYTES = 1024 * 1024
+
+_instances = itertools.count()
+_MISSING = object()
+
+
+# -----------------------
+# Broadcast backends
+# -----------------------
+class MemoryBroadcast:
+    """Delivers invalidations to the other caches of this process only."""
+
+    def __init__(self):
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def publish(self, origin: str, namespaces: list):
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener_origin, listener in listeners:
+            if listener_origin != origin:
+                listener(namespaces)
+
+    def subscribe(self, origin: str, listener) -> threading.Event:
+        entry = (origin, listener)
+        with self._lock:
+            self._listeners.append(entry)
+        stop = threading.Event()
+
+        def unsubscribe():
+            stop.wait()
+            with self._lock:
+                self._listeners.remove(entry)
+
+        threading.Thread(target=unsubscribe, name="cache-unsubscribe", daemon=True).start()
+        return stop
+
+
+class MongoBroadcast:
+    """
+    Delivers invalidations through a capped collection that every subscribed
+    process tails, so the main service sees the writes of the analysis service.
+    """
+
+    def __init__(self, name: str = INVALIDATION_COLLECTION):
+        self.name = name
+        self._collection = None
+
+    def collection(self):
+        if self._collection is None:
+            # Imported here so the memory backend works without a database
+            from db.mongo import db
+            try:
+                db.create_collection(self.name, capped=True, size=INVALIDATION_COLLECTION_BYTES)
+                # A tailable cursor over an empty collection dies at once
+                db[self.name].insert_one({"origin": None, "namespaces": [], "at": datetime.now()})
+            except CollectionInvalid:
+                pass  # already created
+            self._collection = db[self.name]
+        return self._collection
+
+    def publish(self, origin: str, namespaces: list):
+        self.collection().insert_one({"origin": origin, "namespaces": namespaces, "at": datetime.now()})
+
+    def subscribe(self, origin: str, listener) -> threading.Event:
+        stop = threading.Event()
+
+        def tail():
+            while not stop.is_set():
+                try:
+                    collection = self.collection()
+                    newest = next(collection.find({}, {"_id": 1}).sort("$natural", -1).limit(1), None)
+                    # Anything may have been missed while not tailing
+                    listener(None)
+                    cursor = collection.find({}, cursor_type=CursorType.TAILABLE_AWAIT)
+                    caught_up = newest is None
+                    while cursor.alive and not stop.is_set():
+                        for doc in cursor:
+                            if not caught_up:
+                                # Entries up to `newest` are covered by listener(None). If the collection
+                                # has rolled over since, `newest` is gone and the first later entry counts.
+                                if doc["_id"] < newest["_id"]:
+                                    continue
+                                caught_up = True
+                                if doc["_id"] == newest["_id"]:
+                                    continue
+                            if doc["origin"] != origin:
+                                listener(doc["namespaces"])
+                except Exception as e:
+                    print(f"Cache invalidation listener failed: {e}")
+                stop.wait(1)
+
+        threading.Thread(target=tail, name="cache-invalidations", daemon=True).start()
+        return stop
+
+
+BROADCASTS = {"memory": MemoryBroadcast, "mongo": MongoBroadcast}
+
+
+# -----------------------
+# Read-through cache
+# -----------------------
+class ReadCache:
+    """
+    TTL and LRU cache in front of hot reads, grouped in namespaces ("regulations",
+    "users", "notifications"). Writers call `invalidate` with the namespaces they
+    touched after the write; other processes are told through the broadcast.
+    """
+
+    def __init__(self, broadcast, maxsize: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL):
+        self.broadcast = broadcast
+        self.enabled = ttl > 0
+        self._origin_id = next(_instances)
+        self.origin = f"{socket.gethostname()}:{os.getpid()}:{self._origin_id}"
+        self._entries = TTLCache(maxsize=max(maxsize, 1), ttl=max(ttl, 1))
+        # Bumped by every invalidation, so a load that raced a write is not stored
+        self._generations = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        # Workers forked from a preloaded app (serve.py) must not share the parent's origin,
+        # or they would ignore each other's invalidations
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self.origin = f"{socket.gethostname()}:{os.getpid()}:{self._origin_id}"
+        self._entries.clear()
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, key, loader):
+        """Return the cached value of (namespace, key), calling `loader()` on a miss."""
+        if not self.enabled:
+            return loader()
+        with self._lock:
+            value = self._entries.get((namespace, key), _MISSING)
+            generation = self._generation(namespace)
+        if value is not _MISSING:
+            metrics.CACHE_LOOKUPS.labels(namespace, "hit").inc()
+            return value
+        metrics.CACHE_LOOKUPS.labels(namespace, "miss").inc()
+        value = loader()
+        with self._lock:
+            if self._generation(namespace) == generation:
+                self._entries[(namespace, key)] = value
+        return value
+
+    def invalidate(self, *namespaces: str):
+        """Drop the namespaces here and in every other subscribed process. Never raises."""
+        self._drop(list(namespaces))
+        try:
+            self.broadcast.publish(self.origin, list(namespaces))
+        except Exception as e:
+            # Never fail the user's write over the cache; the other processes catch up within the TTL
+            print(f"Failed to broadcast cache invalidation: {e}")
+
+    def _generation(self, namespace: str) -> tuple:
+        return self._epoch, self._generations.get(namespace, 0)
+
+    def _drop(self, namespaces):
+        """Drop the given namespaces, or everything if `namespaces` is None."""
+        with self._lock:
+            if namespaces is None:
+                self._entries.clear()
+                self._epoch += 1
+                return
+            for key in list(self._entries.keys()):
+                if key[0] in namespaces:
+                    self._entries.pop(key, None)
+            for namespace in namespaces:
+                self._generations[namespace] = self._generations.get(namespace, 0) + 1
+
+    def start_listener(self) -> threading.Event:
+        """Apply invalidations from other processes until the returned event is set."""
+        return self.broadcast.subscribe(self.origin, self._drop)
+
+
+read_cache = ReadCache(BROADCASTS[CACHE_BROADCAST]())
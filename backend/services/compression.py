@@ -0,0 +1,88 @@
+import gzip
+import os
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipResponder, IdentityResponder
+
+try:
+    import brotli
+except ImportError:  # optional, responses are only gzipped without it
+    brotli = None
+
+# Smaller responses are sent as is, compressing them costs more than it saves
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", 1024))
+# Responses compressed per request favour speed. At such a quality brotli is larger than
+# gzip, so gzip wins ties there; a body compressed once and cached uses a high quality instead.
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+CACHED_BROTLI_QUALITY = int(os.getenv("CACHED_BROTLI_QUALITY", 9))
+
+
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app, minimum_size: int, quality: int = BROTLI_QUALITY):
+        super().__init__(app, minimum_size)
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        body = self.compressor.process(body)
+        return body + (self.compressor.flush() if more_body else self.compressor.finish())
+
+
+def compress(body: bytes, coding: str) -> bytes:
+    """Compress a whole body, to be cached, for a coding returned by `negotiate(..., cached=True)`."""
+    if coding == "br":
+        return brotli.compress(body, quality=CACHED_BROTLI_QUALITY)
+    if coding == "gzip":
+        return gzip.compress(body, GZIP_LEVEL)
+    return body
+
+
+def negotiate(accept_encoding: str, cached: bool = False) -> str:
+    """
+    Pick "br", "gzip" or "identity" from an Accept-Encoding header, honouring q-values.
+    Ties go to gzip, or to brotli for a body compressed once by `compress` (`cached`).
+    """
+    offered = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        offered[coding.strip().lower()] = quality
+    if brotli is None:
+        supported = ("gzip",)
+    else:
+        supported = ("br", "gzip") if cached else ("gzip", "br")
+    candidates = [(offered.get(c, offered.get("*", 0.0)), -i, c) for i, c in enumerate(supported)]
+    quality, _, coding = max(candidates)
+    return coding if quality > 0 else "identity"
+
+
+class CompressionMiddleware:
+    """
+    Brotli or gzip compression of responses above `minimum_size`, whichever the client
+    prefers (gzip on ties). Server-Sent Events and already encoded bodies are left alone.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        coding = negotiate(Headers(scope=scope).get("Accept-Encoding", ""))
+        if coding == "br":
+            responder = BrotliResponder(self.app, self.minimum_size)
+        elif coding == "gzip":
+            responder = GZipResponder(self.app, self.minimum_size, compresslevel=GZIP_LEVEL)
+        else:
+            responder = IdentityResponder(self.app, self.minimum_size)
+        await responder(scope, receive, send)
@@ -0,0 +1,24 @@
+import os
+import socket
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+from db.mongo import lock_collection
+
+
+def acquire_lease(name: str, seconds: float) -> bool:
+    """
+    Take the lease `name` for `seconds` unless another process holds it, so a
+    periodic job runs in only one worker across the deployment per interval.
+    """
+    now = datetime.now()
+    try:
+        lock_collection.find_one_and_update(
+            {"_id": name, "leasedUntil": {"$lt": now}},
+            {"$set": {"leasedUntil": now + timedelta(seconds=seconds), "owner": f"{socket.gethostname()}:{os.getpid()}"}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        return False
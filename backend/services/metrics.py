@@ -0,0 +1,283 @@
+import math
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+from pymongo import monitoring
+
+from services import profiling
+
+# When running several workers, set PROMETHEUS_MULTIPROC_DIR to an empty, writable
+# directory so every worker writes its samples there and /metrics aggregates them.
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Buckets tuned for what we actually serve: fast CRUD routes and minute-long analyses
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BACKEND_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 240, 480)
+
+# -----------------------
+# HTTP
+# -----------------------
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests handled",
+    ["service", "method", "route", "status"],
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route",
+    ["service", "method", "route"], buckets=HTTP_BUCKETS,
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_progress", "HTTP requests currently being handled",
+    ["service"], multiprocess_mode="livesum",
+)
+
+# -----------------------
+# MongoDB / S3 / SMTP
+# -----------------------
+MONGO_LATENCY = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency",
+    ["command"], buckets=BACKEND_BUCKETS,
+)
+MONGO_FAILURES = Counter(
+    "mongo_command_failures_total", "MongoDB commands that failed", ["command"],
+)
+S3_LATENCY = Histogram(
+    "s3_request_duration_seconds", "S3 API call latency",
+    ["operation"], buckets=BACKEND_BUCKETS,
+)
+S3_FAILURES = Counter(
+    "s3_request_failures_total", "S3 API calls that failed", ["operation"],
+)
+SMTP_MESSAGES = Counter(
+    "smtp_messages_total", "Emails handed to the SMTP server", ["result"],
+)
+SMTP_CONNECTION_FAILURES = Counter(
+    "smtp_connection_failures_total", "SMTP sessions that could not be opened",
+)
+
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total", "Cache lookups by cache and result (hit/miss)", ["cache", "result"],
+)
+
+# -----------------------
+# LLM / Analysis
+# -----------------------
+LLM_LATENCY = Histogram(
+    "llm_request_duration_seconds", "OpenAI API call latency",
+    ["stage", "endpoint"], buckets=LLM_BUCKETS,
+)
+LLM_FAILURES = Counter(
+    "llm_request_failures_total", "OpenAI API calls that raised", ["stage", "endpoint"],
+)
+LLM_QUEUE = Histogram(
+    "llm_queue_seconds", "Time an OpenAI call waited for the rate/concurrency governor",
+    buckets=BACKEND_BUCKETS + (30, 60, 120),
+)
+LLM_RETRIES = Counter(
+    "llm_retries_total", "OpenAI calls retried by the governor", ["stage", "reason"],
+)
+LLM_HEDGES = Counter(
+    "llm_hedged_polls_total", "Status polls duplicated because the first one was slow", ["stage"],
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total", "Tokens reported by the OpenAI usage block. "
+    "kind=cached is the prompt-cache hit share of kind=input.",
+    ["model", "stage", "kind"],
+)
+REMOTE_RESOURCES_CREATED = Counter(
+    "openai_resources_created_total", "OpenAI files and vector stores created", ["kind"],
+)
+REMOTE_RESOURCES_DELETED = Counter(
+    "openai_resources_deleted_total", "OpenAI files and vector stores deleted, by who deleted them",
+    ["kind", "source"],
+)
+JANITOR_RUNS = Counter(
+    "openai_janitor_runs_total", "Resource janitor runs", ["result"],
+)
+JANITOR_DURATION = Histogram(
+    "openai_janitor_duration_seconds", "Duration of a resource janitor run", buckets=LLM_BUCKETS,
+)
+ANALYSIS_QUEUE = Histogram(
+    "analysis_queue_seconds", "Time from receiving an upload until its analysis starts",
+    buckets=BACKEND_BUCKETS + (30, 60, 120),
+)
+ANALYSIS_STAGE_LATENCY = Histogram(
+    "analysis_stage_duration_seconds", "Duration of each analyze_pdfs stage",
+    ["stage"], buckets=LLM_BUCKETS,
+)
+ANALYSIS_POLLS = Counter(
+    "analysis_polls_total", "Readiness checks made while waiting on OpenAI files and vector stores",
+    ["stage"],
+)
+ANALYSIS_POLL_WAIT = Counter(
+    "analysis_poll_wait_seconds_total", "Time spent sleeping between readiness checks", ["stage"],
+)
+ANALYSIS_DURATION = Histogram(
+    "analysis_duration_seconds", "End-to-end analyze_pdfs duration",
+    ["outcome"], buckets=LLM_BUCKETS,
+)
+ANALYSES_IN_FLIGHT = Gauge(
+    "analyses_in_progress", "Analyses currently running", multiprocess_mode="livesum",
+)
+
+
+@contextmanager
+def llm_call(stage: str, endpoint: str):
+    """Time one OpenAI API call and count it as failed if it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        LLM_FAILURES.labels(stage, endpoint).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        LLM_LATENCY.labels(stage, endpoint).observe(elapsed)
+        profiling.record_span("openai", f"{stage}:{endpoint}", elapsed)
+
+
+@contextmanager
+def analysis():
+    """Count one analysis as in flight while it runs and time it, labelled by how it ended."""
+    ANALYSES_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    outcome = "failed"
+    try:
+        yield
+        outcome = "success"
+    finally:
+        ANALYSES_IN_FLIGHT.dec()
+        ANALYSIS_DURATION.labels(outcome).observe(time.perf_counter() - start)
+
+
+def record_llm_usage(model: str, stage: str, usage):
+    """Add the token counts of a Responses API usage block to the counters."""
+    if usage is None:
+        return
+    LLM_TOKENS.labels(model, stage, "input").inc(usage.input_tokens or 0)
+    LLM_TOKENS.labels(model, stage, "output").inc(usage.output_tokens or 0)
+    input_details = getattr(usage, "input_tokens_details", None)
+    if input_details is not None:
+        LLM_TOKENS.labels(model, stage, "cached").inc(input_details.cached_tokens or 0)
+    output_details = getattr(usage, "output_tokens_details", None)
+    if output_details is not None:
+        LLM_TOKENS.labels(model, stage, "reasoning").inc(output_details.reasoning_tokens or 0)
+
+
+# -----------------------
+# Instrumentation hooks
+# -----------------------
+class MongoCommandMetrics(monitoring.CommandListener):
+    """pymongo command listener feeding the Mongo latency histogram."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_LATENCY.labels(event.command_name).observe(event.duration_micros / 1e6)
+        profiling.record_span("mongo", event.command_name, event.duration_micros / 1e6)
+
+    def failed(self, event):
+        MONGO_LATENCY.labels(event.command_name).observe(event.duration_micros / 1e6)
+        profiling.record_span("mongo", event.command_name, event.duration_micros / 1e6)
+        MONGO_FAILURES.labels(event.command_name).inc()
+
+
+def instrument_boto3(client):
+    """Register botocore event hooks that time every call made by `client`."""
+    service = client.meta.service_model.endpoint_prefix
+
+    def before_call(model, context, **kwargs):
+        context["metrics_start"] = time.perf_counter()
+
+    def observe(model, context):
+        start = context.get("metrics_start")
+        if start is not None:
+            elapsed = time.perf_counter() - start
+            S3_LATENCY.labels(model.name).observe(elapsed)
+            profiling.record_span(service, model.name, elapsed)
+
+    def after_call(model, context, http_response=None, **kwargs):
+        observe(model, context)
+        if http_response is not None and http_response.status_code >= 400:
+            S3_FAILURES.labels(model.name).inc()
+
+    # Raised before any HTTP response came back (connection errors, timeouts)
+    def after_call_error(model, context, **kwargs):
+        observe(model, context)
+        S3_FAILURES.labels(model.name).inc()
+
+    client.meta.events.register(f"before-call.{service}", before_call)
+    client.meta.events.register(f"after-call.{service}", after_call)
+    client.meta.events.register(f"after-call-error.{service}", after_call_error)
+    return client
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording per-route latency and in-flight requests.
+
+    The route label is the matched path template (e.g. /regulations/{reg_id}),
+    never the raw URL, so label cardinality stays bounded.
+    """
+
+    def __init__(self, app, service: str):
+        self.app = app
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        start = time.perf_counter()
+        scope.setdefault("state", {})["request_start"] = start
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_flight = HTTP_IN_FLIGHT.labels(self.service)
+        in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            HTTP_LATENCY.labels(self.service, method, route_path).observe(time.perf_counter() - start)
+            HTTP_REQUESTS.labels(self.service, method, route_path, str(status_code)).inc()
+
+
+def render_latest():
+    """Return (payload, content type) for the /metrics endpoint."""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of numbers (q in 0-100), None when it is empty."""
+    ordered = sorted(v for v in values if v is not None)
+    if not ordered:
+        return None
+    rank = max(math.ceil(q / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
@@ -0,0 +1,289 @@
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+
+from starlette.concurrency import run_in_threadpool
+
+# Share of requests profiled at random, 0 to 1
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+# Requests carrying this value in the X-Profile header are profiled, and it is required to read profiles
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_HEADER = "x-profile"
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "profiles"))
+# Oldest profiles are deleted beyond this
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", 200))
+PROFILING_ENABLED = PROFILE_SAMPLE_RATE > 0 or bool(PROFILE_TOKEN)
+
+TOP_FUNCTIONS = 40
+MAX_SPANS = 2000
+
+_current = ContextVar("request_profile", default=None)
+# cProfile can only run one profiler at a time (per process from Python 3.12)
+_cpu_lock = threading.Lock()
+
+
+# -----------------------
+# Profile of one request
+# -----------------------
+class RequestProfile:
+    """Wall-clock timeline of one request, with the time it spent blocked on each backend."""
+
+    def __init__(self, service: str, method: str, path: str, trigger: str):
+        self.id = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{uuid.uuid4().hex[:6]}"
+        self.service = service
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        self.spans = []
+        self.dropped_spans = 0
+        self._lock = threading.Lock()
+
+    def add_span(self, category: str, name: str, seconds: float):
+        end = time.perf_counter() - self.start
+        with self._lock:
+            if len(self.spans) >= MAX_SPANS:
+                self.dropped_spans += 1
+                return
+            self.spans.append({
+                "category": category, "name": name, "thread": threading.current_thread().name,
+                "startSeconds": round(max(end - seconds, 0.0), 6), "seconds": round(seconds, 6),
+            })
+
+    def finish(self, status: int, cpu: cProfile.Profile = None, cpu_note: str = None) -> dict:
+        blocked = defaultdict(lambda: {"calls": 0, "seconds": 0.0})
+        for span in self.spans:
+            blocked[span["category"]]["calls"] += 1
+            blocked[span["category"]]["seconds"] += span["seconds"]
+        self.summary = {
+            "id": self.id,
+            "service": self.service,
+            "method": self.method,
+            "path": self.path,
+            "status": status,
+            "trigger": self.trigger,
+            "startedAt": self.started_at.isoformat(timespec="milliseconds"),
+            "wallSeconds": round(time.perf_counter() - self.start, 6),
+            # Process CPU time, so it includes whatever else ran concurrently
+            "cpuSeconds": round(time.process_time() - self.cpu_start, 6),
+            "blocked": {k: {"calls": v["calls"], "seconds": round(v["seconds"], 6)} for k, v in blocked.items()},
+            "cpuProfile": cpu is not None,
+        }
+        if cpu_note:
+            self.summary["cpuProfileNote"] = cpu_note
+        self.cpu = cpu
+        return self.summary
+
+    def to_dict(self) -> dict:
+        return {
+            **self.summary,
+            "spans": self.spans,
+            "droppedSpans": self.dropped_spans,
+            "topFunctions": _top_functions(self.cpu) if self.cpu else [],
+        }
+
+
+def _top_functions(cpu: cProfile.Profile) -> list:
+    stats = pstats.Stats(cpu, stream=io.StringIO())
+    rows = []
+    for (filename, line, name), (_, calls, total, cumulative, _) in stats.stats.items():
+        rows.append({
+            "function": f"{filename}:{line}({name})", "calls": calls,
+            "totalSeconds": round(total, 6), "cumulativeSeconds": round(cumulative, 6),
+        })
+    rows.sort(key=lambda r: r["cumulativeSeconds"], reverse=True)
+    return rows[:TOP_FUNCTIONS]
+
+
+# -----------------------
+# Hooks for blocking calls
+# -----------------------
+def record_span(category: str, name: str, seconds: float):
+    """Note `seconds` spent blocked in `category` (mongo, s3, openai...), if this request is being profiled."""
+    profile = _current.get()
+    if profile is not None:
+        profile.add_span(category, name, seconds)
+
+
+class span:
+    """Time a block as a span of the current profile. A no-op when nothing is profiled."""
+
+    def __init__(self, category: str, name: str):
+        self.category = category
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter() if _current.get() is not None else None
+        return self
+
+    def __exit__(self, *exc):
+        if self.start is not None:
+            record_span(self.category, self.name, time.perf_counter() - self.start)
+        return False
+
+
+def carry(fn):
+    """
+    Wrap `fn` so the spans it records from a worker thread land in the current
+    request's profile. Returns `fn` itself when nothing is profiled.
+    """
+    profile = _current.get()
+    if profile is None:
+        return fn
+
+    def run(*args, **kwargs):
+        token = _current.set(profile)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+
+    return run
+
+
+# -----------------------
+# Store
+# -----------------------
+class ProfileStore:
+    """
+    Profiles as files in PROFILE_DIR: <id>.json (summary, spans and top functions)
+    and <id>.prof (cProfile data for pstats or snakeviz). Ids sort by time.
+    """
+
+    def __init__(self, directory: Path = PROFILE_DIR, max_files: int = PROFILE_MAX_FILES):
+        self.directory = directory
+        self.max_files = max_files
+
+    def save(self, profile: RequestProfile):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / f"{profile.id}.json").write_text(json.dumps(profile.to_dict(), default=str))
+        if profile.cpu is not None:
+            profile.cpu.dump_stats(str(self.directory / f"{profile.id}.prof"))
+        self.rotate()
+
+    def rotate(self):
+        for path in self._summaries()[self.max_files:]:
+            path.unlink(missing_ok=True)
+            path.with_suffix(".prof").unlink(missing_ok=True)
+
+    def _summaries(self) -> list:
+        if not self.directory.exists():
+            return []
+        return sorted(self.directory.glob("*.json"), reverse=True)
+
+    def list(self, limit: int = 50) -> list:
+        """Summaries of the newest profiles, newest first."""
+        summaries = []
+        for path in self._summaries()[:limit]:
+            try:
+                profile = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue  # rotated away or still being written
+            summaries.append({k: v for k, v in profile.items() if k not in ("spans", "topFunctions")})
+        return summaries
+
+    def _path(self, profile_id: str, suffix: str) -> Path:
+        # Ids are generated here; anything else could point outside the directory
+        if not profile_id.replace("-", "").isalnum():
+            return None
+        path = self.directory / f"{profile_id}{suffix}"
+        return path if path.exists() else None
+
+    def get(self, profile_id: str) -> dict:
+        path = self._path(profile_id, ".json")
+        return json.loads(path.read_text()) if path else None
+
+    def pstats_path(self, profile_id: str) -> Path:
+        return self._path(profile_id, ".prof")
+
+
+store = ProfileStore()
+
+
+def authorized(token: str) -> bool:
+    return bool(PROFILE_TOKEN) and token is not None and hmac.compare_digest(token, PROFILE_TOKEN)
+
+
+# -----------------------
+# Middleware
+# -----------------------
+class ProfilingMiddleware:
+    """
+    Profiles requests sent with `X-Profile: <PROFILE_TOKEN>` and a random
+    PROFILE_SAMPLE_RATE share of the others. Records a cProfile CPU profile of the
+    event loop thread (of every thread from Python 3.12), and the wall-clock
+    spans spent blocked in pymongo, boto3, OpenAI and SMTP calls.
+
+    When neither setting is present the middleware is a single attribute check.
+    """
+
+    def __init__(self, app, service: str):
+        self.app = app
+        self.service = service
+
+    def _trigger(self, scope) -> str:
+        if scope["path"].startswith("/profiles"):
+            return None
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER.encode() and authorized(value.decode("latin-1")):
+                return "header"
+        if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+            return "sample"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if not PROFILING_ENABLED or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trigger = self._trigger(scope)
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(self.service, scope["method"], scope["path"], trigger)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message.setdefault("headers", []).append((b"x-profile-id", profile.id.encode()))
+            await send(message)
+
+        cpu, cpu_note = None, None
+        if _cpu_lock.acquire(blocking=False):
+            cpu = cProfile.Profile()
+            try:
+                cpu.enable()
+            except ValueError as e:  # another profiler or debugger is active
+                cpu, cpu_note = None, str(e)
+                _cpu_lock.release()
+        else:
+            cpu_note = "another request was being CPU-profiled"
+
+        token = _current.set(profile)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            if cpu is not None:
+                cpu.disable()
+                _cpu_lock.release()
+            profile.finish(status_code, cpu, cpu_note)
+            try:
+                await run_in_threadpool(store.save, profile)
+            except Exception as e:
+                print(f"Failed to save profile {profile.id}: {e}")
@@ -0,0 +1,135 @@
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+
+from db.mongo import (
+    counter_collection, deletion_collection, regulation_collection, notification_collection, revision_commit_collection,
+)
+
+REVISION_ID = "revision"
+COMMITTED_ID = "committed"
+# A revision whose write has not reported back after this long (e.g. its process crashed)
+# stops holding back the revision handed to syncing clients
+REVISION_LEASE_SECONDS = float(os.getenv("REVISION_LEASE_SECONDS", 300))
+
+
+# -----------------------
+# Revision counter
+# -----------------------
+def next_revision() -> int:
+    """Allocate the next value of the deployment-wide, monotonic revision counter."""
+    counter = counter_collection.find_one_and_update(
+        {"_id": REVISION_ID},
+        {"$inc": {"value": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return counter["value"]
+
+
+def current_revision() -> int:
+    counter = counter_collection.find_one({"_id": REVISION_ID})
+    return counter["value"] if counter else 0
+
+
+@contextmanager
+def new_revision():
+    """
+    Allocate a revision for the write made in the block, and record it as
+    committed when the block exits, whether or not the write succeeded.
+    """
+    revision = next_revision()
+    try:
+        yield revision
+    finally:
+        try:
+            revision_commit_collection.insert_one({"_id": revision, "committedAt": datetime.now()})
+        except Exception as e:
+            # Only delays syncing clients until the lease runs out
+            print(f"Failed to record revision {revision} as committed: {e}")
+
+
+def committed_revision() -> int:
+    """
+    Highest revision at or below which every write has landed, which is what a
+    syncing client may remember. Revisions are allocated before their write, so
+    a slow write can land below the latest revision after a client has seen it.
+    """
+    current = current_revision()
+    mark = counter_collection.find_one({"_id": COMMITTED_ID})
+    if mark is None:
+        # First use: writes made before commits were recorded have all landed
+        counter_collection.update_one({"_id": COMMITTED_ID}, {"$max": {"value": current}}, upsert=True)
+        return current
+
+    watermark = mark["value"]
+    committed = {
+        doc["_id"] for doc in revision_commit_collection.find({"_id": {"$gt": watermark, "$lte": current}}, {"_id": 1})
+    }
+    # Revisions still uncommitted REVISION_LEASE_SECONDS after they started holding it back are given up on
+    stuck = mark.get("stuck")
+    expired = bool(stuck) and datetime.now() - stuck["since"] > timedelta(seconds=REVISION_LEASE_SECONDS)
+    while watermark < current and (watermark + 1 in committed or (expired and watermark + 1 <= stuck["upTo"])):
+        watermark += 1
+
+    update = {}
+    if watermark > mark["value"]:
+        update["$max"] = {"value": watermark}
+    if watermark == current and stuck:
+        update["$unset"] = {"stuck": ""}
+    elif watermark < current and (not stuck or stuck["upTo"] <= watermark):
+        update["$set"] = {"stuck": {"since": datetime.now(), "upTo": current}}
+    if update:
+        counter_collection.update_one({"_id": COMMITTED_ID}, update)
+    if watermark > mark["value"]:
+        revision_commit_collection.delete_many({"_id": {"$lte": watermark}})
+    return watermark
+
+
+def stamp(update: dict, revision: int, *paths: str) -> dict:
+    """
+    Add `revision` to an update document, on the top-level document and on every
+    nested path given (e.g. "versions.$[v]"), so readers can tell what changed.
+    """
+    fields = {"revision": revision, **{f"{path}.revision": revision for path in paths}}
+    return {**update, "$set": {**update.get("$set", {}), **fields}}
+
+
+def record_deletion(kind: str, doc_id: str) -> int:
+    """Leave a tombstone so clients syncing by revision learn about the deletion."""
+    with new_revision() as revision:
+        deletion_collection.insert_one({"kind": kind, "docId": doc_id, "revision": revision, "deletedAt": datetime.now()})
+    return revision
+
+
+def latest_revision(collection, deletion_kind: str = None) -> int:
+    """Highest revision in a collection, including its deletions. Two indexed reads."""
+    latest = collection.find_one({"revision": {"$exists": True}}, {"revision": 1}, sort=[("revision", DESCENDING)])
+    revision = latest["revision"] if latest else 0
+    if deletion_kind:
+        deleted = deletion_collection.find_one({"kind": deletion_kind}, {"revision": 1}, sort=[("revision", DESCENDING)])
+        revision = max(revision, deleted["revision"] if deleted else 0)
+    return revision
+
+
+def ensure_indexes():
+    regulation_collection.create_index([("revision", ASCENDING)])
+    notification_collection.create_index([("revision", ASCENDING)])
+    deletion_collection.create_index([("kind", ASCENDING), ("revision", ASCENDING)])
+
+
+# -----------------------
+# Conditional GET
+# -----------------------
+def etag(revision: int) -> str:
+    return f'W/"{revision}"'
+
+
+def not_modified(if_none_match: str, tag: str) -> bool:
+    """Whether an If-None-Match header matches `tag` (weak comparison)."""
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    return "*" in candidates or tag.removeprefix("W/") in {c.removeprefix("W/") for c in candidates}
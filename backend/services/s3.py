@@ -1,5 +1,7 @@
 import boto3
 import os
 
-s3_client = boto3.client("s3")
+from services.metrics import instrument_boto3
+
+s3_client = instrument_boto3(boto3.client("s3"))
 s3_bucket = os.getenv("S3_BUCKET", "fypwhere")
@@ -0,0 +1,186 @@
+import os
+import threading
+from collections import Counter
+from datetime import datetime
+
+from pymongo.errors import DuplicateKeyError
+
+from db.mongo import regulation_collection, stats_collection
+from services.leases import acquire_lease
+
+# The counters are kept up to date by every write path; a full rebuild from the
+# regulations corrects any drift (e.g. a crash between a write and its counter update)
+REBUILD_INTERVAL = float(os.getenv("STATS_REBUILD_INTERVAL_SECONDS", 3600))
+STATS_ID = "dashboard"
+# A rebuild that raced with counter updates is discarded and recounted, at most this many times
+REBUILD_ATTEMPTS = 3
+
+# The frontend shows missing values like this, so count them the same way
+DIMENSIONS = {
+    "byStatus": ("status", "pending"),
+    "byClassification": ("classification", "Others"),
+    "byType": ("type", "unknown"),
+}
+
+
+def _key(value) -> str:
+    # Field names cannot contain dots or start with $
+    return str(value).replace(".", "_").lstrip("$") or "unknown"
+
+
+def _change_counts(changes: list) -> Counter:
+    counts = Counter()
+    for change in changes:
+        counts["changes"] += 1
+        for group, (field, default) in DIMENSIONS.items():
+            counts[f"{group}.{_key(change.get(field) or default)}"] += 1
+    return counts
+
+
+def _apply(counts: Counter, sign: int = 1):
+    increments = {key: sign * n for key, n in counts.items() if n}
+    if not increments:
+        return
+    try:
+        stats_collection.update_one(
+            {"_id": STATS_ID},
+            # "writes" tells a concurrent rebuild that its recount may have missed this update
+            {"$inc": {**increments, "writes": 1}, "$set": {"updatedAt": datetime.now()}},
+            upsert=True,
+        )
+    except Exception as e:
+        # Never fail the user's write over a counter; the next rebuild fixes it
+        print(f"Failed to update dashboard stats: {e}")
+
+
+# -----------------------
+# Write paths
+# -----------------------
+def record_regulation_added(reg_doc: dict, sign: int = 1):
+    counts = Counter({"regulations": 1})
+    for version in reg_doc.get("versions", []):
+        counts["versions"] += 1
+        counts.update(_change_counts(version.get("detailedChanges", [])))
+    _apply(counts, sign)
+
+
+def record_regulation_deleted(reg_doc: dict):
+    record_regulation_added(reg_doc, sign=-1)
+
+
+def record_version_added(changes: list, sign: int = 1):
+    counts = _change_counts(changes)
+    counts["versions"] += 1
+    _apply(counts, sign)
+
+
+def record_version_deleted(version: dict):
+    record_version_added(version.get("detailedChanges", []), sign=-1)
+
+
+def record_changes_added(changes: list):
+    _apply(_change_counts(changes))
+
+
+def record_change_updated(before: dict, after: dict):
+    counts = _change_counts([after])
+    counts.subtract(_change_counts([before]))
+    _apply(counts)
+
+
+# -----------------------
+# Reads and rebuild
+# -----------------------
+def _recount() -> dict:
+    stats = {"_id": STATS_ID, "regulations": regulation_collection.count_documents({})}
+
+    versions = list(regulation_collection.aggregate([
+        {"$project": {"count": {"$size": {"$ifNull": ["$versions", []]}}}},
+        {"$group": {"_id": None, "count": {"$sum": "$count"}}},
+    ]))
+    stats["versions"] = versions[0]["count"] if versions else 0
+
+    stats["changes"] = 0
+    for group, (field, default) in DIMENSIONS.items():
+        rows = regulation_collection.aggregate([
+            {"$unwind": "$versions"},
+            {"$unwind": "$versions.detailedChanges"},
+            {"$group": {
+                "_id": {"$ifNull": [f"$versions.detailedChanges.{field}", default]},
+                "count": {"$sum": 1},
+            }},
+        ])
+        stats[group] = Counter()
+        for row in rows:
+            stats[group][_key(row["_id"] or default)] += row["count"]
+        stats[group] = dict(stats[group])
+        stats["changes"] = sum(stats[group].values())
+    return stats
+
+
+def _replace(stats: dict, current: dict) -> bool:
+    """Store a recount unless a counter update landed since `current` was read."""
+    if current is None:
+        try:
+            stats_collection.insert_one(stats)
+            return True
+        except DuplicateKeyError:
+            return False
+    # Counters written before "writes" existed have none; None matches a missing field
+    writes = current.get("writes")
+    return stats_collection.replace_one({"_id": STATS_ID, "writes": writes}, stats).matched_count == 1
+
+
+def rebuild() -> dict:
+    """
+    Recount everything from the regulations with $aggregate and replace the counters.
+
+    An update that lands during the recount may or may not be in it, so the
+    recount only replaces the counters if none did, and is otherwise repeated.
+    """
+    for _ in range(REBUILD_ATTEMPTS):
+        current = stats_collection.find_one({"_id": STATS_ID}, {"writes": 1})
+        stats = _recount()
+        now = datetime.now()
+        stats.update({"writes": (current or {}).get("writes") or 0, "updatedAt": now, "rebuiltAt": now})
+        if _replace(stats, current):
+            return stats
+    print(f"Dashboard stats changed during {REBUILD_ATTEMPTS} rebuilds, keeping the counters")
+    return stats
+
+
+def get_stats() -> dict:
+    """The dashboard counters, a single document read. Built on first use."""
+    stats = stats_collection.find_one({"_id": STATS_ID})
+    if stats is None or "rebuiltAt" not in stats:
+        stats = rebuild()
+    stats.pop("_id", None)
+    stats.pop("writes", None)
+    for group in DIMENSIONS:
+        # Counts that dropped to zero are left behind by $inc
+        stats[group] = {k: v for k, v in stats.get(group, {}).items() if v}
+    return stats
+
+
+def start_rebuilder(interval: float = REBUILD_INTERVAL) -> threading.Event:
+    """
+    Rebuild the counters in a daemon thread every `interval` seconds, in one worker
+    across the deployment. Set the returned event to stop it.
+    """
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            try:
+                if acquire_lease("stats-rebuilder", interval * 0.9):
+                    rebuild()
+            except Exception as e:
+                print(f"Dashboard stats rebuild failed: {e}")
+
+    threading.Thread(target=loop, name="stats-rebuilder", daemon=True).start()
+    return stop
+
+
+if __name__ == "__main__":
+    # Manual rebuild from the backend folder, with the .env variables exported: python -m services.stats
+    print(rebuild())
@@ -59,6 +59,14 @@ interface AggregatedChange extends DetailedChange {
   uploadDate: string;
 }
 
+// Counts by status, classification and type, kept up to date by the backend
+interface ChangeStats {
+  changes: number;
+  byStatus: Record<string, number>;
+  byClassification: Record<string, number>;
+  byType: Record<string, number>;
+}
+
 interface FilterOptions {
   searchTerm: string;
   selectedRegulations: string[];
@@ -75,6 +83,7 @@ const RelevantChangesPage: React.FC = () => {
   const [loading, setLoading] = useState(true);
   const [regulations, setRegulations] = useState<Regulation[]>([]);
   const [aggregatedChanges, setAggregatedChanges] = useState<AggregatedChange[]>([]);
+  const [stats, setStats] = useState<ChangeStats | null>(null);
   const [filteredChanges, setFilteredChanges] = useState<AggregatedChange[]>([]);
   const [expandedChanges, setExpandedChanges] = useState<Set<string>>(new Set());
   const [showFilters, setShowFilters] = useState(false);
@@ -134,7 +143,20 @@ const RelevantChangesPage: React.FC = () => {
       }
     };
 
+    const fetchStats = async () => {
+      try {
+        const response = await fetch(`${API_PROTOCOL}://${MAIN_HOST}:${MAIN_PORT}/stats`);
+        if (!response.ok) {
+          throw new Error(`Failed to fetch stats: ${response.statusText}`);
+        }
+        setStats(await response.json());
+      } catch (err) {
+        console.error('Error fetching stats:', err);
+      }
+    };
+
     fetchRegulations();
+    fetchStats();
   }, []);
 
   // Apply filters and sorting
@@ -238,18 +260,29 @@ const RelevantChangesPage: React.FC = () => {
     setExpandedChanges(newExpanded);
   };
 
+  // Filter options and their counts come from /stats instead of walking every change
   const getUniqueTypes = () => {
+    if (stats) {
+      return Object.keys(stats.byType);
+    }
     const types = new Set(aggregatedChanges.map(change => change.type));
     return Array.from(types);
   };
 
   const getUniqueClassifications = () => {
+    if (stats) {
+      return Object.keys(stats.byClassification);
+    }
     const classifications = new Set(
       aggregatedChanges.map(change => change.classification || 'Others')
     );
     return Array.from(classifications);
   };
 
+  const withCount = (label: string, count?: number) => (
+    stats ? `${label} (${count ?? 0})` : label
+  );
+
   const handleExport = () => {
     const dataToExport = filteredChanges.map(change => ({
       regulation: change.regulationTitle,
@@ -296,7 +329,7 @@ const RelevantChangesPage: React.FC = () => {
             <div>
               <h1 className="text-2xl font-bold text-gray-900">Changes Overview</h1>
               <p className="text-gray-600 mt-1">
-                Overview of all relevant regulatory changes ({filteredChanges.length} of {aggregatedChanges.length} changes)
+                Overview of all relevant regulatory changes ({filteredChanges.length} of {stats ? stats.changes : aggregatedChanges.length} changes)
               </p>
             </div>
             <div className="flex gap-3">
@@ -351,10 +384,10 @@ const RelevantChangesPage: React.FC = () => {
                   onChange={(e) => setFilters(prev => ({ ...prev, statusFilter: e.target.value as any }))}
                   className="w-full p-2 border rounded-lg"
                 >
-                  <option value="all">All Statuses</option>
-                  <option value="relevant">Relevant Only</option>
-                  <option value="pending">Pending Review</option>
-                  <option value="not-relevant">Not Relevant</option>
+                  <option value="all">{withCount('All Statuses', stats?.changes)}</option>
+                  <option value="relevant">{withCount('Relevant Only', stats?.byStatus['relevant'])}</option>
+                  <option value="pending">{withCount('Pending Review', stats?.byStatus['pending'])}</option>
+                  <option value="not-relevant">{withCount('Not Relevant', stats?.byStatus['not-relevant'])}</option>
                 </select>
               </div>
 
@@ -438,7 +471,7 @@ const RelevantChangesPage: React.FC = () => {
                           }
                         }}
                       />
-                      {type}
+                      {withCount(type, stats?.byType[type])}
                     </label>
                   ))}
                 </div>
@@ -467,7 +500,7 @@ const RelevantChangesPage: React.FC = () => {
                           }
                         }}
                       />
-                      {classification}
+                      {withCount(classification, stats?.byClassification[classification])}
                     </label>
                   ))}
                 </div>
@@ -1,4 +1,4 @@
-import React from 'react';
+import React, { useState, useEffect } from 'react';
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '../../components/ui/card';
 import { Button } from '../../components/ui/button';
 import { Badge } from '../../components/ui/badge';
@@ -7,11 +7,44 @@ import {
   CheckCircle, 
   Clock, 
   FileText, 
-  TrendingUp,
   Activity
 } from 'lucide-react';
 
+const API_PROTOCOL = process.env.REACT_APP_API_PROTOCOL;
+const MAIN_HOST = process.env.REACT_APP_MAIN_HOST;
+const MAIN_PORT = process.env.REACT_APP_MAIN_PORT;
+
+// Counters maintained by the backend, so the dashboard never loads the regulations themselves
+interface DashboardStats {
+  regulations: number;
+  versions: number;
+  changes: number;
+  byStatus: Record<string, number>;
+  byClassification: Record<string, number>;
+  byType: Record<string, number>;
+}
+
 export function Dashboard() {
+  const [stats, setStats] = useState<DashboardStats | null>(null);
+
+  useEffect(() => {
+    const fetchStats = async () => {
+      try {
+        const response = await fetch(`${API_PROTOCOL}://${MAIN_HOST}:${MAIN_PORT}/stats`);
+        if (!response.ok) {
+          throw new Error(`Failed to fetch stats: ${response.statusText}`);
+        }
+        setStats(await response.json());
+      } catch (err) {
+        console.error('Error fetching stats:', err);
+      }
+    };
+
+    fetchStats();
+  }, []);
+
+  const count = (value?: number) => (stats ? (value ?? 0).toLocaleString() : '–');
+
   const recentChanges = [
     {
       id: 1,
@@ -41,28 +74,24 @@ export function Dashboard() {
 
   const systemMetrics = [
     {
-      title: 'Documents Monitored',
-      value: '1,247',
-      change: '+12%',
-      trend: 'up'
+      title: 'Regulations Monitored',
+      value: count(stats?.regulations),
+      detail: `${count(stats?.versions)} versions`
     },
     {
       title: 'Changes Detected',
-      value: '23',
-      change: '+5%',
-      trend: 'up'
+      value: count(stats?.changes),
+      detail: `${count(stats?.byStatus['relevant'])} relevant`
     },
     {
-      title: 'Analysis Pending',
-      value: '3',
-      change: '-2%',
-      trend: 'down'
+      title: 'Pending Review',
+      value: count(stats?.byStatus['pending']),
+      detail: 'changes not reviewed yet'
     },
     {
-      title: 'System Health',
-      value: '98.5%',
-      change: '+0.5%',
-      trend: 'up'
+      title: 'Not Relevant',
+      value: count(stats?.byStatus['not-relevant']),
+      detail: 'changes dismissed'
     }
   ];
 
@@ -117,17 +146,7 @@ export function Dashboard() {
               <CardTitle className="text-2xl">{metric.value}</CardTitle>
             </CardHeader>
             <CardContent>
-              <div className="flex items-center space-x-2 text-sm">
-                <TrendingUp className={`h-4 w-4 ${
-                  metric.trend === 'up' ? 'text-green-600' : 'text-red-600'
-                }`} />
-                <span className={
-                  metric.trend === 'up' ? 'text-green-600' : 'text-red-600'
-                }>
-                  {metric.change}
-                </span>
-                <span className="text-gray-500">from last week</span>
-              </div>
+              <div className="text-sm text-gray-500">{metric.detail}</div>
             </CardContent>
           </Card>
         ))}